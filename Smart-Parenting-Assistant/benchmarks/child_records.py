@@ -0,0 +1,88 @@
+"""
+Document size and read cost of legacy per-field CBC child documents vs the
+sealed AES-GCM (v2) record format.
+
+Run from the project root (AES_KEY must be set, e.g. via .env):
+    python -m benchmarks.child_records [--repeat 20]
+"""
+import os
+import time
+import base64
+import argparse
+import bson
+from bson import ObjectId
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+from lib.encryption_utils import key
+from lib.child_records import CHILD_FIELDS, seal_child, open_children
+
+
+def children(n):
+    return [
+        {
+            "name": f"Child {i}",
+            "date_of_birth": "2021-03-14",
+            "gender": "Female" if i % 2 else "Male",
+            "allergies": "peanuts, lactose" if i % 3 else "none",
+            "weight": 12.5 + i % 7,
+            "height": 2.8,
+            "parentId": f"parent{i // 3}@example.com",
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_encrypt(plain_text: str) -> str:
+    # The v1 format is no longer written by the app
+    iv = os.urandom(16)
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    return base64.b64encode(iv + cipher.encrypt(pad(plain_text.encode(), AES.block_size))).decode()
+
+
+def legacy_documents(records):
+    return [{"_id": ObjectId(), **record, **{field: legacy_encrypt(str(record[field])) for field in CHILD_FIELDS}}
+            for record in records]
+
+
+def sealed_documents(records):
+    documents = []
+    for record in records:
+        child_id = ObjectId()
+        documents.append({"_id": child_id, **seal_child(child_id, record["parentId"], record)})
+    return documents
+
+
+def timed(fn, repeat):
+    fn()  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    sample = children(1000)
+    legacy_size = sum(len(bson.encode(doc)) for doc in legacy_documents(sample)) / len(sample)
+    sealed_size = sum(len(bson.encode(doc)) for doc in sealed_documents(sample)) / len(sample)
+    print(f"Mean BSON size per child: legacy {legacy_size:.0f} B, sealed {sealed_size:.0f} B "
+          f"({(1 - sealed_size / legacy_size) * 100:.0f}% smaller)")
+
+    print(f"\n{'children':>8} {'legacy':>10} {'sealed':>10}   (us per child)")
+    for n in (1, 100, 10000):
+        records = children(n)
+        legacy = legacy_documents(records)
+        sealed = sealed_documents(records)
+        repeat = max(3, args.repeat * 1000 // n)
+
+        timings = [
+            timed(lambda: open_children(legacy), repeat),
+            timed(lambda: open_children(sealed), repeat),
+        ]
+        print(f"{n:>8} " + " ".join(f"{t / n * 1e6:>10.1f}" for t in timings))
+
+if __name__ == "__main__":
+    main()
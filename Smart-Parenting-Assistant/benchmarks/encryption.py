@@ -0,0 +1,57 @@
+"""
+Records per second for reading legacy (v1) per-field encrypted children: one
+AES object per field (the previous decrypt_field) vs the bulk record API,
+which decrypts a whole batch with one cipher.
+
+Only decryption is measured; new child records are written sealed by
+lib.child_records, so the v1 format is no longer encrypted by the app.
+
+Run from the project root (AES_KEY must be set, e.g. via .env):
+    python -m benchmarks.encryption [--repeat 20]
+"""
+import time
+import base64
+import argparse
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+from lib.encryption_utils import key, decrypt_records, decrypt_metrics
+from lib.child_records import CHILD_FIELDS
+from benchmarks.child_records import children, legacy_documents
+
+
+def per_field_decrypt(enc_text: str) -> str:
+    raw = base64.b64decode(enc_text)
+    cipher = AES.new(key, AES.MODE_CBC, raw[:16])
+    return unpad(cipher.decrypt(raw[16:]), AES.block_size).decode()
+
+
+def timed(fn, repeat):
+    fn()  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'children':>8} {'per field':>14} {'bulk':>14} {'speedup':>8}")
+    for n in (1, 100, 10000):
+        encrypted = legacy_documents(children(n))
+        repeat = max(3, args.repeat * 1000 // n)
+
+        def old_decrypt():
+            return [{**r, **{f: per_field_decrypt(r[f]) for f in CHILD_FIELDS}} for r in encrypted]
+
+        base = n / timed(old_decrypt, repeat)
+        fast = n / timed(lambda: decrypt_records(encrypted, CHILD_FIELDS), repeat)
+        print(f"{n:>8} {base:>10.0f} r/s {fast:>10.0f} r/s {fast / base:>7.1f}x")
+
+    print(f"Plaintext fallbacks: {decrypt_metrics()['plaintext_fallbacks']}")
+
+
+if __name__ == "__main__":
+    main()
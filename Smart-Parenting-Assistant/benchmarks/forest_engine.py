@@ -0,0 +1,73 @@
+"""
+Compare the sklearn/pandas prediction path against lib.forest_engine.FlatForest.
+
+Run from the project root:
+    python -m benchmarks.forest_engine [--model path/to/model.pkl]
+"""
+import time
+import pickle
+import argparse
+import numpy as np
+import pandas as pd
+from lib.forest_engine import FlatForest
+from lib.model_registry import FEATURE_COLUMNS, resolve_artifacts
+
+
+def random_rows(n, feature_order, seed=0):
+    rng = np.random.default_rng(seed)
+    male = rng.integers(0, 2, n)
+    columns = {
+        "Age (months)": rng.integers(0, 121, n).astype(np.float64),
+        "Height (cm)": rng.uniform(30, 150, n),
+        "Gender_female": (1 - male).astype(np.float64),
+        "Gender_male": male.astype(np.float64),
+    }
+    return np.column_stack([columns[name] for name in feature_order])
+
+
+def timed(fn, repeat):
+    fn()  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=resolve_artifacts().model_path)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+    feature_order = [str(c) for c in getattr(model, "feature_names_in_", FEATURE_COLUMNS)]
+
+    started = time.perf_counter()
+    engine = FlatForest.from_sklearn(model)
+    print(f"Flattened {engine.n_trees} trees / {len(engine.feature)} nodes in "
+          f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+    check = random_rows(10000, feature_order, seed=1)
+    expected = model.predict(pd.DataFrame(check, columns=feature_order))
+    mismatches = int(np.sum(engine.predict(check) != expected))
+    print(f"Disagreements with sklearn on {len(check)} rows: {mismatches}")
+
+    print(f"{'rows':>7} {'sklearn+pandas':>16} {'flat engine':>14} {'speedup':>8}")
+    for n in (1, 10, 100, 1000, 10000):
+        rows = random_rows(n, feature_order)
+        repeat = max(1, args.repeat // max(1, n // 100))
+
+        def sklearn_path():
+            return model.predict(pd.DataFrame(rows, columns=feature_order))
+
+        def engine_path():
+            return engine.predict(rows)
+
+        base = timed(sklearn_path, repeat)
+        fast = timed(engine_path, repeat)
+        print(f"{n:>7} {base * 1000:>13.3f} ms {fast * 1000:>11.3f} ms {base / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
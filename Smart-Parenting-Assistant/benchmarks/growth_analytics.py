@@ -0,0 +1,100 @@
+"""
+Time the vectorized WHO growth analytics against a per-measurement Python loop.
+
+Covers single children with long histories and batches of children scored in
+one pass, both for the bare NumPy computation (lib.growth_standards.analyze)
+and for the endpoint path that turns growth documents into response points.
+
+Run from the project root:
+    python -m benchmarks.growth_analytics [--repeat 20]
+"""
+import math
+import time
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+from lib.growth_standards import LMS_TABLE, INDICATORS, DAYS_PER_MONTH, analyze
+from lib.DL.growthMonitor import growth_analytics
+
+
+def synthetic_history(children, points, seed=0):
+    rng = np.random.default_rng(seed)
+    n = children * points
+    groups = np.repeat(np.arange(children), points)
+    sex = np.repeat(rng.integers(0, 2, children), points)
+    # Sorted measurement days within each child, spread over the first ten years
+    age_days = np.sort(rng.uniform(0, 3650, (children, points)), axis=1).ravel()
+    weight = np.maximum(3.3 + age_days / 3650 * 28 + rng.normal(0, 1, n), 1.0)
+    height = 50 + age_days / 3650 * 88 + rng.normal(0, 2, n)
+    return groups, sex, age_days, weight, height
+
+
+def as_documents(groups, sex, age_days, weight, height):
+    born = datetime(2015, 1, 1)
+    references = {str(g): (born, int(s)) for g, s in zip(groups, sex)}
+    documents = [
+        {"_id": i, "child_id": str(g), "date": born + timedelta(days=float(d)), "weight": float(w), "height": float(h) / 30.48}
+        for i, (g, d, w, h) in enumerate(zip(groups, age_days, weight, height))
+    ]
+    return references, documents
+
+
+def loop_zscore(indicator, sex, age_months, value):
+    if not 0 <= age_months <= 120:
+        return None
+    table = LMS_TABLE[INDICATORS.index(indicator)][sex]
+    lower = min(int(age_months), 119)
+    frac = age_months - lower
+    L, M, S = (table[lower] * (1 - frac) + table[lower + 1] * frac).tolist()
+    return ((value / M) ** L - 1) / (L * S)
+
+
+def loop_analyze(groups, sex, age_days, weight, height):
+    """The same arithmetic one measurement at a time (no tail restriction)."""
+    rows = []
+    previous = None
+    for g, s, d, w, h in zip(groups.tolist(), sex.tolist(), age_days.tolist(), weight.tolist(), height.tolist()):
+        months = d / DAYS_PER_MONTH
+        bmi = w / (h / 100) ** 2
+        row = {}
+        for indicator, value in (("weight", w), ("height", h), ("bmi", bmi)):
+            z = loop_zscore(indicator, s, months, value)
+            row[indicator] = z
+            row[indicator + "_percentile"] = None if z is None else 50 * (1 + math.erf(z / math.sqrt(2)))
+        if previous and previous[0] == g and d > previous[1]:
+            row["weight_velocity"] = (w - previous[2]) / (d - previous[1]) * DAYS_PER_MONTH
+            row["height_velocity"] = (h - previous[3]) / (d - previous[1]) * DAYS_PER_MONTH
+        previous = (g, d, w, h)
+        rows.append(row)
+    return rows
+
+
+def timed(fn, repeat):
+    fn()  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = [(1, 100), (1, 1000), (1, 10000), (1, 100000), (100, 50), (1000, 50), (100, 1000)]
+    print(f"{'children':>8} {'points':>8} {'python loop':>13} {'vectorized':>12} {'speedup':>8} {'endpoint path':>14}")
+    for children, points in cases:
+        history = synthetic_history(children, points)
+        references, documents = as_documents(*history)
+        repeat = max(1, args.repeat * 1000 // (children * points))
+
+        base = timed(lambda: loop_analyze(*history), repeat)
+        fast = timed(lambda: analyze(*history), repeat)
+        endpoint = timed(lambda: growth_analytics(references, documents), repeat)
+        print(f"{children:>8} {points:>8} {base * 1000:>10.2f} ms {fast * 1000:>9.2f} ms "
+              f"{base / fast:>7.1f}x {endpoint * 1000:>11.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-request cost of the current_user auth dependency with and without the
+claims cache.
+
+Issues --tokens tokens and authenticates --requests requests carrying them
+(uniformly at random, as when that many users are active) through
+lib.auth.current_user against a MongoDB server, so a cache miss pays the
+revoked_tokens lookup as well as the JWT verification. "uncached" runs the
+same dependency with a cache that keeps nothing; verify_token alone is shown
+for reference. Reports microseconds per request:
+
+    python -m benchmarks.jwt_verify --mongo-uri mongodb://localhost:27017/ --tokens 1000 --requests 20000
+"""
+import time
+import random
+import asyncio
+import argparse
+from starlette.requests import Request
+from lib.database import create_client
+from lib.jwt_utils import create_access_token, verify_token
+from lib.auth import TokenCache
+import lib.auth as auth
+
+
+def bearer_request(token: str) -> Request:
+    return Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+
+async def measure(db, requests, picks):
+    started = time.perf_counter()
+    for i in picks:
+        await auth.current_user(requests[i], db)
+    return (time.perf_counter() - started) / len(picks) * 1e6
+
+
+async def run(args):
+    tokens = [create_access_token({"email": f"bench{i}@example.com"}) for i in range(args.tokens)]
+    requests = [bearer_request(token) for token in tokens]
+    rng = random.Random(args.seed)
+    picks = [rng.randrange(args.tokens) for _ in range(args.requests)]
+
+    client = create_client(args.mongo_uri)
+    try:
+        db = client[args.db]
+        await db[auth.REVOKED_COLLECTION].find_one({})  # Connect before timing
+
+        auth.token_cache = TokenCache(max_entries=0)
+        uncached = await measure(db, requests, picks)
+        auth.token_cache = TokenCache(max_entries=args.cache_size)
+        cached = await measure(db, requests, picks)
+    finally:
+        client.close()
+
+    started = time.perf_counter()
+    for i in picks:
+        verify_token(tokens[i])
+    verify_only = (time.perf_counter() - started) / len(picks) * 1e6
+
+    print(f"{'path':<24} {'us/request':>10}")
+    print(f"{'current_user, uncached':<24} {uncached:>10.2f}")
+    print(f"{'current_user, cached':<24} {cached:>10.2f}")
+    print(f"{'  verify_token alone':<24} {verify_only:>10.2f}")
+    print(f"speedup {uncached / cached:.1f}x, cache {auth.token_cache.metrics()}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-uri", default=None, help="Defaults to MONGO_URI")
+    parser.add_argument("--db", default="jwt_bench")
+    parser.add_argument("--tokens", type=int, default=1000, help="Distinct active tokens")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--cache-size", type=int, default=auth.MAX_ENTRIES)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
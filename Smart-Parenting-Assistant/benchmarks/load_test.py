@@ -0,0 +1,79 @@
+"""
+Throughput and latency of a running API under concurrent requests.
+
+Keeps --concurrency requests in flight against one endpoint until --requests
+have completed, then reports requests/s and latency percentiles. Run it against
+the server before and after a change with the same data set and settings, e.g.
+one worker and a child with a few hundred growth points:
+
+    uvicorn lib.DL.server:app --port 8000 --workers 1
+    python -m benchmarks.load_test --url http://localhost:8000 \
+        --path "/growth/getGrowthData/<child_id>" --concurrency 50 --requests 2000
+
+Authenticated routes need --header "Authorization: Bearer <token>". With the
+HTTPS setup from the README add --insecure for the self-signed certificate.
+"""
+import time
+import asyncio
+import argparse
+import statistics
+import httpx
+
+
+async def worker(client, path, remaining, latencies, statuses):
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args):
+    headers = dict(h.split(":", 1) for h in args.header)
+    headers = {k.strip(): v.strip() for k, v in headers.items()}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits,
+                                 verify=not args.insecure, timeout=args.timeout) as client:
+        # Warm up connections and server-side caches
+        await asyncio.gather(*(client.get(args.path) for _ in range(min(args.concurrency, 20))))
+
+        remaining, latencies, statuses = [args.requests], [], {}
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, args.path, remaining, latencies, statuses) for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.requests} requests to {args.path} at concurrency {args.concurrency}: {elapsed:.2f} s")
+    print(f"Throughput: {args.requests / elapsed:.1f} req/s")
+    if latencies:
+        print(f"Latency ms: mean {statistics.mean(latencies) * 1e3:.1f}, "
+              f"p50 {percentile(latencies, 0.50) * 1e3:.1f}, p95 {percentile(latencies, 0.95) * 1e3:.1f}, "
+              f"p99 {percentile(latencies, 0.99) * 1e3:.1f}, max {max(latencies) * 1e3:.1f}")
+    print("Responses: " + ", ".join(f"{k}: {v}" for k, v in sorted(statuses.items(), key=str)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--header", action="append", default=[], help='e.g. "Authorization: Bearer <token>"')
+    parser.add_argument("--insecure", action="store_true", help="Skip TLS certificate verification")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Event-loop stall and throughput during a burst of password checks.
+
+Runs --logins concurrent bcrypt verifications the way the login handler used
+to (inline in the coroutine) and through lib.passwords, while a heartbeat task
+ticks every 10 ms as other routes on the worker would. Reports the burst's
+wall time and the heartbeat's worst delay, plus how many checks were turned
+away with 503 once PASSWORD_HASH_MAX_PENDING was reached:
+
+    python -m benchmarks.login_burst --logins 50 --rounds 12
+"""
+import time
+import asyncio
+import argparse
+import bcrypt
+from lib.passwords import PasswordHasher, HasherBusy, HASH_WORKERS, MAX_PENDING
+
+TICK = 0.01
+
+
+async def heartbeat(delays, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        delays.append(time.perf_counter() - started - TICK)
+
+
+async def burst(check, logins):
+    delays, stop = [], asyncio.Event()
+    beat = asyncio.create_task(heartbeat(delays, stop))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(check() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    return elapsed, max(delays, default=0.0), results
+
+
+async def run(args):
+    password = "correct horse battery staple"
+    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(args.rounds)).decode()
+
+    async def inline():
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+
+    hasher = PasswordHasher(rounds=args.rounds, workers=args.workers, max_pending=args.max_pending)
+
+    async def pooled():
+        try:
+            return await hasher.verify(password, hashed)
+        except HasherBusy:
+            return "503"
+
+    print(f"{'mode':<8} {'logins':>6} {'wall s':>8} {'max loop stall ms':>18} {'503s':>5}")
+    for name, check in (("inline", inline), ("pool", pooled)):
+        elapsed, stall, results = await burst(check, args.logins)
+        print(f"{name:<8} {args.logins:>6} {elapsed:>8.2f} {stall * 1e3:>18.1f} {results.count('503'):>5}")
+    print(hasher.metrics())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
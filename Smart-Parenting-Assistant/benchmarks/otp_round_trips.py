@@ -0,0 +1,87 @@
+"""
+Database round trips per step of the signup and login OTP flows.
+
+Runs each step's handler against a MongoDB server with a command listener on
+the client and prints the commands it sent. Emails are captured instead of
+sent, and bcrypt runs at its lowest cost so the run is quick. Uses (and
+cleans up) one throwaway user:
+
+    python -m benchmarks.otp_round_trips --mongo-uri mongodb://localhost:27017/ --db otp_bench
+"""
+import re
+import uuid
+import asyncio
+import argparse
+from collections import Counter
+from pymongo import monitoring
+from lib.database import create_client
+from lib.passwords import hasher
+import lib.DL.registration as registration
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class CapturedMail:
+    """Stands in for the mail queue: keeps the last code sent to each address."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def enqueue(self, message, on_status=None):
+        self.codes[message["To"]] = re.search(r"code is: (\d+)", message.get_payload()).group(1)
+
+
+async def run(args):
+    counter = CommandCounter()
+    client = create_client(args.mongo_uri, event_listeners=[counter])
+    db = client[args.db]
+    mail = CapturedMail()
+    registration.mail_queue = mail
+    hasher.rounds = 4
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    user = registration.User(email=email, password="bench-password")
+
+    steps = [
+        ("signup", lambda: registration.signup_request(user, db)),
+        ("resend-otp", lambda: registration.resend_otp(registration.OTPResend(email=email), db)),
+        ("signup-verify", lambda: registration.signup_verify(
+            registration.OTPVerification(email=email, otp=mail.codes[email]), db)),
+        ("login", lambda: registration.login_request(user, db)),
+        ("verify-otp", lambda: registration.login_verify(
+            registration.OTPVerification(email=email, otp=mail.codes[email]), db)),
+    ]
+    try:
+        await db.otp_verifications.find_one({})  # Connect before counting
+        print(f"{'step':<14} {'round trips':>11}  commands")
+        for name, step in steps:
+            counter.commands.clear()
+            await step()
+            commands = ", ".join(f"{command} x{count}" for command, count in counter.commands.items())
+            print(f"{name:<14} {sum(counter.commands.values()):>11}  {commands}")
+    finally:
+        await db.users.delete_many({"email": email})
+        await db.otp_verifications.delete_many({"_id": email})
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-uri", default=None, help="Defaults to MONGO_URI")
+    parser.add_argument("--db", default="otp_bench")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Per-worker RSS/PSS of the growth model: private unpickled copies vs shared mmap.
+
+Starts N worker processes that stay alive together (as uvicorn workers would)
+and reports memory from /proc/<pid>/smaps_rollup (Linux only) before and after
+each one loads the model. PSS splits shared pages between the processes that
+map them, so it shows what each worker really costs.
+
+Run from the project root against a bundle written by growthEvaluatorModel.py:
+    python -m benchmarks.worker_memory --workers 4 [--bundle lib/Model/bundles/<version>]
+"""
+import os
+import pickle
+import argparse
+import multiprocessing as mp
+import numpy as np
+from lib.forest_engine import FlatForest, ARRAY_NAMES
+from lib.model_registry import resolve_artifacts
+
+
+def memory_kb() -> dict:
+    usage = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                usage[parts[0][:-1].lower()] = int(parts[1])
+    return usage
+
+
+def worker(mode, bundle_dir, loaded_barrier, measured_barrier, results):
+    before = memory_kb()
+    if mode == "pickle":
+        # What every worker did before: its own unpickled forest plus a private engine copy
+        with open(os.path.join(bundle_dir, "model.pkl"), "rb") as f:
+            model = pickle.load(f)
+        engine = FlatForest.from_sklearn(model)
+    else:
+        engine = FlatForest.load(os.path.join(bundle_dir, "forest"), mmap_mode="r")
+        model = None
+
+    # Fault every page in, as a long-running worker eventually would
+    for name in ARRAY_NAMES:
+        np.asarray(getattr(engine, name)).sum()
+    engine.predict(np.zeros((16, 4)))
+
+    loaded_barrier.wait()
+    after = memory_kb()
+    results.put((os.getpid(), before, after))
+    # Stay mapped until every worker has measured, so sharing is visible in PSS
+    measured_barrier.wait()
+    del model
+
+
+def run(mode, bundle_dir, workers):
+    ctx = mp.get_context("spawn")
+    loaded_barrier = ctx.Barrier(workers)
+    measured_barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(mode, bundle_dir, loaded_barrier, measured_barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--bundle", default=None, help="Bundle directory (defaults to the active one)")
+    args = parser.parse_args()
+
+    bundle_dir = args.bundle
+    if bundle_dir is None:
+        artifacts = resolve_artifacts()
+        if artifacts.bundle is None:
+            parser.error("No active bundle; train one with python -m lib.DL.growthEvaluatorModel")
+        bundle_dir = os.path.dirname(artifacts.model_path)
+
+    for mode in ("pickle", "mmap"):
+        rows = run(mode, bundle_dir, args.workers)
+        print(f"\n{mode}: {args.workers} workers")
+        print(f"{'pid':>8} {'rss before':>11} {'pss before':>11} {'rss after':>10} {'pss after':>10} {'pss delta':>10}")
+        total_delta = 0
+        for pid, before, after in rows:
+            delta = after["pss"] - before["pss"]
+            total_delta += delta
+            print(f"{pid:>8} {before['rss']:>8} kB {before['pss']:>8} kB {after['rss']:>7} kB "
+                  f"{after['pss']:>7} kB {delta:>7} kB")
+        print(f"Total PSS added by the model across workers: {total_delta} kB")
+
+
+if __name__ == "__main__":
+    main()
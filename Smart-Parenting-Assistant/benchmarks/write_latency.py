@@ -0,0 +1,92 @@
+"""
+p50/p99 latency of the child and growth write endpoints of a running API.
+
+Creates --children children under a throwaway parent id, then updates each of
+them and adds growth measurements, and reports latency percentiles per
+endpoint. The children and their growth data are deleted at the end. Run it
+against the server with a local mongod before and after a change, e.g. with
+MONGO_TRANSACTIONS or MONGO_WRITE_CONCERN_* set differently:
+
+    python -m benchmarks.write_latency --url http://localhost:8000 --children 200 --concurrency 10
+"""
+import time
+import uuid
+import asyncio
+import argparse
+import httpx
+
+
+def child_body(parent_id, i, weight=12.5):
+    return {
+        "name": f"Bench {i}", "date_of_birth": "2021-03-14", "gender": "Female" if i % 2 else "Male",
+        "allergies": "none", "weight": weight, "height": 2.8, "parentId": parent_id,
+    }
+
+
+async def timed(latencies, endpoint, request):
+    started = time.perf_counter()
+    response = await request
+    latencies.setdefault(endpoint, []).append(time.perf_counter() - started)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{endpoint} returned {response.status_code}: {response.text}")
+    return response
+
+
+async def bounded(semaphore, coroutine):
+    async with semaphore:
+        return await coroutine
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args):
+    parent_id = f"bench-{uuid.uuid4().hex[:8]}"
+    latencies = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, verify=not args.insecure, timeout=30.0) as client:
+        await asyncio.gather(*(
+            bounded(semaphore, timed(latencies, "POST /children/", client.post("/children/", json=child_body(parent_id, i))))
+            for i in range(args.children)
+        ))
+        ids = [(child["id"], i) for i, child in
+               enumerate((await client.get("/children/", params={"parentId": parent_id})).json())]
+        try:
+            await asyncio.gather(*(
+                bounded(semaphore, timed(latencies, "PUT /children/{id}", client.put(
+                    f"/children/{child_id}", json=child_body(parent_id, i, weight=13.0 + round))))
+                for round in range(args.rounds) for child_id, i in ids
+            ))
+            await asyncio.gather(*(
+                bounded(semaphore, timed(latencies, "POST /growth/add", client.post("/growth/add", json={
+                    "child_id": child_id, "date": f"2024-{round % 12 + 1:02d}-15T00:00:00",
+                    "weight": 13.0 + round / 10, "height": 2.9,
+                })))
+                for round in range(args.rounds) for child_id, _ in ids
+            ))
+        finally:
+            await asyncio.gather(*(
+                bounded(semaphore, timed(latencies, "DELETE /children/{id}", client.delete(f"/children/{child_id}")))
+                for child_id, _ in ids
+            ))
+
+    print(f"{'endpoint':<24} {'requests':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint, values in latencies.items():
+        print(f"{endpoint:<24} {len(values):>8} {percentile(values, 0.5) * 1e3:>8.1f} "
+              f"{percentile(values, 0.99) * 1e3:>8.1f} {max(values) * 1e3:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--children", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3, help="Updates and measurements per child")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--insecure", action="store_true", help="Skip TLS certificate verification")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
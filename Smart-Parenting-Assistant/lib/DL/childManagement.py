@@ -1,13 +1,22 @@
 import os
 import logging
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
 from pydantic import BaseModel, Field
-from pymongo import MongoClient
 from bson import ObjectId
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from fastapi.responses import JSONResponse
-from lib.encryption_utils import encrypt_field, decrypt_field
+from lib.child_records import (
+    WRITE_ATTEMPTS as CHILD_WRITE_ATTEMPTS, StaleChildRecord, seal_child, open_child, reseal_child,
+)
+from lib.child_cache import child_cache, load_child, load_children
+from lib.blind_index import search_filter
+from lib.encryption_utils import decrypt_metrics
+from lib.growth_rollups import (
+    ROLLUP_COLLECTION, record_measurement, refresh_month, delete_rollups, measurement_rollup,
+)
+from lib.bulk_import import detect_format, insert_chunk, run_import
+from lib.database import get_database, apply_writes
 
 # ------------------ Logging Setup ------------------
 
@@ -26,13 +35,9 @@ if not logger.handlers:
     file_handler.setFormatter(formatter)
     logger.addHandler(file_handler)
 
-# ------------------ FastAPI and DB Setup ------------------
-
-client = MongoClient("mongodb://localhost:27017/")
-db = client.smart_parenting
-children_collection = db.children
-growth_collection = db.growth_data
+# ------------------ FastAPI Setup ------------------
 
+# Handlers receive the database through get_database; the client lives in the app lifespan
 router = APIRouter()
 
 # ------------------ Pydantic Model ------------------
@@ -48,44 +53,47 @@ class ChildModel(BaseModel):
 
 # ------------------ Serializer ------------------
 
-def child_serializer(child) -> dict:
+def child_serializer(child, decrypted=None) -> dict:
+    # Accepts both sealed (v2) and legacy per-field encrypted documents
+    decrypted = decrypted or open_child(child)
     return {
         "id": str(child["_id"]),
-        "name": decrypt_field(child["name"]),
-        "date_of_birth": decrypt_field(child["date_of_birth"]),
-        "gender": decrypt_field(child["gender"]),
-        "allergies": decrypt_field(child["allergies"]),
-        "weight": float(decrypt_field(child["weight"])),
-        "height": float(decrypt_field(child["height"])),
+        "name": decrypted["name"],
+        "date_of_birth": decrypted["date_of_birth"],
+        "gender": decrypted["gender"],
+        "allergies": decrypted["allergies"],
+        "weight": float(decrypted["weight"]),
+        "height": float(decrypted["height"]),
         "parentId": child["parentId"]
     }
 
 # ------------------ Routes ------------------
 
 @router.post("/", response_model=dict)
-async def add_child(child: ChildModel):
+async def add_child(child: ChildModel, db=Depends(get_database)):
     try:
-        encrypted_data = {
-            "name": encrypt_field(child.name),
-            "date_of_birth": encrypt_field(child.date_of_birth),
-            "gender": encrypt_field(child.gender),
-            "allergies": encrypt_field(child.allergies),
-            "weight": encrypt_field(str(child.weight)),
-            "height": encrypt_field(str(child.height)),
-            "parentId": child.parentId
+        # The id is bound into the envelope, so it is assigned before the insert
+        child_id = ObjectId()
+        encrypted_data = {"_id": child_id, **seal_child(child_id, child.parentId, child.dict()), "ver": 1}
+
+        growth_data = {
+            "child_id": str(child_id),
+            "date": datetime.utcnow(),
+            "weight": child.weight,
+            "height": child.height,
+            "milestone": "Initial Data"
         }
 
-        result = children_collection.insert_one(encrypted_data)
+        # The child, its first measurement and that month's rollup are written together
+        result, _, _ = await apply_writes(
+            db,
+            lambda session: db.children.insert_one(encrypted_data, session=session),
+            lambda session: db.growth_data.insert_one(growth_data, session=session),
+            lambda session: record_measurement(db[ROLLUP_COLLECTION], growth_data["child_id"], growth_data["date"],
+                                               child.weight, child.height, session=session),
+        )
 
         if result.acknowledged:
-            growth_data = {
-                "child_id": str(result.inserted_id),
-                "date": datetime.utcnow(),
-                "weight": child.weight,
-                "height": child.height,
-                "milestone": "Initial Data"
-            }
-            growth_collection.insert_one(growth_data)
             logger.info(f"Parent {child.parentId} added new child: {child.name}")
             return JSONResponse({"message": "Child added successfully"}, status_code=201)
         else:
@@ -94,68 +102,150 @@ async def add_child(child: ChildModel):
         logger.error(f"Error adding child for parent {child.parentId}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def write_children(db, rows) -> tuple:
+    """Seal and insert one chunk of imported children with their initial measurement and rollup."""
+    now = datetime.utcnow()
+    documents = []
+    for _, child in rows:
+        child_id = ObjectId()
+        documents.append({"_id": child_id, **seal_child(child_id, child.parentId, child.dict()), "ver": 1})
+
+    inserted, failures = await insert_chunk(db.children, documents, [row for row, _ in rows])
+    if inserted:
+        growth_data = [{
+            "child_id": str(documents[i]["_id"]),
+            "date": now,
+            "weight": rows[i][1].weight,
+            "height": rows[i][1].height,
+            "milestone": "Initial Data",
+        } for i in inserted]
+        # New children, so every rollup is a fresh month
+        rollups = [measurement_rollup(g["child_id"], g["date"], g["weight"], g["height"]) for g in growth_data]
+        await apply_writes(
+            db,
+            lambda session: db.growth_data.insert_many(growth_data, ordered=False, session=session),
+            lambda session: db[ROLLUP_COLLECTION].insert_many(rollups, ordered=False, session=session),
+        )
+    return len(inserted), failures
+
+@router.post("/import", response_model=dict)
+async def import_children(
+    request: Request,
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+    db=Depends(get_database),
+):
+    # Body is NDJSON or CSV (by ?format= or Content-Type), one ChildModel per row
+    fmt = detect_format(request.headers.get("content-type"), file_format)
+    report = await run_import(request.stream(), fmt, ChildModel, lambda rows: write_children(db, rows))
+    logger.info(f"Imported {report['imported']} children from {fmt} ({report['failed']} rows rejected)")
+    return {"message": "Import finished", **report}
+
 @router.get("/", response_model=List[dict])
-async def get_children_by_parent(parentId: str):
-    children = children_collection.find({"parentId": parentId})
-    children_list = [child_serializer(child) for child in children]
+async def get_children_by_parent(
+    parentId: str,
+    name: Optional[str] = Query(None, min_length=1, max_length=50),
+    date_of_birth: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    gender: Optional[str] = Query(None, pattern=r"^(?i:male|female|other)$"),
+    db=Depends(get_database),
+):
+    # Exact (normalized) matches through the blind indexes; no document is decrypted to filter
+    query = {"parentId": parentId, **search_filter(name=name, date_of_birth=date_of_birth, gender=gender)}
+    searching = len(query) > 1
+    children = await load_children(db.children, query, child_cache)
+    children_list = [child_serializer(child, decrypted) for child, decrypted in children]
     if not children_list:
-        logger.info(f"No children found for parent {parentId}")
-        raise HTTPException(status_code=404, detail="No children found for this parent")
+        logger.info(f"No children found for parent {parentId}" + (" matching the search" if searching else ""))
+        detail = "No matching children found" if searching else "No children found for this parent"
+        raise HTTPException(status_code=404, detail=detail)
     logger.info(f"Fetched children for parent {parentId}")
     return children_list
 
+@router.get("/cache/metrics", response_model=dict)
+async def get_child_cache_metrics():
+    # Legacy per-field values are decrypted on cache misses; fallbacks mean unreadable ciphertext
+    return {**child_cache.metrics(), "legacy_fields": decrypt_metrics()}
+
 @router.get("/{child_id}", response_model=dict)
-async def get_child_by_id(child_id: str):
-    child = children_collection.find_one({"_id": ObjectId(child_id)})
+async def get_child_by_id(child_id: str, db=Depends(get_database)):
+    child, decrypted = await load_child(db.children, ObjectId(child_id), child_cache)
     if not child:
         raise HTTPException(status_code=404, detail="Child not found")
-    return child_serializer(child)
+    return child_serializer(child, decrypted)
 
 @router.put("/{child_id}", response_model=dict)
-async def update_child(child_id: str, updated_child: ChildModel):
+async def update_child(child_id: str, updated_child: ChildModel, db=Depends(get_database)):
     try:
-        existing = children_collection.find_one({"_id": ObjectId(child_id)})
-        if not existing:
-            raise HTTPException(status_code=404, detail="Child not found")
-
-        old_data = child_serializer(existing)
-
-        updated_fields = {}
-        changes = []
-
-        for field in updated_child.dict():
-            old_value = old_data.get(field)
-            new_value = getattr(updated_child, field)
-            if str(old_value) != str(new_value):
-                updated_fields[field] = encrypt_field(str(new_value)) if field not in ["parentId"] else new_value
-                changes.append(f"{field} changed from '{old_value}' to '{new_value}'")
-
-        if not updated_fields:
-            logger.info(f"No changes detected for child {child_id} by parent {updated_child.parentId}")
-            return {"message": "No updates made (data identical)"}
-
-        children_collection.update_one({"_id": ObjectId(child_id)}, {"$set": updated_fields})
+        for attempt in range(CHILD_WRITE_ATTEMPTS):
+            existing, decrypted = await load_child(db.children, ObjectId(child_id), child_cache)
+            if not existing:
+                raise HTTPException(status_code=404, detail="Child not found")
+
+            old_data = child_serializer(existing, decrypted)
+
+            updated_fields = {}
+            changes = []
+
+            for field in updated_child.dict():
+                old_value = old_data.get(field)
+                new_value = getattr(updated_child, field)
+                if str(old_value) != str(new_value):
+                    updated_fields[field] = new_value
+                    changes.append(f"{field} changed from '{old_value}' to '{new_value}'")
+
+            if not updated_fields:
+                logger.info(f"No changes detected for child {child_id} by parent {updated_child.parentId}")
+                return {"message": "No updates made (data identical)"}
+
+            # Reseal the whole record, only over the version compared above; a legacy
+            # document is migrated to the envelope on the way
+            writes = [lambda session: reseal_child(db.children, existing, updated_child.parentId, updated_child.dict(),
+                                                   session=session)]
+            # The latest measurement mirrors the profile's weight and height
+            measurements_changed = "weight" in updated_fields or "height" in updated_fields
+            if measurements_changed:
+                writes.append(lambda session: db.growth_data.find_one_and_update(
+                    {"child_id": child_id},
+                    {"$set": {"weight": updated_child.weight, "height": updated_child.height}},
+                    sort=[("date", -1)],
+                    session=session,
+                ))
+            try:
+                results = await apply_writes(db, *writes)
+                break
+            except StaleChildRecord:
+                logger.info(f"Child {child_id} changed while being updated (attempt {attempt + 1})")
+            finally:
+                child_cache.invalidate(child_id)
+        else:
+            raise HTTPException(status_code=409, detail="Child was changed by another request; please retry")
 
-        growth_collection.find_one_and_update(
-            {"child_id": child_id},
-            {"$set": {"weight": updated_child.weight, "height": updated_child.height}},
-            sort=[("date", -1)]
-        )
+        latest = results[1] if measurements_changed else None
+        if latest is not None:
+            # Derived data, recomputed after the write ($merge cannot run inside a transaction)
+            await refresh_month(db.growth_data, db[ROLLUP_COLLECTION], child_id, latest["date"])
 
         logger.info(f"Parent {updated_child.parentId} updated child {child_id}: " + "; ".join(changes))
         return {"message": "Child updated successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating child {child_id} by parent {updated_child.parentId}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{child_id}", response_model=dict)
-async def delete_child(child_id: str):
-    child = children_collection.find_one({"_id": ObjectId(child_id)})
+async def delete_child(child_id: str, db=Depends(get_database)):
+    # Parsed before any write, so an invalid id cannot fail halfway through
+    object_id = ObjectId(child_id)
+    child, _, _ = await apply_writes(
+        db,
+        lambda session: db.children.find_one_and_delete({"_id": object_id}, {"parentId": 1}, session=session),
+        lambda session: db.growth_data.delete_many({"child_id": child_id}, session=session),
+        lambda session: delete_rollups(db[ROLLUP_COLLECTION], child_id, session=session),
+    )
+    child_cache.invalidate(child_id)
     if not child:
         raise HTTPException(status_code=404, detail="Child not found")
 
     parent_id = child.get("parentId")
-    children_collection.delete_one({"_id": ObjectId(child_id)})
-    growth_collection.delete_many({"child_id": child_id})
     logger.info(f"Parent {parent_id} deleted child {child_id}")
     return {"message": "Child deleted successfully"}
@@ -1,59 +1,246 @@
+"""
+Train the growth (nutrition status) model and write a versioned artifact bundle.
+
+Run from the project root:
+    python -m lib.DL.growthEvaluatorModel --data Data/prepared_data.csv [--search]
+
+The bundle lands in lib/Model/bundles/<version>/ and contains the model, label
+encoder, scaler, nutrition lookup table, the forest flattened into
+memory-mappable .npy arrays (forest/) and a manifest.json with the feature
+order, file hashes, metrics and training time. Unless --no-activate is given,
+lib/Model/CURRENT is pointed at the new bundle so running servers pick it up.
+"""
+import os
+import sys
+import json
+import time
 import pickle
+import argparse
+import platform
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import sklearn
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-import pandas as pd 
-import os
+from sklearn.model_selection import train_test_split, RandomizedSearchCV
+from sklearn.metrics import accuracy_score, f1_score, classification_report
+from lib.growth_lookup import NutritionLookup, DEFAULT_RESOLUTION, MAX_DISAGREEMENT
+from lib.forest_engine import FlatForest
+from lib.model_registry import (
+    MODEL_DIR, BUNDLES_DIR, CURRENT_BUNDLE_PATH, FEATURE_COLUMNS, file_sha256,
+)
 
 # Get the root directory of the project
-root_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-
-# Construct the absolute path
+root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 data_path = os.path.join(root_dir, 'Data', 'prepared_data.csv')
 
-# Read dataset
-df = pd.read_csv(data_path)
+TARGET_COLUMN = "Nutrition Status"
+
+# Older exports of prepared_data.csv used short column names
+COLUMN_ALIASES = {"Age": "Age (months)", "Height": "Height (cm)"}
+
+COLUMN_DTYPES = {
+    "Age (months)": "float32",
+    "Height (cm)": "float32",
+    "Gender_female": "uint8",
+    "Gender_male": "uint8",
+    "Gender": "category",
+    TARGET_COLUMN: "category",
+}
+
+SEARCH_SPACE = {
+    "n_estimators": [100, 200, 400],
+    "max_depth": [None, 10, 20, 30],
+    "min_samples_leaf": [1, 2, 4],
+    "max_features": ["sqrt", "log2", None],
+}
+
+
+def read_training_data(path: str, chunksize: int) -> pd.DataFrame:
+    """Read the CSV in chunks with compact dtypes so memory stays close to the final frame."""
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {}
+    for column in header:
+        name = COLUMN_ALIASES.get(column, column)
+        if name in COLUMN_DTYPES:
+            dtypes[column] = COLUMN_DTYPES[name]
+
+    chunks = []
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtypes):
+        chunk = chunk.rename(columns=COLUMN_ALIASES)
+        if "Gender" in chunk.columns:
+            gender = chunk.pop("Gender").astype(str).str.lower()
+            chunk["Gender_female"] = (gender == "female").astype("uint8")
+            chunk["Gender_male"] = (gender == "male").astype("uint8")
+        chunks.append(chunk[FEATURE_COLUMNS + [TARGET_COLUMN]])
+    df = pd.concat(chunks, ignore_index=True)
+    df[TARGET_COLUMN] = df[TARGET_COLUMN].astype(str)
+    return df
+
+
+def train(df: pd.DataFrame, n_jobs: int, seed: int, search: bool, search_iter: int, cv: int):
+    X = df[FEATURE_COLUMNS]
+    label_encoder = LabelEncoder()
+    y = label_encoder.fit_transform(df[TARGET_COLUMN])
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+
+    # Trees are scale-invariant and serving feeds raw features, so the scaler is
+    # fitted for reference (training distribution) but not applied to the model input
+    scaler = StandardScaler().fit(X_train)
+
+    search_results = None
+    if search:
+        searcher = RandomizedSearchCV(
+            RandomForestClassifier(random_state=seed, n_jobs=1),
+            SEARCH_SPACE,
+            n_iter=search_iter,
+            cv=cv,
+            scoring="f1_macro",
+            n_jobs=n_jobs,
+            random_state=seed,
+        )
+        searcher.fit(X_train, y_train)
+        params = searcher.best_params_
+        search_results = {"best_params": params, "best_cv_f1_macro": float(searcher.best_score_)}
+    else:
+        params = {}
+
+    model = RandomForestClassifier(random_state=seed, n_jobs=n_jobs, **params)
+    model.fit(X_train, y_train)
+    # Single-row serving does not benefit from thread fan-out
+    model.n_jobs = None
+
+    y_pred = model.predict(X_test)
+    metrics = {
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "f1_macro": float(f1_score(y_test, y_pred, average="macro")),
+        "report": classification_report(
+            y_test, y_pred, labels=np.arange(len(label_encoder.classes_)),
+            target_names=[str(c) for c in label_encoder.classes_], output_dict=True, zero_division=0,
+        ),
+        "train_rows": int(len(X_train)),
+        "test_rows": int(len(X_test)),
+    }
+    return model, label_encoder, scaler, params, metrics, search_results
+
+
+def write_bundle(out_dir, model, label_encoder, scaler, feature_order, manifest, lookup_resolution):
+    staging = out_dir + ".tmp"
+    os.makedirs(staging, exist_ok=False)
+
+    files = {
+        "model.pkl": model,
+        "label_encoder.pkl": label_encoder,
+        "scaler.pkl": scaler,
+    }
+    for name, obj in files.items():
+        with open(os.path.join(staging, name), "wb") as f:
+            pickle.dump(obj, f)
+
+    # Flat node arrays the server memory-maps instead of unpickling the forest
+    FlatForest.from_sklearn(model).save(os.path.join(staging, "forest"))
+
+    model_hash = file_sha256(os.path.join(staging, "model.pkl"))
+    if lookup_resolution:
+        lookup = NutritionLookup.build(model, model_hash, feature_order, lookup_resolution)
+        rate, _ = lookup.off_grid_disagreement(model, feature_order)
+        manifest["lookup_off_grid_disagreement"] = rate
+        print(f"Lookup table at {lookup_resolution} cm: {rate:.2%} of off-grid inputs differ from the forest")
+        if rate > MAX_DISAGREEMENT:
+            # Without the table the server predicts every request with the forest
+            print(f"Above the {MAX_DISAGREEMENT:.2%} limit; bundle written without a lookup table "
+                  f"(use a smaller --lookup-resolution)")
+        else:
+            lookup.save(os.path.join(staging, "nutrition_lookup.npz"))
+            manifest["lookup_resolution"] = lookup.resolution
+
+    manifest["model_sha256"] = model_hash
+    manifest["files"] = {}
+    for directory, _, names in sorted(os.walk(staging)):
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            manifest["files"][os.path.relpath(path, staging).replace(os.sep, "/")] = file_sha256(path)
+    with open(os.path.join(staging, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # The bundle only becomes visible once it is complete
+    os.rename(staging, out_dir)
+    return model_hash
 
-# Feature and target separation
-X_over = df.drop('Nutrition Status', axis=1)
-y_over = df['Nutrition Status']
 
-# Standardize the 'Height' feature
-scaler = StandardScaler()
-X_over['Height'] = scaler.fit_transform(X_over[['Height']])
+def activate_bundle(version: str):
+    tmp_path = CURRENT_BUNDLE_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, CURRENT_BUNDLE_PATH)
 
-# Split into train and test sets
-X_train_over, X_test_over, y_train_over, y_test_over = train_test_split(X_over, y_over, test_size=0.2, random_state=42)
 
-# Encode target labels
-label_encoder = LabelEncoder()
-y_train_encoded = label_encoder.fit_transform(y_train_over)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the growth model and write a versioned bundle")
+    parser.add_argument("--data", default=data_path)
+    parser.add_argument("--out", default=BUNDLES_DIR)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Cores used for fitting and search (-1 = all)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--search", action="store_true", help="Run a parallel randomized hyperparameter search")
+    parser.add_argument("--search-iter", type=int, default=20)
+    parser.add_argument("--cv", type=int, default=3)
+    parser.add_argument("--lookup-resolution", type=float, default=DEFAULT_RESOLUTION,
+                        help="Height bin (cm) of the serving lookup table; 0 skips it. Heights between bins get "
+                             "the nearest bin's class, so smaller bins track the forest more closely; the table "
+                             "is left out of the bundle when its off-grid disagreement exceeds "
+                             "GROWTH_LOOKUP_MAX_DISAGREEMENT")
+    parser.add_argument("--no-activate", action="store_true", help="Do not point lib/Model/CURRENT at the bundle")
+    args = parser.parse_args(argv)
 
-# Train the Random Forest model
-random_forest = RandomForestClassifier(random_state=42)
-random_forest.fit(X_train_over, y_train_encoded)
+    started = time.perf_counter()
+    df = read_training_data(args.data, args.chunksize)
+    load_seconds = time.perf_counter() - started
+    print(f"Loaded {len(df)} rows in {load_seconds:.2f}s")
 
-# Make predictions
-y_pred_over = random_forest.predict(X_test_over)
-y_pred = label_encoder.inverse_transform(y_pred_over)
-print("Prediction features:", X_test_over.columns)
+    fit_started = time.perf_counter()
+    model, label_encoder, scaler, params, metrics, search_results = train(
+        df, args.n_jobs, args.seed, args.search, args.search_iter, args.cv
+    )
+    training_seconds = time.perf_counter() - fit_started
+    print(f"Trained in {training_seconds:.2f}s | accuracy={metrics['accuracy']:.4f} f1_macro={metrics['f1_macro']:.4f}")
 
-# Save the model and preprocessing tools
-store_path = os.path.join(root_dir, 'lib', 'Model')
+    created_at = datetime.utcnow()
+    manifest = {
+        "created_at": created_at.isoformat(),
+        "feature_order": FEATURE_COLUMNS,
+        "classes": [str(c) for c in label_encoder.classes_],
+        "scaler_applied": False,
+        "params": {**model.get_params(), "n_jobs": args.n_jobs},
+        "seed": args.seed,
+        "search": search_results,
+        "metrics": metrics,
+        "data": {"path": os.path.relpath(args.data, root_dir), "sha256": file_sha256(args.data), "rows": int(len(df))},
+        "timings": {"load_seconds": load_seconds, "training_seconds": training_seconds},
+        "versions": {
+            "python": platform.python_version(),
+            "sklearn": sklearn.__version__,
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+    }
 
-# Save the RandomForest model
-model_path = os.path.join(store_path, "random_forest_model.pkl")
-with open(model_path, "wb") as file:
-    pickle.dump(random_forest, file)
+    os.makedirs(args.out, exist_ok=True)
+    version = created_at.strftime("%Y%m%dT%H%M%S")
+    model_hash = write_bundle(
+        os.path.join(args.out, version), model, label_encoder, scaler,
+        FEATURE_COLUMNS, manifest, args.lookup_resolution,
+    )
+    print(f"Bundle {version} written to {os.path.join(args.out, version)}")
+    print(f"EXPECTED_MODEL_HASH={model_hash}")
 
-# Save the LabelEncoder
-label_encoder_path = os.path.join(store_path, "label_encoder.pkl")
-with open(label_encoder_path, "wb") as file:
-    pickle.dump(label_encoder, file)
+    if not args.no_activate and os.path.abspath(args.out) == os.path.abspath(BUNDLES_DIR):
+        activate_bundle(version)
+        print(f"Activated bundle {version} in {os.path.relpath(CURRENT_BUNDLE_PATH, MODEL_DIR)}")
+    return 0
 
-# Save the StandardScaler
-scaler_path = os.path.join(store_path, "scaler.pkl")
-with open(scaler_path, "wb") as file:
-    pickle.dump(scaler, file)
 
-print(f"Model, LabelEncoder, and Scaler saved successfully!")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,30 @@
-import pickle
-import numpy as np
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import List
-from datetime import datetime
-from pymongo import MongoClient
-from bson import ObjectId
-from fastapi import APIRouter, HTTPException
-import os
-from dateutil.relativedelta import relativedelta
-import pandas as pd
-from lib.encryption_utils import decrypt_field
-from fastapi import Request
-import hashlib
-import logging
 import os
+import json
+import base64
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse
-from dotenv import load_dotenv
-from datetime import datetime
+import numpy as np
+from fastapi import APIRouter, HTTPException, Request, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
 from bson import ObjectId
-from pymongo import MongoClient
-from lib.encryption_utils import  decrypt_field
-from lib.rate_limiter import rate_limiter
+from pymongo import UpdateOne
+from lib.child_records import (
+    WRITE_ATTEMPTS as CHILD_WRITE_ATTEMPTS, StaleChildRecord, open_child, reseal_child, reseal_update, version_filter,
+)
+from lib.child_cache import child_cache, load_child, load_children
+from lib.rate_limiter import rate_limit
+from lib.database import get_database, apply_writes
+from lib.model_registry import model_registry, ModelIntegrityError
+from lib.inference_batcher import MicroBatcher, BatcherStopped
+from lib.growth_standards import GENDERS, analyze as analyze_growth
+from lib.growth_rollups import (
+    ROLLUP_COLLECTION, ROLLUP_FIELDS, record_measurement, record_measurements, refresh_months, month_start,
+)
+from lib.bulk_import import detect_format, insert_chunk, run_import
 
 # ------------------ Logging Setup ------------------
 
@@ -44,19 +44,25 @@ if not logger.handlers:
     logger.addHandler(file_handler)
 
 
-# MongoDB setup (adjust your URI)
-client = MongoClient("mongodb://localhost:27017")
-db = client["child_care"]
-children_collection = db["children"]
+# FastAPI App (the database is injected per request from the client opened in the app lifespan)
+router = APIRouter()
 
+# Upper bound on child ids accepted by /growth-detection/batch
+MAX_BATCH_CHILDREN = int(os.getenv("GROWTH_DETECTION_MAX_BATCH", "500"))
 
-# MongoDB Setup
-client = MongoClient("mongodb://localhost:27017/")
-db = client.smart_parenting
-growth_collection = db.growth_data
-children_collection = db.children
-# FastAPI App
-router = APIRouter()
+# Upper bound on readings accepted by /growth/add/batch
+MAX_BATCH_READINGS = int(os.getenv("GROWTH_ADD_MAX_BATCH", "1000"))
+
+# Growth history pagination
+DEFAULT_PAGE_SIZE = int(os.getenv("GROWTH_HISTORY_PAGE_SIZE", "500"))
+MAX_PAGE_SIZE = int(os.getenv("GROWTH_HISTORY_MAX_PAGE_SIZE", "5000"))
+GROWTH_FIELDS = {"child_id", "date", "weight", "height", "milestone"}
+
+# Growth-standard analytics
+MAX_ANALYTICS_CHILDREN = int(os.getenv("GROWTH_ANALYTICS_MAX_BATCH", "100"))
+ANALYTICS_PROJECTION = {"child_id": 1, "date": 1, "weight": 1, "height": 1}
+EPOCH = datetime(1970, 1, 1)
+ONE_DAY = timedelta(days=1)
 
 # Pydantic Models
 class GrowthData(BaseModel):
@@ -68,26 +74,23 @@ class GrowthData(BaseModel):
 
 
 @router.post("/growth/initial")
-async def add_child(child: GrowthData):
+async def add_child(child: GrowthData, db=Depends(get_database)):
     try:
         logger.info("Received request to add initial growth data")
         child_data = child.dict()
-        result = growth_collection.insert_one(child_data)
+        # One stored reading, counted once in its child's monthly rollup
+        result, _ = await apply_writes(
+            db,
+            lambda session: db.growth_data.insert_one(child_data, session=session),
+            lambda session: record_measurement(db[ROLLUP_COLLECTION], child.child_id, child.date, child.weight,
+                                               child.height, session=session),
+        )
 
         if not result.acknowledged:
             logger.error("Failed to add initial growth data")
             raise HTTPException(status_code=500, detail="Failed to add child")
 
-        growth_data = {
-            "child_id": str(result.inserted_id),
-            "date": datetime.utcnow(),
-            "weight": child.weight,
-            "height": child.height,
-            "milestone": "Initial Data"
-        }
-        growth_collection.insert_one(growth_data)
-
-        logger.info(f"Initial growth data added for child_id={result.inserted_id}")
+        logger.info(f"Initial growth data added for child_id={child.child_id}")
         return JSONResponse({"message": "Child added successfully"}, status_code=201)
 
     except Exception as e:
@@ -96,133 +99,352 @@ async def add_child(child: GrowthData):
 
     
 @router.post("/growth/add")
-async def add_growth(data: GrowthData):
+async def add_growth(data: GrowthData, db=Depends(get_database)):
     try:
         logger.info(f"Adding growth data for child_id={data.child_id}")
         growth_data = data.dict()
-        result = growth_collection.insert_one(growth_data)
-
-        update_result = children_collection.update_one(
-            {"_id": ObjectId(data.child_id)},
-            {"$set": {"weight": data.weight, "height": data.height}}
-        )
 
-        if update_result.matched_count == 0:
-            logger.warning(f"No child found with ID: {data.child_id}")
-            raise HTTPException(status_code=404, detail="Child not found")
+        for attempt in range(CHILD_WRITE_ATTEMPTS):
+            # Checked first, so no measurement is stored for a child that does not exist
+            child_data, decrypted = await load_child(db.children, ObjectId(data.child_id), child_cache)
+            if child_data is None:
+                logger.warning(f"No child found with ID: {data.child_id}")
+                raise HTTPException(status_code=404, detail="Child not found")
+
+            # Latest measurements live inside the sealed record, so it is re-sealed as a whole,
+            # only over the version read here; otherwise it is read again
+            fields = {**decrypted, "weight": data.weight, "height": data.height}
+            try:
+                await apply_writes(
+                    db,
+                    lambda session: reseal_child(db.children, child_data, child_data.get("parentId"), fields,
+                                                 session=session),
+                    lambda session: db.growth_data.insert_one(growth_data, session=session),
+                    lambda session: record_measurement(db[ROLLUP_COLLECTION], data.child_id, data.date, data.weight,
+                                                       data.height, session=session),
+                )
+                break
+            except StaleChildRecord:
+                logger.info(f"Child {data.child_id} changed while adding growth data (attempt {attempt + 1})")
+            finally:
+                child_cache.invalidate(data.child_id)
+        else:
+            raise HTTPException(status_code=409, detail="Child was changed by another request; please retry")
 
         logger.info(f"Growth data added for child_id={data.child_id}")
         return JSONResponse({"message": "Growth data added successfully"}, status_code=201)
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         logger.error(f"Error adding growth data: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
 
-# Helper Functions
-def generate_model_hash(model_path):
-    with open(model_path, 'rb') as f:
-        return hashlib.sha256(f.read()).hexdigest()
+async def latest_readings(collection, child_ids) -> dict:
+    """child_id -> newest stored reading ({"reading_id", "weight", "height"}); ties go to the newest _id."""
+    cursor = collection.aggregate([
+        {"$match": {"child_id": {"$in": list(child_ids)}}},
+        # Walks the child_date index backwards
+        {"$sort": {"child_id": -1, "date": -1, "_id": -1}},
+        {"$group": {"_id": "$child_id", "reading_id": {"$first": "$_id"},
+                    "weight": {"$first": "$weight"}, "height": {"$first": "$height"}}},
+    ])
+    return {doc["_id"]: doc for doc in await cursor.to_list(None)}
+
+
+async def reseal_newest_reading(db, child_id: str, reading_ids) -> bool:
+    """
+    Copy the child's newest stored reading into its sealed record if that reading
+    is one of reading_ids, re-reading the child on conflicts. False if it kept
+    changing for CHILD_WRITE_ATTEMPTS attempts.
+    """
+    for _ in range(CHILD_WRITE_ATTEMPTS):
+        stub, decrypted = await load_child(db.children, ObjectId(child_id), child_cache)
+        reading = (await latest_readings(db.growth_data, [child_id])).get(child_id)
+        if stub is None or reading is None or reading["reading_id"] not in reading_ids:
+            return True
+        if (float(decrypted["weight"]), float(decrypted["height"])) == (reading["weight"], reading["height"]):
+            return True
+        fields = {**decrypted, "weight": reading["weight"], "height": reading["height"]}
+        try:
+            await reseal_child(db.children, stub, stub.get("parentId"), fields)
+            return True
+        except StaleChildRecord:
+            pass
+        finally:
+            child_cache.invalidate(child_id)
+    return False
+
+
+class GrowthDataBatch(BaseModel):
+    readings: List[GrowthData] = Field(..., min_length=1, max_length=MAX_BATCH_READINGS)
+
+
+@router.post("/growth/add/batch")
+async def add_growth_batch(batch: GrowthDataBatch, db=Depends(get_database)):
+    try:
+        readings = batch.readings
+        logger.info(f"Adding {len(readings)} growth readings in one batch")
+
+        errors = []
+        object_ids = {r.child_id: ObjectId(r.child_id) for r in readings if ObjectId.is_valid(r.child_id)}
+        children = {
+            str(stub["_id"]): (stub, decrypted)
+            for stub, decrypted in await load_children(db.children, {"_id": {"$in": list(object_ids.values())}}, child_cache)
+        }
+
+        accepted = []
+        for index, reading in enumerate(readings):
+            if reading.child_id not in object_ids:
+                errors.append({"index": index, "child_id": reading.child_id, "status_code": 400, "detail": "Invalid child id"})
+            elif reading.child_id not in children:
+                errors.append({"index": index, "child_id": reading.child_id, "status_code": 404, "detail": "Child not found"})
+            else:
+                accepted.append(index)
+
+        results = []
+        if accepted:
+            documents = [readings[index].dict() for index in accepted]
+            inserted, failures = await insert_chunk(db.growth_data, documents, accepted)
+            for index, detail in failures:
+                errors.append({"index": index, "child_id": readings[index].child_id, "status_code": 500, "detail": detail})
+
+            for i in inserted:
+                results.append({"index": accepted[i], "child_id": documents[i]["child_id"], "_id": str(documents[i]["_id"])})
+
+            # A child's current weight and height follow its newest stored reading, so only
+            # children whose newest reading is now one of this batch are resealed (a backfill
+            # of older readings leaves them alone), each over the version read above
+            inserted_ids = {documents[i]["_id"] for i in inserted}
+            newest = await latest_readings(db.growth_data, {documents[i]["child_id"] for i in inserted})
+            reseals = {}
+            for child_id, reading in newest.items():
+                if reading["reading_id"] not in inserted_ids:
+                    continue
+                stub, decrypted = children[child_id]
+                fields = {**decrypted, "weight": reading["weight"], "height": reading["height"]}
+                reseals[child_id] = UpdateOne(version_filter(stub), reseal_update(stub, stub.get("parentId"), fields))
+            measurements = [(documents[i]["child_id"], documents[i]["date"], documents[i]["weight"], documents[i]["height"])
+                            for i in inserted]
+            resealed = 0
+            if inserted:
+                async def write_reseals(session):
+                    if not reseals:
+                        return 0
+                    result = await db.children.bulk_write(list(reseals.values()), ordered=False, session=session)
+                    return result.matched_count
+
+                resealed, _ = await apply_writes(
+                    db,
+                    write_reseals,
+                    lambda session: record_measurements(db[ROLLUP_COLLECTION], measurements, session=session),
+                )
+            for child_id in reseals:
+                child_cache.invalidate(child_id)
+            if resealed < len(reseals):
+                # Some children changed since they were read; each is read again and resealed on its own
+                for child_id in reseals:
+                    if not await reseal_newest_reading(db, child_id, inserted_ids):
+                        logger.warning(f"Child {child_id} kept changing; current measurements not updated from batch")
+
+        results.sort(key=lambda result: result["index"])
+        errors.sort(key=lambda error: error["index"])
+        logger.info(f"Growth batch finished | Inserted: {len(results)} | Errors: {len(errors)}")
+        return JSONResponse({
+            "data": results,
+            "errors": errors,
+            "message": "Growth batch processed",
+        }, status_code=201 if results else 200)
+
+    except Exception:
+        logger.exception("Unhandled exception while adding a growth batch")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+async def write_growth(db, rows) -> tuple:
+    """Insert one chunk of imported measurements and recompute the months they fall in."""
+    failures = []
+    candidates = {model.child_id for _, model in rows if ObjectId.is_valid(model.child_id)}
+    existing = {
+        str(doc["_id"])
+        for doc in await db.children.find({"_id": {"$in": [ObjectId(c) for c in candidates]}}, {"_id": 1}).to_list(None)
+    }
+    accepted = []
+    for row, model in rows:
+        if model.child_id in existing:
+            accepted.append((row, model))
+        else:
+            failures.append((row, "Child not found"))
+    if not accepted:
+        return 0, failures
+
+    documents = [model.dict() for _, model in accepted]
+    inserted, write_failures = await insert_chunk(db.growth_data, documents, [row for row, _ in accepted])
+    months = {(documents[i]["child_id"], month_start(documents[i]["date"])) for i in inserted}
+    await refresh_months(db.growth_data, db[ROLLUP_COLLECTION], months)
+    return len(inserted), failures + write_failures
+
+
+@router.post("/growth/import")
+async def import_growth(
+    request: Request,
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+    db=Depends(get_database),
+):
+    """
+    Bulk-load growth history (NDJSON or CSV, one GrowthData per row). Rollups
+    are recomputed for the affected months; the children's current weight and
+    height are left as they are.
+    """
+    fmt = detect_format(request.headers.get("content-type"), file_format)
+    report = await run_import(request.stream(), fmt, GrowthData, lambda rows: write_growth(db, rows))
+    logger.info(f"Imported {report['imported']} growth measurements from {fmt} ({report['failed']} rows rejected)")
+    return JSONResponse({"message": "Import finished", **report}, status_code=200)
+
+
+@router.get("/growth-detection/model")
+async def get_model_info():
+    return model_registry.describe()
+
+
+@router.get("/growth-detection/metrics")
+async def get_inference_metrics():
+    return growth_batcher.metrics()
+
+
+def extract_growth_features(child_data, decrypted=None) -> dict:
+    """Decrypt a child document (unless already decrypted) and derive validated model inputs from it."""
+    decrypted = decrypted or open_child(child_data)
+    name = decrypted.get("name")
+    gender = decrypted.get("gender").lower()
+    dob = decrypted.get("date_of_birth")
+    height_raw = float(decrypted.get("height", "0"))
+
+    logger.info(f"Child data decrypted for: {name}")
+
+    # Parse and calculate age
+    dob = dob.split("T")[0]
+    dob = datetime.strptime(dob, "%Y-%m-%d")
+    current_date = datetime.now()
+    age_delta = relativedelta(current_date, dob)
+    age = age_delta.years * 12 + age_delta.months
+
+    logger.info(f"Calculated age in months: {age}")
+
+    # Gender validation
+    if gender not in ["male", "female"]:
+        logger.error(f"Invalid gender found: {gender}")
+        raise HTTPException(status_code=400, detail="Invalid gender")
+
+    # Validate height
+    height = height_raw * 30.48  # Convert from feet to cm
+    if not 30 <= height <= 150:
+        logger.warning(f"Height {height} cm is out of expected range for child {name}")
+        raise ValueError("Height out of valid range")
+
+    return {
+        "child_id": str(child_data["_id"]),
+        "name": name,
+        "age": age,
+        "height": height,
+        "gender": gender,
+    }
+
+
+def build_feature_matrix(features: List[dict], feature_order) -> np.ndarray:
+    """One row per child, columns in the order the model was trained on."""
+    columns = {
+        "Age (months)": [f["age"] for f in features],
+        "Height (cm)": [f["height"] for f in features],
+        "Gender_female": [int(f["gender"] == "female") for f in features],
+        "Gender_male": [int(f["gender"] == "male") for f in features],
+    }
+    return np.column_stack([columns[name] for name in feature_order]).astype(np.float64)
+
+
+def predict_statuses(loaded, features: List[dict]) -> List[str]:
+    """Nutrition status per feature row, served from the lookup table where it covers the row."""
+    encoded = [None] * len(features)
+    if loaded.lookup is not None:
+        for i, f in enumerate(features):
+            encoded[i] = loaded.lookup.lookup(f["gender"], f["age"], f["height"])
+
+    missing = [i for i, value in enumerate(encoded) if value is None]
+    if missing:
+        matrix = build_feature_matrix([features[i] for i in missing], loaded.feature_order)
+        for i, value in zip(missing, loaded.engine.predict(matrix)):
+            encoded[i] = value
+
+    return [str(loaded.classes[value]) for value in encoded]
+
+
+def predict_batch(features: List[dict]) -> List[tuple]:
+    """Runs on the inference thread; returns (status, model_version) per row."""
+    loaded = model_registry.get()
+    return [(status, loaded.version) for status in predict_statuses(loaded, features)]
+
+
+# Coalesces single-child predictions from concurrent /growth-detection requests
+growth_batcher = MicroBatcher(predict_batch)
+
+
+async def predict_status(loaded, features: dict) -> tuple:
+    if loaded.lookup is not None:
+        encoded = loaded.lookup.lookup(features["gender"], features["age"], features["height"])
+        if encoded is not None:
+            return str(loaded.classes[encoded]), loaded.version
+    try:
+        return await growth_batcher.submit(features)
+    except ModelIntegrityError:
+        raise model_unavailable()
+    except BatcherStopped:
+        raise HTTPException(status_code=503, detail="Server is shutting down")
 
 
-def hash_model_path(model_path):
-    return hashlib.sha256(model_path.encode()).hexdigest()
+def model_unavailable() -> HTTPException:
+    logger.critical("Model integrity verification failed.")
+    return HTTPException(status_code=503, detail="Model integrity check failed")
 
 
-def verify_model_integrity(model_path, expected_hash):
-    actual_hash = generate_model_hash(model_path)
-    if actual_hash != expected_hash:
-        logger.error(f"Model integrity check failed. Actual: {actual_hash}, Expected: {expected_hash}")
-        return False
-    return True
+def get_loaded_model():
+    # Model is verified once at load time; reloads happen in model_registry.watch(), off the event loop
+    try:
+        return model_registry.get()
+    except ModelIntegrityError:
+        raise model_unavailable()
 
 
 @router.get("/growth-detection")
-async def detect_growth(child_id: str, request: Request, _: None = Depends(rate_limiter)):
+async def detect_growth(child_id: str, request: Request, _: None = Depends(rate_limit("growth-detection")),
+                        db=Depends(get_database)):
     try:
         logger.info(f"Growth detection request received for child_id: {child_id}")
 
         # Fetch child data from DB
-        child_data = children_collection.find_one({"_id": ObjectId(child_id)})
+        child_data, decrypted = await load_child(db.children, ObjectId(child_id), child_cache)
         if child_data is None:
             logger.warning(f"No child found with ID: {child_id}")
             raise HTTPException(status_code=404, detail="Child not found")
 
-        # Decrypt fields
-        name = decrypt_field(child_data.get("name"))
-        gender = decrypt_field(child_data.get("gender")).lower()
-        dob = decrypt_field(child_data.get("date_of_birth"))
-        allergies = decrypt_field(child_data.get("allergies"))
-        height_raw = float(decrypt_field(child_data.get("height", "0")))
-
-        logger.info(f"Child data decrypted for: {name}")
-
-        # Parse and calculate age
-        dob = dob.split("T")[0]
-        dob = datetime.strptime(dob, "%Y-%m-%d")
-        current_date = datetime.now()
-        age_delta = relativedelta(current_date, dob)
-        age = age_delta.years * 12 + age_delta.months
-
-        logger.info(f"Calculated age in months: {age}")
-
-        # Gender validation
-        if gender not in ["male", "female"]:
-            logger.error(f"Invalid gender found: {gender}")
-            raise HTTPException(status_code=400, detail="Invalid gender")
-
-        # Encode gender
-        gender_male = int(gender == "male")
-        gender_female = int(gender == "female")
-
-        # Validate height
-        height = height_raw * 30.48  # Convert from feet to cm
-        if not 30 <= height <= 150:
-            logger.warning(f"Height {height} cm is out of expected range for child {name}")
-            raise ValueError("Height out of valid range")
-
-        # Verify model integrity
-        model_path = "lib/Model/random_forest_model.pkl"
-        expected_model_hash = os.getenv("EXPECTED_MODEL_HASH")
-        if not verify_model_integrity(model_path, expected_model_hash):
-            logger.critical("Model integrity verification failed.")
-            raise HTTPException(status_code=500, detail="Model integrity check failed")
-
-        # Prepare data
-        df = pd.DataFrame({
-            "Age (months)": [age],
-            "Height (cm)": [height],
-            "Gender_female": [gender_female],
-            "Gender_male": [gender_male]
-        })
-
-        # Load model and label encoder
-        with open(model_path, "rb") as f:
-            model = pickle.load(f)
-        label_encoder_path = "lib/Model/label_encoder.pkl"
-        with open(label_encoder_path, "rb") as file:
-            loaded_label_encoder = pickle.load(file)
+        features = extract_growth_features(child_data, decrypted)
+        loaded = get_loaded_model()
 
         # Predict
-        prediction = model.predict(df)
-        nutrition_status = loaded_label_encoder.inverse_transform(prediction)[0]
+        nutrition_status, model_version = await predict_status(loaded, features)
 
         logger.info(
-            f"Prediction successful for {name} | Age: {age} months | Height: {height:.2f} cm | Status: {nutrition_status}"
+            f"Prediction successful for {features['name']} | Age: {features['age']} months | "
+            f"Height: {features['height']:.2f} cm | Status: {nutrition_status}"
         )
 
         # Construct response
         response_data = {
-            "data": {
-                "child_id": str(child_data["_id"]),
-                "name": name,
-                "age": age,
-                "height": height,
-                "gender": gender,
-                "nutrition_status": nutrition_status,
-            },
-            "message": "Prediction successful"
+            "data": {**features, "nutrition_status": nutrition_status},
+            "message": "Prediction successful",
+            "model_version": model_version,
         }
 
         return JSONResponse(response_data, status_code=200)
@@ -236,24 +458,352 @@ async def detect_growth(child_id: str, request: Request, _: None = Depends(rate_
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
-@router.get("/growth/getGrowthData/{child_id}")
-async def get_growth_data(child_id: str):
+class GrowthDetectionBatch(BaseModel):
+    child_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_CHILDREN)
+
+
+@router.post("/growth-detection/batch")
+async def detect_growth_batch(batch: GrowthDetectionBatch, request: Request,
+                              _: None = Depends(rate_limit("growth-detection")),
+                              db=Depends(get_database)):
     try:
-        logger.info(f"Fetching growth data for child_id={child_id}")
-        growth_data = list(growth_collection.find({"child_id": child_id}).sort("date", 1))
+        child_ids = list(dict.fromkeys(batch.child_ids))
+        logger.info(f"Batch growth detection request received for {len(child_ids)} children")
+
+        errors = []
+        object_ids = []
+        for child_id in child_ids:
+            if ObjectId.is_valid(child_id):
+                object_ids.append(ObjectId(child_id))
+            else:
+                errors.append({"child_id": child_id, "status_code": 400, "detail": "Invalid child id"})
+
+        # One round trip for the whole batch
+        documents = {
+            str(stub["_id"]): (stub, decrypted)
+            for stub, decrypted in await load_children(db.children, {"_id": {"$in": object_ids}}, child_cache)
+        }
+
+        features = []
+        for object_id in object_ids:
+            child_id = str(object_id)
+            if child_id not in documents:
+                logger.warning(f"No child found with ID: {child_id}")
+                errors.append({"child_id": child_id, "status_code": 404, "detail": "Child not found"})
+                continue
+            try:
+                features.append(extract_growth_features(*documents[child_id]))
+            except HTTPException as http_err:
+                errors.append({"child_id": child_id, "status_code": http_err.status_code, "detail": http_err.detail})
+            except ValueError as e:
+                errors.append({"child_id": child_id, "status_code": 422, "detail": str(e)})
+            except Exception:
+                logger.exception(f"Could not prepare growth features for child_id={child_id}")
+                errors.append({"child_id": child_id, "status_code": 500, "detail": "Internal Server Error"})
+
+        results = []
+        model_version = None
+        if features:
+            loaded = get_loaded_model()
+            model_version = loaded.version
+            # Already one batch; keep the predict off the event loop
+            statuses = await asyncio.to_thread(predict_statuses, loaded, features)
+            results = [
+                {**feature, "nutrition_status": status}
+                for feature, status in zip(features, statuses)
+            ]
+
+        logger.info(f"Batch prediction finished | Predicted: {len(results)} | Errors: {len(errors)}")
+        return JSONResponse({
+            "data": results,
+            "errors": errors,
+            "message": "Batch prediction finished",
+            "model_version": model_version,
+        }, status_code=200)
+
+    except HTTPException as http_err:
+        logger.error(f"HTTPException during batch growth detection: {http_err.detail}")
+        raise http_err
+
+    except Exception:
+        logger.exception("Unhandled exception during batch growth detection")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+def encode_cursor(doc, key: str = "date") -> str:
+    raw = json.dumps({"d": doc[key].isoformat(), "i": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
 
-        if not growth_data:
+def decode_cursor(cursor: str, key: str = "date") -> dict:
+    """Keyset filter for documents strictly after the cursor in (key, _id) order."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        date, object_id = datetime.fromisoformat(raw["d"]), ObjectId(raw["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [{key: {"$gt": date}}, {key: date, "_id": {"$gt": object_id}}]}
+
+
+def growth_projection(fields: Optional[str]) -> Optional[dict]:
+    if not fields:
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - GROWTH_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    # date and _id are always returned; the cursor is built from them
+    return {field: 1 for field in requested | {"date"}}
+
+
+def serialize_growth(doc) -> dict:
+    doc["_id"] = str(doc["_id"])
+    if "date" in doc:
+        doc["date"] = doc["date"].isoformat()
+    return doc
+
+
+def serialize_rollup(doc) -> dict:
+    """A monthly rollup shaped like a growth point (its last measurement) plus the month's stats."""
+    return {
+        "_id": str(doc["_id"]),
+        "child_id": doc["child_id"],
+        "month": doc["month"].isoformat(),
+        "date": doc["last_date"].isoformat(),
+        "weight": doc.get("last_weight"),
+        "height": doc.get("last_height"),
+        **{field: doc.get(field) for field in ROLLUP_FIELDS[2:7]},
+    }
+
+
+@router.get("/growth/getGrowthData/{child_id}")
+async def get_growth_data(
+    child_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    fields: Optional[str] = None,
+    stream: bool = False,
+    granularity: str = Query("raw", pattern="^(raw|month)$"),
+    db=Depends(get_database),
+):
+    try:
+        logger.info(f"Fetching growth data for child_id={child_id} ({granularity})")
+
+        # Monthly mode reads one rollup per month instead of every raw measurement
+        monthly = granularity == "month"
+        if monthly and fields:
+            raise HTTPException(status_code=400, detail="fields is not supported with granularity=month")
+        key = "month" if monthly else "date"
+        serialize = serialize_rollup if monthly else serialize_growth
+
+        query = {"child_id": child_id}
+        if from_date or to_date:
+            query[key] = {}
+            if from_date:
+                query[key]["$gte"] = month_start(from_date) if monthly else from_date
+            if to_date:
+                query[key]["$lte"] = to_date
+        if cursor:
+            query = {"$and": [query, decode_cursor(cursor, key)]}
+
+        if monthly:
+            # month is unique per child, so it orders the keyset alone and child_month serves the sort
+            documents = db[ROLLUP_COLLECTION].find(query).sort([("month", 1)])
+        else:
+            documents = db.growth_data.find(query, growth_projection(fields)).sort([("date", 1), ("_id", 1)])
+
+        if stream:
+            if limit:
+                documents = documents.limit(limit)
+
+            # The driver fetches batches as the response is written, never the whole history
+            async def ndjson():
+                async for doc in documents:
+                    yield json.dumps(serialize(doc)) + "\n"
+
+            logger.info(f"Streaming growth data for child_id={child_id}")
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+        page_size = limit or DEFAULT_PAGE_SIZE
+        growth_data = await documents.limit(page_size + 1).to_list(None)
+        next_cursor = None
+        if len(growth_data) > page_size:
+            growth_data = growth_data[:page_size]
+            next_cursor = encode_cursor(growth_data[-1], key)
+
+        if not growth_data and not cursor:
             logger.warning(f"No growth data found for child_id={child_id}")
             raise HTTPException(status_code=404, detail="No growth data found for this child")
 
-        for data in growth_data:
-            data["_id"] = str(data["_id"])
-            if "date" in data:
-                data["date"] = data["date"].isoformat()
+        growth_data = [serialize(doc) for doc in growth_data]
 
         logger.info(f"Growth data fetched successfully for child_id={child_id}")
-        return JSONResponse({"message": "Growth data found", "data": growth_data}, status_code=200)
+        return JSONResponse(
+            {"message": "Growth data found", "data": growth_data, "next_cursor": next_cursor},
+            status_code=200,
+        )
+
+    except HTTPException:
+        raise
 
     except Exception as e:
         logger.error(f"Error fetching growth data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def growth_reference(child_data, decrypted=None) -> tuple:
+    """Decrypted date of birth and GENDERS index the WHO tables are looked up by."""
+    decrypted = decrypted or open_child(child_data)
+    gender = decrypted.get("gender").lower()
+    if gender not in GENDERS:
+        raise HTTPException(status_code=400, detail="Growth standards are only defined for male and female children")
+    dob = decrypted.get("date_of_birth").split("T")[0]
+    return datetime.strptime(dob, "%Y-%m-%d"), GENDERS.index(gender)
+
+
+def json_column(values: np.ndarray, decimals: int = 3) -> list:
+    column = np.round(values, decimals).astype(object)
+    column[np.isnan(values)] = None
+    return column.tolist()
+
+
+def growth_analytics(references: dict, documents: List[dict]) -> dict:
+    """
+    Score growth documents, ordered by child then date, in one vectorized pass.
+    Returns the analysed points per child_id.
+    """
+    n = len(documents)
+    codes = {child_id: code for code, child_id in enumerate(references)}
+    dob_days = np.array([(dob - EPOCH) / ONE_DAY for dob, _ in references.values()])
+    child_sex = np.array([sex for _, sex in references.values()], dtype=np.intp)
+
+    # np.fromiter over plain floats is several times cheaper than datetime64 conversion
+    groups = np.fromiter((codes[doc["child_id"]] for doc in documents), np.intp, n)
+    dates = np.fromiter(((doc["date"] - EPOCH) / ONE_DAY for doc in documents), np.float64, n)
+    weight = np.array([doc.get("weight") for doc in documents], dtype=np.float64)
+    height = np.array([doc.get("height") for doc in documents], dtype=np.float64) * 30.48  # feet to cm
+
+    metrics = analyze_growth(groups, child_sex[groups], dates - dob_days[groups], weight, height)
+    metrics["height_cm"] = height
+    names = list(metrics)
+    rows = zip(*(json_column(values) for values in metrics.values()))
+
+    points = {}
+    for doc, row in zip(documents, rows):
+        point = dict(zip(names, row))
+        point.update(_id=str(doc["_id"]), date=doc["date"].isoformat(), weight=doc.get("weight"))
+        points.setdefault(doc["child_id"], []).append(point)
+    return points
+
+
+@router.get("/growth/analytics/{child_id}")
+async def get_growth_analytics(child_id: str, request: Request, _: None = Depends(rate_limit("growth-analytics")),
+                               db=Depends(get_database)):
+    try:
+        logger.info(f"Growth analytics request received for child_id={child_id}")
+        if not ObjectId.is_valid(child_id):
+            raise HTTPException(status_code=400, detail="Invalid child id")
+
+        child_data, decrypted = await load_child(db.children, ObjectId(child_id), child_cache)
+        if child_data is None:
+            logger.warning(f"No child found with ID: {child_id}")
+            raise HTTPException(status_code=404, detail="Child not found")
+        references = {child_id: growth_reference(child_data, decrypted)}
+
+        documents = await (
+            db.growth_data.find({"child_id": child_id}, ANALYTICS_PROJECTION).sort([("date", 1), ("_id", 1)]).to_list(None)
+        )
+        if not documents:
+            logger.warning(f"No growth data found for child_id={child_id}")
+            raise HTTPException(status_code=404, detail="No growth data found for this child")
+
+        points = (await asyncio.to_thread(growth_analytics, references, documents))[child_id]
+
+        logger.info(f"Growth analytics computed for child_id={child_id} over {len(points)} measurements")
+        return JSONResponse({
+            "data": {"child_id": child_id, "points": points, "latest": points[-1]},
+            "message": "Growth analytics computed",
+        }, status_code=200)
+
+    except HTTPException as http_err:
+        logger.error(f"HTTPException for child_id={child_id}: {http_err.detail}")
+        raise http_err
+
+    except Exception:
+        logger.exception(f"Unhandled exception during growth analytics for child_id={child_id}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+class GrowthAnalyticsBatch(BaseModel):
+    child_ids: List[str] = Field(..., min_length=1, max_length=MAX_ANALYTICS_CHILDREN)
+
+
+@router.post("/growth/analytics/batch")
+async def get_growth_analytics_batch(batch: GrowthAnalyticsBatch, request: Request,
+                                     _: None = Depends(rate_limit("growth-analytics")),
+                                     db=Depends(get_database)):
+    try:
+        child_ids = list(dict.fromkeys(batch.child_ids))
+        logger.info(f"Batch growth analytics request received for {len(child_ids)} children")
+
+        errors = []
+        object_ids = []
+        for child_id in child_ids:
+            if ObjectId.is_valid(child_id):
+                object_ids.append(ObjectId(child_id))
+            else:
+                errors.append({"child_id": child_id, "status_code": 400, "detail": "Invalid child id"})
+
+        children = {
+            str(stub["_id"]): (stub, decrypted)
+            for stub, decrypted in await load_children(db.children, {"_id": {"$in": object_ids}}, child_cache)
+        }
+
+        references = {}
+        for object_id in object_ids:
+            child_id = str(object_id)
+            if child_id not in children:
+                errors.append({"child_id": child_id, "status_code": 404, "detail": "Child not found"})
+                continue
+            try:
+                references[child_id] = growth_reference(*children[child_id])
+            except HTTPException as http_err:
+                errors.append({"child_id": child_id, "status_code": http_err.status_code, "detail": http_err.detail})
+            except Exception:
+                logger.exception(f"Could not read growth reference for child_id={child_id}")
+                errors.append({"child_id": child_id, "status_code": 500, "detail": "Internal Server Error"})
+
+        points = {}
+        if references:
+            # One round trip; the child_date index serves both the filter and the sort
+            documents = await (
+                db.growth_data.find({"child_id": {"$in": list(references)}}, ANALYTICS_PROJECTION)
+                .sort([("child_id", 1), ("date", 1), ("_id", 1)])
+                .to_list(None)
+            )
+            if documents:
+                points = await asyncio.to_thread(growth_analytics, references, documents)
+
+        results = []
+        for child_id in references:
+            if child_id in points:
+                results.append({"child_id": child_id, "points": points[child_id], "latest": points[child_id][-1]})
+            else:
+                errors.append({"child_id": child_id, "status_code": 404, "detail": "No growth data found for this child"})
+
+        logger.info(f"Batch growth analytics finished | Children: {len(results)} | Errors: {len(errors)}")
+        return JSONResponse({
+            "data": results,
+            "errors": errors,
+            "message": "Batch growth analytics finished",
+        }, status_code=200)
+
+    except HTTPException as http_err:
+        logger.error(f"HTTPException during batch growth analytics: {http_err.detail}")
+        raise http_err
+
+    except Exception:
+        logger.exception("Unhandled exception during batch growth analytics")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -1,13 +1,19 @@
 from fastapi import APIRouter, HTTPException, Request, Depends
-from pydantic import BaseModel, Field
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field, AliasChoices
 from typing import List, Optional
 import google.generativeai as genai
 import os
 import re
 import html
+import time
 import logging
-from lib.rate_limiter import rate_limiter
-from datetime import datetime
+from lib.rate_limiter import rate_limit
+from lib.auth import current_user
+from lib.database import get_database
+from lib.child_records import seal_value, open_value
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
 
 router = APIRouter()
 
@@ -61,8 +67,113 @@ model = genai.GenerativeModel(
     generation_config=generation_config,
 )
 
+# Every call is stateless: the plan prompt stands alone, and follow-ups send only
+# that child's own conversation, kept in Mongo with a bounded, truncated history.
+# The history holds the child's details, so it is sealed like the child record
+NUTRITION_COLLECTION = "nutrition_conversations"
+HISTORY_MAX_TURNS = int(os.getenv("NUTRITION_HISTORY_MAX_TURNS", "6"))  # follow-up question/answer pairs kept
+HISTORY_MAX_CHARS = int(os.getenv("NUTRITION_HISTORY_MAX_CHARS", "4000"))  # per stored message
+HISTORY_TTL_HOURS = float(os.getenv("NUTRITION_HISTORY_TTL_HOURS", "24"))
+MAX_QUESTION_CHARS = 1000
+
+model_stats = {
+    "calls": 0,
+    "errors": 0,
+    "latency_seconds": 0.0,
+    "max_latency_seconds": 0.0,
+    "prompt_chars": 0,
+    "prompt_tokens": 0,
+    "output_tokens": 0,
+}
+
+
+async def generate(contents, kind: str, child_id: str):
+    """One async model call; its prompt size and latency are logged and added to model_stats."""
+    if isinstance(contents, str):
+        prompt_chars = len(contents)
+    else:
+        prompt_chars = sum(len(part) for message in contents for part in message["parts"])
+    started = time.perf_counter()
+    try:
+        response = await model.generate_content_async(contents)
+    except Exception:
+        model_stats["errors"] += 1
+        raise
+    finally:
+        latency = time.perf_counter() - started
+        model_stats["calls"] += 1
+        model_stats["latency_seconds"] += latency
+        model_stats["max_latency_seconds"] = max(model_stats["max_latency_seconds"], latency)
+        model_stats["prompt_chars"] += prompt_chars
+
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    model_stats["prompt_tokens"] += prompt_tokens
+    model_stats["output_tokens"] += output_tokens
+    logger.info(f"Model call kind={kind} child_id={child_id} prompt_chars={prompt_chars} "
+                f"prompt_tokens={prompt_tokens} output_tokens={output_tokens} latency_ms={latency * 1000:.0f}")
+    return response
+
+
+def conversation_key(email: str, child_id: str) -> str:
+    return f"{email}:{child_id}"
+
+
+def message(role: str, text: str) -> dict:
+    return {"role": role, "parts": [text[:HISTORY_MAX_CHARS]]}
+
+
+def conversation_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(hours=HISTORY_TTL_HOURS)
+
+
+def conversation_associated_data(key: str) -> bytes:
+    # Binds the envelope to its conversation, so it cannot be moved to another parent or child
+    return f"nutrition:{key}".encode()
+
 
-chat_session = model.start_chat(history=[])
+async def load_conversation(db, key: str) -> tuple:
+    """(version, {"plan": [...], "turns": [...]}); version is None if nothing is stored."""
+    doc = await db[NUTRITION_COLLECTION].find_one({"_id": key}, {"enc": 1, "ver": 1})
+    if doc is None or "enc" not in doc:
+        # Unsealed history written before sealing is not used, and is replaced on the next write
+        return (doc or {}).get("ver"), {"plan": [], "turns": []}
+    return doc.get("ver"), open_value(doc["enc"], conversation_associated_data(key))
+
+
+async def save_conversation(db, key: str, email: str, child_id: str, history: dict, version=None) -> bool:
+    """
+    Seal and store the history. With the version that was read, only that
+    version is replaced; False if another request stored one in between.
+    """
+    query = {"_id": key}
+    if version is not None:
+        query["ver"] = version
+    try:
+        result = await db[NUTRITION_COLLECTION].update_one(
+            query,
+            {
+                "$set": {
+                    "user": email,
+                    "child_id": child_id,
+                    "enc": seal_value(history, conversation_associated_data(key)),
+                    "expires_at": conversation_expiry(),
+                },
+                "$unset": {"plan": "", "turns": ""},
+                "$inc": {"ver": 1},
+            },
+            upsert=version is None,
+        )
+    except DuplicateKeyError:
+        return False
+    return version is None or result.modified_count == 1
+
+
+async def start_conversation(db, email: str, child_id: str, prompt: str, answer: str):
+    # A new plan starts the child's conversation over
+    history = {"plan": [message("user", prompt), message("model", answer)], "turns": []}
+    await save_conversation(db, conversation_key(email, child_id), email, child_id, history)
 
 # Age-based constraints (weight in kg, height in meters)
 max_weight_by_month = {
@@ -120,7 +231,12 @@ class ChildData(BaseModel):
     milestones: Optional[List[str]] = []
     allergies: str
     gender: str
-    child_id: Optional[str] = ""
+    child_id: Optional[str] = Field("", validation_alias=AliasChoices("child_id", "_id"))
+
+
+class FollowUp(BaseModel):
+    question: str = Field(min_length=1, max_length=MAX_QUESTION_CHARS)
+    child_id: Optional[str] = Field("", validation_alias=AliasChoices("child_id", "_id"))
 
 def sanitize_input(text: str) -> str:
     """
@@ -132,7 +248,8 @@ def sanitize_input(text: str) -> str:
 
 
 @router.post("/nutrition/")
-async def get_nutrition_assist(child_data: ChildData, request: Request, _: None = Depends(rate_limiter)):
+async def get_nutrition_assist(child_data: ChildData, request: Request, _: None = Depends(rate_limit("nutrition")),
+                               claims: dict = Depends(current_user), db=Depends(get_database)):
     logger.info(f"Received request for child_id={child_data.child_id} to generate nutrition assistance.")
 
     # 3. Sanitize all string fields
@@ -178,14 +295,19 @@ async def get_nutrition_assist(child_data: ChildData, request: Request, _: None
 
     # 4. Send message & handle model errors
     try:
-        response = chat_session.send_message(prompt)
+        response = await generate(prompt, "plan", child_data.child_id)
         logger.info("Received response from model.")
     except Exception as e:
         logger.error("Model Error: Failed to get response", exc_info=True)
         raise HTTPException(status_code=500, detail="AI service unavailable at the moment.")
 
     # 5. Validate model response
-    if not response.text or len(response.text.strip()) < 20:
+    try:
+        text = response.text
+    except ValueError:
+        # No text part, e.g. the response was blocked
+        text = ""
+    if not text or len(text.strip()) < 20:
         logger.error("Model response was empty or too short. Returning default error message.")
         return {
             "diet_plan": {
@@ -200,7 +322,7 @@ async def get_nutrition_assist(child_data: ChildData, request: Request, _: None
         }
 
     # 6. Parse safely
-    sections = response.text.split("\n\n")
+    sections = text.split("\n\n")
     general_advice = []
     diet_suggestions = []
 
@@ -227,17 +349,55 @@ async def get_nutrition_assist(child_data: ChildData, request: Request, _: None
     if diet_suggestions:
         diet_plan["diet_suggestions"] = diet_suggestions
 
+    # Follow-up questions about this child are answered against this plan
+    if child_data.child_id:
+        await start_conversation(db, claims["email"], child_data.child_id, prompt, text)
+
     logger.info(f"Successfully generated nutrition plan for child_id={child_data.child_id}")
 
     return {"diet_plan": diet_plan}
 
 
 # Follow-up question handler
-def ask_follow_up(question):
+@router.post("/nutrition/follow-up/")
+async def ask_follow_up(follow_up: FollowUp, _: None = Depends(rate_limit("nutrition")),
+                        claims: dict = Depends(current_user), db=Depends(get_database)):
     """
-    Handle follow-up questions in the same chat session.
-    :param question: Follow-up question from the parent
-    :return: Model's response
+    Answer a follow-up question in the context of the child's latest plan and
+    recent follow-ups (only this parent's conversation about this child).
     """
-    response = chat_session.send_message(question)
-    return response.text
+    question = sanitize_input(follow_up.question)
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is empty.")
+
+    key = conversation_key(claims["email"], follow_up.child_id) if follow_up.child_id else None
+    version, conversation = None, {"plan": [], "turns": []}
+    if key:
+        version, conversation = await load_conversation(db, key)
+
+    try:
+        contents = conversation["plan"] + conversation["turns"] + [message("user", question)]
+        response = await generate(contents, "follow-up", follow_up.child_id)
+        answer = response.text
+    except Exception:
+        logger.error("Model Error: Failed to answer follow-up", exc_info=True)
+        raise HTTPException(status_code=500, detail="AI service unavailable at the moment.")
+
+    if key:
+        # Only the last HISTORY_MAX_TURNS question/answer pairs are kept
+        conversation["turns"] = (conversation["turns"] + [message("user", question), message("model", answer)])[
+            -2 * HISTORY_MAX_TURNS:]
+        if not await save_conversation(db, key, claims["email"], follow_up.child_id, conversation, version):
+            logger.warning(f"Follow-up for child_id={follow_up.child_id} not stored; conversation changed meanwhile")
+    logger.info(f"Answered follow-up for child_id={follow_up.child_id}")
+    return PlainTextResponse(answer)
+
+
+@router.get("/nutrition/metrics", response_model=dict)
+async def get_model_metrics():
+    calls = model_stats["calls"]
+    return {
+        **model_stats,
+        "mean_latency_seconds": round(model_stats["latency_seconds"] / calls, 4) if calls else None,
+        "mean_prompt_chars": round(model_stats["prompt_chars"] / calls) if calls else None,
+    }
@@ -1,20 +1,21 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, EmailStr
-from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timedelta
-import random, bcrypt
-from lib.email_utils import send_otp_email
+import secrets
+from lib.email_utils import otp_message
+from lib.mail_queue import mail_queue, MailQueueFull
 from lib.jwt_utils import create_access_token
+from lib.database import get_database
+from lib.auth import current_user, bearer_token, revoke_token, token_cache
+from lib.passwords import hasher, HasherBusy
+from lib.rate_limiter import enforce_gap
 from fastapi.responses import JSONResponse
 import os
 import logging
 
-client = MongoClient("mongodb://localhost:27017/")
-db = client.smart_parenting
-users_collection = db.users
-otp_collection = db.otp_verifications
-
+# Collections: db.users and db.otp_verifications, injected per request
 router = APIRouter()
 
 # Models
@@ -26,6 +27,9 @@ class OTPVerification(BaseModel):
     email: EmailStr
     otp: str
 
+class OTPResend(BaseModel):
+    email: EmailStr
+
 # ------------------ Logging Setup ------------------
 
 root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
@@ -45,34 +49,109 @@ if not logger.handlers:
 
 
 
-# Generate and store OTP
-def generate_and_send_otp(email: str):
-    otp = str(random.randint(100000, 999999))
-    otp_collection.delete_many({"email": email})  # Invalidate previous OTPs
-    otp_collection.insert_one({
-        "email": email,
-        "otp": otp,
-        "expires_at": datetime.utcnow() + timedelta(minutes=5)
+# ------------------ OTP ------------------
+# One pending verification per email, keyed by it (_id) and removed by a TTL index once expired.
+# purpose is "signup" (carrying the password hash) or "login" (carrying the user id).
+
+OTP_LIFETIME = timedelta(minutes=5)
+# Matches the resend countdown of the OTP screen
+OTP_RESEND_INTERVAL_SECONDS = float(os.getenv("OTP_RESEND_INTERVAL_SECONDS", "30"))
+
+
+def new_otp() -> str:
+    # Six digits from the OS CSPRNG; random's Mersenne Twister output can be predicted
+    return str(secrets.randbelow(900000) + 100000)
+
+
+def otp_fields(otp: str) -> dict:
+    return {"otp": otp, "expires_at": datetime.utcnow() + OTP_LIFETIME, "delivery": {"status": "queued", "attempts": 0}}
+
+
+async def create_otp(db, email: str, purpose: str, **fields) -> str:
+    # A single upsert replaces whatever was pending for this email
+    otp = new_otp()
+    await db.otp_verifications.replace_one(
+        {"_id": email}, {"email": email, "purpose": purpose, **fields, **otp_fields(otp)}, upsert=True
+    )
+    return otp
+
+
+async def refresh_otp(db, email: str):
+    """New code for the pending verification, keeping its purpose and data; None if nothing is pending."""
+    otp = new_otp()
+    # An expired verification stays expired; the TTL monitor removes it
+    record = await db.otp_verifications.find_one_and_update(
+        {"_id": email, "expires_at": {"$gt": datetime.utcnow()}}, {"$set": otp_fields(otp)}, projection={"_id": 1}
+    )
+    return otp if record is not None else None
+
+
+async def send_otp(db, email: str, otp: str):
+    async def record_delivery(status, attempts, error):
+        # Matched on the code too, so a late status of a replaced code is dropped
+        await db.otp_verifications.update_one({"_id": email, "otp": otp}, {"$set": {"delivery": {
+            "status": status, "attempts": attempts, "error": error, "updated_at": datetime.utcnow()
+        }}})
+
+    # Sent in the background; the response does not wait for SMTP
+    try:
+        mail_queue.enqueue(otp_message(email, otp), on_status=record_delivery)
+    except MailQueueFull:
+        # A code that was never sent must not stay usable
+        await db.otp_verifications.delete_one({"_id": email, "otp": otp})
+        raise
+
+
+async def consume_otp(db, verify: OTPVerification, purpose: str):
+    # Matching and removing in one step lets each code be used once, even by concurrent requests
+    return await db.otp_verifications.find_one_and_delete({
+        "_id": verify.email,
+        "otp": verify.otp,
+        "purpose": purpose,
+        "expires_at": {"$gt": datetime.utcnow()},
     })
-    send_otp_email(email, otp)
+
+
+def hasher_busy(email: str):
+    logger.warning(f"Password hashing saturated, rejecting request for: {email}")
+    return HTTPException(status_code=503, detail="Server busy. Try again shortly.", headers={"Retry-After": "1"})
+
+
+def mail_queue_full(email: str):
+    logger.error(f"Mail queue full, OTP not sent to: {email}")
+    return HTTPException(status_code=503, detail="Failed to send OTP email. Try again shortly.", headers={"Retry-After": "5"})
+
+
+async def rehash_password(db, db_user, password: str):
+    # Stored with an older cost factor; replace it unless the password changed meanwhile
+    try:
+        password_hash = await hasher.hash(password)
+    except HasherBusy:
+        return  # Retried on the next login
+    await db.users.update_one(
+        {"_id": db_user["_id"], "password": db_user["password"]},
+        {"$set": {"password": password_hash}},
+    )
+    logger.info(f"Password rehashed with {hasher.rounds} rounds for: {db_user['email']}")
 
 # ------------------ SIGNUP ------------------
 @router.post("/signup")
-async def signup_request(user: User):
-    if users_collection.find_one({"email": user.email}):
+async def signup_request(user: User, db=Depends(get_database)):
+    if await db.users.find_one({"email": user.email}):
         logger.warning(f"Signup attempt with already registered email: {user.email}")
         raise HTTPException(status_code=400, detail="Email already registered")
 
     logger.info(f"Initiating signup process for: {user.email}")
-    generate_and_send_otp(user.email)
-    password_hash = bcrypt.hashpw(user.password.encode(), bcrypt.gensalt())
-    
-    otp_collection.update_one(
-        {"email": user.email},
-        {"$set": {"password": password_hash.decode()}},
-        upsert=True
-    )
-    logger.info(f"OTP sent and password hash stored for: {user.email}")
+    try:
+        password_hash = await hasher.hash(user.password)
+    except HasherBusy:
+        raise hasher_busy(user.email)
+    otp = await create_otp(db, user.email, "signup", password=password_hash)
+    try:
+        await send_otp(db, user.email, otp)
+    except MailQueueFull:
+        raise mail_queue_full(user.email)
+    logger.info(f"OTP queued and password hash stored for: {user.email}")
 
     return JSONResponse(
         status_code=200,
@@ -84,23 +163,23 @@ async def signup_request(user: User):
 
 
 @router.post("/signup-verify")
-async def signup_verify(verify: OTPVerification):
+async def signup_verify(verify: OTPVerification, db=Depends(get_database)):
     logger.info(f"Verifying signup OTP for: {verify.email}")
-    record = otp_collection.find_one({"email": verify.email})
-
-    if not record or record["otp"] != verify.otp:
-        logger.warning(f"Invalid OTP attempt for: {verify.email}")
-        raise HTTPException(status_code=400, detail="Invalid OTP")
+    record = await consume_otp(db, verify, "signup")
 
-    if datetime.utcnow() > record["expires_at"]:
-        logger.warning(f"Expired OTP attempt for: {verify.email}")
-        raise HTTPException(status_code=400, detail="OTP expired")
+    if not record:
+        logger.warning(f"Invalid or expired OTP attempt for: {verify.email}")
+        raise HTTPException(status_code=400, detail="Invalid or expired OTP")
 
-    users_collection.insert_one({
-        "email": verify.email,
-        "password": record["password"]
-    })
-    otp_collection.delete_many({"email": verify.email})
+    try:
+        await db.users.insert_one({
+            "email": verify.email,
+            "password": record["password"]
+        })
+    except DuplicateKeyError:
+        # users.email is unique; two verifications for the same email can race
+        logger.warning(f"Signup verification for already registered email: {verify.email}")
+        raise HTTPException(status_code=400, detail="Email already registered")
     logger.info(f"Signup completed successfully for: {verify.email}")
     
     return {"message": "Signup successful"}
@@ -108,21 +187,31 @@ async def signup_verify(verify: OTPVerification):
 # ------------------ LOGIN ------------------
 
 @router.post("/login")
-async def login_request(user: User):
+async def login_request(user: User, db=Depends(get_database)):
     logger.info(f"Login attempt for: {user.email}")
-    db_user = users_collection.find_one({"email": user.email})
+    db_user = await db.users.find_one({"email": user.email})
 
     if not db_user or not db_user.get("password"):
         logger.warning(f"Login failed (user not found or password missing): {user.email}")
         raise HTTPException(status_code=400, detail="Invalid email or password")
     
-    if not bcrypt.checkpw(user.password.encode(), db_user["password"].encode()):
+    try:
+        matches = await hasher.verify(user.password, db_user["password"])
+    except HasherBusy:
+        raise hasher_busy(user.email)
+    if not matches:
         logger.warning(f"Invalid password attempt for: {user.email}")
         raise HTTPException(status_code=400, detail="Invalid email or password")
+
+    if hasher.needs_rehash(db_user["password"]):
+        await rehash_password(db, db_user, user.password)
     
     try:
-        generate_and_send_otp(user.email)
-        logger.info(f"OTP sent for login verification to: {user.email}")
+        otp = await create_otp(db, user.email, "login", user_id=db_user["_id"])
+        await send_otp(db, user.email, otp)
+        logger.info(f"OTP queued for login verification to: {user.email}")
+    except MailQueueFull:
+        raise mail_queue_full(user.email)
     except Exception as e:
         logger.error(f"Error sending OTP email to {user.email}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to send OTP email")
@@ -135,25 +224,52 @@ async def login_request(user: User):
         }
     )
 @router.post("/verify-otp")
-async def login_verify(verify: OTPVerification):
+async def login_verify(verify: OTPVerification, db=Depends(get_database)):
     logger.info(f"Verifying login OTP for: {verify.email}")
-    record = otp_collection.find_one({"email": verify.email})
-
-    if not record or record["otp"] != verify.otp:
-        logger.warning(f"Invalid OTP attempt for login: {verify.email}")
-        raise HTTPException(status_code=400, detail="Invalid OTP")
+    record = await consume_otp(db, verify, "login")
 
-    if datetime.utcnow() > record["expires_at"]:
-        logger.warning(f"Expired OTP attempt for login: {verify.email}")
-        raise HTTPException(status_code=400, detail="OTP expired")
+    if not record:
+        logger.warning(f"Invalid or expired OTP attempt for login: {verify.email}")
+        raise HTTPException(status_code=400, detail="Invalid or expired OTP")
 
-    otp_collection.delete_many({"email": verify.email})
-    user = users_collection.find_one({"email": verify.email})
-    token = create_access_token({"email": user["email"]})
+    token = create_access_token({"email": verify.email})
     logger.info(f"Login successful for: {verify.email}")
 
     return {
         "message": "Login successful",
-        "user_id": str(user["_id"]),
+        "user_id": str(record["user_id"]),
         "access_token": token
     }
+
+
+@router.post("/resend-otp")
+async def resend_otp(resend: OTPResend, db=Depends(get_database)):
+    # A new code for the signup or login already in progress, at most once per interval per email
+    await enforce_gap("resend-otp", resend.email, OTP_RESEND_INTERVAL_SECONDS)
+    otp = await refresh_otp(db, resend.email)
+    if otp is None:
+        logger.warning(f"OTP resend without a pending verification for: {resend.email}")
+        raise HTTPException(status_code=400, detail="No pending verification. Please start again.")
+    try:
+        await send_otp(db, resend.email, otp)
+    except MailQueueFull:
+        raise mail_queue_full(resend.email)
+    logger.info(f"OTP resent to: {resend.email}")
+    return {"message": "OTP resent to your email."}
+
+
+# ------------------ LOGOUT ------------------
+
+@router.post("/logout")
+async def logout(request: Request, claims: dict = Depends(current_user), db=Depends(get_database)):
+    # The token stays valid by signature until exp, so it is revoked explicitly
+    await revoke_token(db, bearer_token(request), claims)
+    logger.info(f"Logout for: {claims.get('email')}")
+    return {"message": "Logout successful"}
+
+
+# ------------------ METRICS ------------------
+
+@router.get("/auth/metrics", response_model=dict)
+async def get_auth_metrics():
+    return {"token_cache": token_cache.metrics(), "password_hasher": hasher.metrics()}
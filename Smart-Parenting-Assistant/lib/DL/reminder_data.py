@@ -1,11 +1,8 @@
-from fastapi import APIRouter, HTTPException
-from pymongo import MongoClient
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
+from lib.database import get_database
 
-# Database connection
-client = MongoClient("mongodb://localhost:27017/")
-db = client.smart_parenting
-reminders_collection = db.reminders
+# Database connection: the shared client's database is injected into each handler
 
 # APIRouter instance
 router = APIRouter()
@@ -17,9 +14,9 @@ class Reminder(BaseModel):
     time: str  # 24-hour time format
 
 @router.put("/{title}")
-async def update_reminder(title: str, reminder: Reminder):
+async def update_reminder(title: str, reminder: Reminder, db=Depends(get_database)):
     # Try to find the reminder by its title
-    result = reminders_collection.update_one(
+    result = await db.reminders.update_one(
         {"title": title}, {"$set": reminder.dict()}
     )
     
@@ -31,18 +28,18 @@ async def update_reminder(title: str, reminder: Reminder):
 
 
 @router.post("/")
-async def add_reminder(reminder: Reminder):
-    reminder_id = reminders_collection.insert_one(reminder.dict()).inserted_id
+async def add_reminder(reminder: Reminder, db=Depends(get_database)):
+    reminder_id = (await db.reminders.insert_one(reminder.dict())).inserted_id
     return {"message": "Reminder added successfully", "id": str(reminder_id)}
 
 @router.get("/")
-async def get_reminders():
-    reminders = list(reminders_collection.find({}, {"_id": 0}))
+async def get_reminders(db=Depends(get_database)):
+    reminders = await db.reminders.find({}, {"_id": 0}).to_list(None)
     return reminders
 
 @router.delete("/{title}")
-async def delete_reminder(title: str):
-    result = reminders_collection.delete_one({"title": title})
+async def delete_reminder(title: str, db=Depends(get_database)):
+    result = await db.reminders.delete_one({"title": title})
     if result.deleted_count > 0:
         return {"message": "Reminder deleted successfully"}
     return {"message": "Reminder not found"}, 404
@@ -1,6 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import os
+import asyncio
+import logging
 from dotenv import load_dotenv
 
 # Import routers from child management and other modules
@@ -8,14 +11,63 @@ from lib.DL.childManagement import router as child_management_router
 from lib.DL.registration import router as registration_router
 from lib.DL.reminder_data import router as reminder_data_router
 from lib.DL.nutition import router as nutrition_data_router
-from lib.DL.growthMonitor import router as growth_monitor_router
+from lib.DL.growthMonitor import router as growth_monitor_router, growth_batcher
+from lib.model_registry import model_registry
+from lib.child_records import run_background_migration
+from lib.database import create_client, database_name
+from lib.indexes import ensure_indexes
+from lib.rate_limiter import configure_backend as configure_rate_limiter
+from lib.auth import sync_revocations
+from lib.mail_queue import mail_queue
 
 
 # Load environment variables (like database URI or port)
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Verify and load the growth model once per worker instead of per request
+    try:
+        await asyncio.to_thread(model_registry.load)
+    except Exception as e:
+        logging.getLogger("child_growth").critical(f"Growth model not loaded at startup: {e}")
+    # Changed artifacts are verified and loaded in a worker thread, never on a request
+    model_watch = asyncio.create_task(model_registry.watch())
+    # One async client (and connection pool) per worker, shared by every router
+    client = create_client()
+    app.state.db = client[database_name()]
+    # Idempotent; a missing index only costs performance, so startup continues without it
+    try:
+        failed = await ensure_indexes(app.state.db)
+        if failed:
+            logging.getLogger("child_management").error(f"{failed} indexes could not be created; see the database log")
+    except Exception as e:
+        logging.getLogger("child_management").error(f"Could not create indexes: {e}")
+    configure_rate_limiter(app.state.db)
+    growth_batcher.start()
+    mail_queue.start()
+    # Logouts on other workers reach this worker's token cache within a few seconds
+    revocations = asyncio.create_task(sync_revocations(app.state.db))
+    # Opt-in: rewrite legacy child documents to the sealed format while serving
+    migration = None
+    if os.getenv("CHILD_MIGRATION_BACKGROUND", "").lower() in ("1", "true", "yes"):
+        migration = asyncio.create_task(run_background_migration(app.state.db.children))
+    yield
+    for task in (migration, revocations, model_watch):
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await growth_batcher.stop()
+    await mail_queue.stop()
+    client.close()
+
+
 # Initialize the main FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Middleware setup (similar to CORS in Flask)
 app.add_middleware(
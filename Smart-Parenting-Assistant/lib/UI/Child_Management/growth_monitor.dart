@@ -282,25 +282,31 @@ class _GrowthMonitorPageState extends State<GrowthMonitorPage> {
     if (_selectedChild == null) return;
 
     try {
-      final response = await http.get(
-        Uri.parse("https://127.0.0.1:8000/growth/getGrowthData/$childId"),
-      );
+      final List<Map<String, dynamic>> allGrowthData = [];
+      String? cursor;
 
-      if (response.statusCode == 200) {
-        // Use 200 for successful GET
-        final decodedResponse = jsonDecode(response.body);
+      // The history is paginated; follow next_cursor until the last page
+      do {
+        final uri = Uri.parse(
+                "https://127.0.0.1:8000/growth/getGrowthData/$childId")
+            .replace(queryParameters: cursor == null ? null : {'cursor': cursor});
+        final response = await http.get(uri);
 
-        final allGrowthData =
-            List<Map<String, dynamic>>.from(decodedResponse['data']);
+        if (response.statusCode != 200) {
+          throw Exception('Failed to fetch growth data');
+        }
 
-        setState(() {
-          _growthData = allGrowthData
-              .where((data) => data['child_id'] == _selectedChild!['id'])
-              .toList();
-        });
-      } else {
-        throw Exception('Failed to fetch growth data');
-      }
+        final decodedResponse = jsonDecode(response.body);
+        allGrowthData
+            .addAll(List<Map<String, dynamic>>.from(decodedResponse['data']));
+        cursor = decodedResponse['next_cursor'];
+      } while (cursor != null);
+
+      setState(() {
+        _growthData = allGrowthData
+            .where((data) => data['child_id'] == _selectedChild!['id'])
+            .toList();
+      });
     } catch (e) {
       if (kDebugMode) {
         print(e);
@@ -161,10 +161,15 @@ class _NutritionAssistPageState extends State<NutritionAssistPage> {
       isLoading = true;
     });
 
+    SharedPreferences prefs = await SharedPreferences.getInstance();
+    String? token = prefs.getString('accessToken');
     final response = await http.post(
       Uri.parse('https://127.0.0.1:8000/nutrition/follow-up/'),
-      headers: {"Content-Type": "application/json"},
-      body: jsonEncode({"question": question}),
+      headers: {
+        'Authorization': 'Bearer $token',
+        "Content-Type": "application/json"
+      },
+      body: jsonEncode({"question": question, "child_id": selectedChildId}),
     );
 
     setState(() {
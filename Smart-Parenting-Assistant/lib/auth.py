@@ -0,0 +1,170 @@
+"""
+Bearer-token authentication dependency with a verified-claims cache.
+
+Verifying a JWT decodes it and recomputes its HMAC on every request. Verified
+claims are instead cached per worker, keyed by a SHA-256 digest of the token
+(the token itself is never stored), until the token's exp. The cache is an LRU
+bounded by AUTH_CACHE_MAX_ENTRIES.
+
+Revocation: logout records the token digest in the revoked_tokens collection
+(expiring with the token) and in the local cache, so it is rejected at once by
+this worker. Other workers check the collection when they first see a token
+and pull new revocations every AUTH_REVOCATION_SYNC_SECONDS. The signing key is
+fixed in lib.jwt_utils, so rotating it means a restart, which starts every
+worker with an empty cache.
+
+Hit, miss, eviction and revocation counters are served at GET /auth/metrics.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from fastapi import Request, HTTPException, Depends
+from lib.jwt_utils import verify_token
+from lib.database import get_database
+
+logger = logging.getLogger("authentication")
+
+MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+MAX_TTL_SECONDS = float(os.getenv("AUTH_CACHE_MAX_TTL_SECONDS", "3600"))  # for tokens without exp
+REVOCATION_SYNC_SECONDS = float(os.getenv("AUTH_REVOCATION_SYNC_SECONDS", "5"))
+REVOKED_COLLECTION = "revoked_tokens"
+
+
+def _timestamp(date: datetime) -> float:
+    # MongoDB returns naive UTC datetimes
+    return date.replace(tzinfo=timezone.utc).timestamp()
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_ttl: float = MAX_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()  # digest -> (claims, expiry in epoch seconds), least recent first
+        self._revoked = {}  # digest -> expires at; kept until the token would have expired anyway
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "revoked_rejections": 0, "evictions": 0}
+
+    def get(self, digest: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[digest]
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, digest: str, claims: dict):
+        expires_at = claims.get("exp") or time.time() + self.max_ttl
+        with self._lock:
+            if digest in self._revoked:
+                return
+            self._entries[digest] = (claims, float(expires_at))
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def revoke(self, digest: str, expires_at: float):
+        now = time.time()
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._revoked[digest] = expires_at
+            # Revocations of tokens that have expired anyway are no longer needed
+            for stale in [d for d, exp in self._revoked.items() if exp <= now]:
+                del self._revoked[stale]
+
+    def is_revoked(self, digest: str) -> bool:
+        with self._lock:
+            if digest in self._revoked:
+                self._stats["revoked_rejections"] += 1
+                return True
+            return False
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "revoked": len(self._revoked),
+                "max_entries": self.max_entries,
+            }
+
+
+token_cache = TokenCache()
+
+
+async def verify_cached(token: str, db):
+    """Claims of a valid, unrevoked token (from the cache when possible), else None."""
+    digest = token_digest(token)
+    if token_cache.is_revoked(digest):
+        return None
+    claims = token_cache.get(digest)
+    if claims is None:
+        # First sight of this token in this worker: it may have been revoked by another one
+        revoked = await db[REVOKED_COLLECTION].find_one({"_id": digest}, {"expires_at": 1})
+        if revoked is not None:
+            token_cache.revoke(digest, _timestamp(revoked["expires_at"]))
+            return None
+        claims = verify_token(token)
+        if claims is not None:
+            token_cache.put(digest, claims)
+    return claims
+
+
+def bearer_token(request: Request) -> str:
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid token")
+    return auth_header.split(" ")[1]
+
+
+async def current_user(request: Request, db=Depends(get_database)) -> dict:
+    """Dependency: claims of the request's bearer token (401 if missing, invalid or revoked)."""
+    claims = await verify_cached(bearer_token(request), db)
+    if not claims:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return claims
+
+
+async def revoke_token(db, token: str, claims: dict):
+    """Logout hook: reject the token everywhere from now until it expires."""
+    digest = token_digest(token)
+    expires_at = float(claims.get("exp") or time.time() + MAX_TTL_SECONDS)
+    token_cache.revoke(digest, expires_at)
+    await db[REVOKED_COLLECTION].update_one(
+        {"_id": digest},
+        {"$set": {"expires_at": datetime.utcfromtimestamp(expires_at), "revoked_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+async def sync_revocations(db, interval: float = REVOCATION_SYNC_SECONDS):
+    """Background task: apply revocations made by other workers."""
+    since = datetime.utcnow()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            started = datetime.utcnow()
+            async for doc in db[REVOKED_COLLECTION].find({"revoked_at": {"$gte": since}}):
+                token_cache.revoke(doc["_id"], _timestamp(doc["expires_at"]))
+            # Overlapping windows tolerate clock skew between workers; revoking twice is harmless
+            since = started - timedelta(seconds=interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Could not sync token revocations: {e}")
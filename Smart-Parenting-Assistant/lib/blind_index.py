@@ -0,0 +1,148 @@
+"""
+Deterministic keyed-HMAC "blind indexes" for encrypted child fields.
+
+Child fields are encrypted with random nonces, so equal values never produce
+equal ciphertexts and cannot be queried. For a few attributes a truncated
+HMAC-SHA256 of the normalized value is stored next to the ciphertext:
+
+    {"bidx": {"name": "<hex>", "dob": "<hex>", "gender": "<hex>"}}
+
+Equality searches hash the query value the same way and hit an index. Only
+exact matches (after normalization) are possible; the key never leaves the
+server. Existing documents are filled in by:
+
+    python -m lib.blind_index backfill [--batch-size 500]
+"""
+import os
+import sys
+import hmac
+import asyncio
+import hashlib
+import argparse
+import logging
+import unicodedata
+from pymongo import IndexModel, UpdateOne
+from lib.encryption_utils import key
+from lib.database import create_client, database_name
+
+logger = logging.getLogger("child_records")
+
+# Separate key so blind indexes reveal nothing about the encryption keys
+index_key = hmac.new(key, b"child-blind-index-v1", hashlib.sha256).digest()
+
+# 128 bits: collisions stay negligible while the stored value is not the full MAC
+DIGEST_BYTES = 16
+
+BACKFILL_BATCH_SIZE = int(os.getenv("BLIND_INDEX_BATCH_SIZE", "500"))
+
+
+def normalize_name(value) -> str:
+    return " ".join(unicodedata.normalize("NFKC", str(value)).casefold().split())
+
+
+def normalize_dob(value) -> str:
+    return str(value).strip().split("T")[0]
+
+
+def normalize_gender(value) -> str:
+    return str(value).strip().lower()
+
+
+# child field -> (key under "bidx", normalizer)
+INDEXED_FIELDS = {
+    "name": ("name", normalize_name),
+    "date_of_birth": ("dob", normalize_dob),
+    "gender": ("gender", normalize_gender),
+}
+
+
+def blind_index(field: str, value) -> str:
+    index_name, normalize = INDEXED_FIELDS[field]
+    message = f"{index_name}:{normalize(value)}".encode()
+    return hmac.new(index_key, message, hashlib.sha256).digest()[:DIGEST_BYTES].hex()
+
+
+def blind_indexes(fields: dict) -> dict:
+    """The "bidx" sub-document for a child's plaintext fields."""
+    return {
+        index_name: blind_index(field, fields[field])
+        for field, (index_name, _) in INDEXED_FIELDS.items()
+        if fields.get(field) is not None
+    }
+
+
+def search_filter(**values) -> dict:
+    """Mongo filter for exact matches on indexed fields; None values are ignored."""
+    return {
+        f"bidx.{INDEXED_FIELDS[field][0]}": blind_index(field, value)
+        for field, value in values.items()
+        if value is not None
+    }
+
+
+# Searches are scoped to a parent; the name index also serves plain parent listings
+BLIND_INDEXES = [
+    IndexModel([("parentId", 1), (f"bidx.{index_name}", 1)], name=f"parent_bidx_{index_name}")
+    for index_name, _ in INDEXED_FIELDS.values()
+]
+
+
+async def ensure_blind_indexes(collection):
+    await collection.create_indexes(BLIND_INDEXES)
+
+
+async def backfill_batch(collection, batch_size: int = BACKFILL_BATCH_SIZE, after=None) -> tuple:
+    """Add blind indexes to the next batch of documents without them; returns (scanned, updated, last _id)."""
+    # Deferred: child_records imports this module
+    from lib.child_records import open_children
+
+    query = {"bidx": {"$exists": False}}
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    docs = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(None)
+    if not docs:
+        return 0, 0, after
+
+    operations = []
+    for doc, fields in zip(docs, open_children(docs)):
+        # Writers add bidx when they seal a record, so never overwrite one that appeared meanwhile
+        operations.append(UpdateOne({"_id": doc["_id"], "bidx": {"$exists": False}},
+                                    {"$set": {"bidx": blind_indexes(fields)}}))
+    updated = (await collection.bulk_write(operations, ordered=False)).modified_count
+    logger.info(f"Backfilled blind indexes on {updated} child records")
+    return len(docs), updated, docs[-1]["_id"]
+
+
+async def backfill(collection, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    total, after = 0, None
+    while True:
+        scanned, updated, after = await backfill_batch(collection, batch_size, after)
+        total += updated
+        if scanned < batch_size:
+            return total
+
+
+async def run_backfill(mongo_uri: str = None, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    client = create_client(mongo_uri)
+    try:
+        collection = client[database_name()].children
+        await ensure_blind_indexes(collection)
+        return await backfill(collection, batch_size)
+    finally:
+        client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Blind-index maintenance for child records")
+    sub = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = sub.add_parser("backfill", help="Add blind indexes to child documents that lack them")
+    backfill_parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    backfill_parser.add_argument("--mongo-uri", default=None, help="Defaults to MONGO_URI")
+    args = parser.parse_args(argv)
+
+    print(f"Blind indexes added to {asyncio.run(run_backfill(args.mongo_uri, args.batch_size))} child records")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
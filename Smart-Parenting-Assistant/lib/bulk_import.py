@@ -0,0 +1,160 @@
+"""
+Streaming NDJSON/CSV import shared by the bulk import endpoints.
+
+The request body is read chunk by chunk and parsed a line at a time. Rows are
+validated with the endpoint's pydantic model, and valid ones are handed to a
+writer IMPORT_CHUNK_SIZE at a time, so memory is bounded by one chunk whatever
+the size of the upload. Rejected rows are reported by line number (the first
+IMPORT_MAX_ERRORS in full, all of them in the count).
+
+CSV bodies need a header row naming the model fields; a field may span lines
+when quoted. NDJSON bodies hold one JSON object per line.
+"""
+import os
+import csv
+import json
+import codecs
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+IMPORT_MAX_ROW_CHARS = int(os.getenv("IMPORT_MAX_ROW_CHARS", "65536"))
+
+
+class ImportStopped(Exception):
+    """The rest of the body cannot be parsed; rows before it were imported."""
+
+    def __init__(self, row: int, detail: str):
+        super().__init__(detail)
+        self.row = row
+        self.detail = detail
+
+
+def detect_format(content_type: str, requested: str = None) -> str:
+    if requested:
+        return requested
+    return "csv" if content_type and "csv" in content_type.lower() else "ndjson"
+
+
+async def iter_lines(chunks):
+    """(line number, text) for each line of a UTF-8 byte stream."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    number = 0
+    try:
+        async for chunk in chunks:
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                number += 1
+                yield number, line.rstrip("\r")
+            if len(pending) > IMPORT_MAX_ROW_CHARS:
+                raise ImportStopped(number + 1, f"Row longer than {IMPORT_MAX_ROW_CHARS} characters; import stopped")
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise ImportStopped(number + 1, "Body is not valid UTF-8; import stopped")
+    if pending:
+        yield number + 1, pending.rstrip("\r")
+
+
+async def iter_records(chunks, fmt: str):
+    """(line number, record, error) per data row; exactly one of record and error is None."""
+    if fmt == "ndjson":
+        async for number, line in iter_lines(chunks):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield number, None, f"Invalid JSON: {e.msg}"
+                continue
+            if not isinstance(record, dict):
+                yield number, None, "Row must be a JSON object"
+                continue
+            yield number, record, None
+        return
+
+    header = None
+    pending, start = [], None
+    async for number, line in iter_lines(chunks):
+        if not pending:
+            if not line.strip():
+                continue
+            start = number
+        pending.append(line)
+        text = "\n".join(pending)
+        if text.count('"') % 2:
+            # Inside a quoted field that continues on the next line
+            if len(text) > IMPORT_MAX_ROW_CHARS:
+                raise ImportStopped(start, f"Row longer than {IMPORT_MAX_ROW_CHARS} characters; import stopped")
+            continue
+        pending = []
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, None, f"Expected {len(header)} columns, found {len(values)}"
+            continue
+        yield start, dict(zip(header, values)), None
+    if pending:
+        yield start, None, "Unterminated quoted field"
+
+
+def validation_detail(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+async def insert_chunk(collection, documents: list, rows: list) -> tuple:
+    """Unordered insert_many; returns (indexes inserted, [(row, error)] for the rest)."""
+    try:
+        await collection.insert_many(documents, ordered=False)
+        return list(range(len(documents))), []
+    except BulkWriteError as e:
+        failed = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+        inserted = [i for i in range(len(documents)) if i not in failed]
+        return inserted, [(rows[i], f"Write failed: {message}") for i, message in failed.items()]
+
+
+async def run_import(chunks, fmt: str, model, write_chunk, chunk_size: int = IMPORT_CHUNK_SIZE,
+                     max_errors: int = IMPORT_MAX_ERRORS) -> dict:
+    """
+    Validate rows from the body with model and pass them to write_chunk as
+    [(line number, model instance)]; write_chunk returns (rows written,
+    [(line number, error)]).
+    """
+    report = {"imported": 0, "failed": 0, "errors": [], "stopped": False}
+
+    def reject(row, detail):
+        report["failed"] += 1
+        if len(report["errors"]) < max_errors:
+            report["errors"].append({"row": row, "detail": detail})
+
+    batch = []
+
+    async def flush():
+        written, failures = await write_chunk(batch)
+        report["imported"] += written
+        for row, detail in failures:
+            reject(row, detail)
+        batch.clear()
+
+    try:
+        async for row, record, error in iter_records(chunks, fmt):
+            if error is not None:
+                reject(row, error)
+                continue
+            try:
+                batch.append((row, model(**record)))
+            except ValidationError as e:
+                reject(row, validation_detail(e))
+                continue
+            if len(batch) >= chunk_size:
+                await flush()
+    except ImportStopped as e:
+        reject(e.row, e.detail)
+        report["stopped"] = True
+    if batch:
+        await flush()
+    return report
@@ -0,0 +1,136 @@
+"""
+In-process LRU cache of decrypted child records.
+
+Entries are keyed by the child _id and the document's version counter ("ver",
+incremented by every write), so a worker can never serve a record another
+worker has since changed: readers fetch only {_id, parentId, ver} and decrypt
+the full document just for misses. Writers in this process also invalidate
+explicitly so stale plaintext does not linger. The cache is bounded by entry
+count and approximate bytes, and entries can expire after a TTL.
+"""
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from lib.child_records import open_children
+
+MAX_ENTRIES = int(os.getenv("CHILD_CACHE_MAX_ENTRIES", "10000"))
+MAX_BYTES = int(os.getenv("CHILD_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv("CHILD_CACHE_TTL_SECONDS", "600"))  # 0 disables expiry
+
+# Enough to check the cache; the sealed payload is only fetched on a miss
+STUB_PROJECTION = {"parentId": 1, "ver": 1}
+
+
+def record_size(record: dict) -> int:
+    return sys.getsizeof(record) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in record.items())
+
+
+class ChildRecordCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl_seconds=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()  # child_id -> (version, record, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, child_id: str, version: int):
+        with self._lock:
+            entry = self._entries.get(child_id)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            cached_version, record, _, stored_at = entry
+            if cached_version != version:
+                self._stats["stale"] += 1
+                self._stats["misses"] += 1
+                self._drop(child_id)
+                return None
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                self._drop(child_id)
+                return None
+            self._entries.move_to_end(child_id)
+            self._stats["hits"] += 1
+            return dict(record)
+
+    def put(self, child_id: str, version: int, record: dict):
+        size = record_size(record)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if child_id in self._entries:
+                self._drop(child_id)
+            self._entries[child_id] = (version, dict(record), size, time.monotonic())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, child_id: str):
+        with self._lock:
+            if child_id in self._entries:
+                self._drop(child_id)
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, child_id: str):
+        _, _, size, _ = self._entries.pop(child_id)
+        self._bytes -= size
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            }
+
+
+async def load_children(collection, query: dict, cache: "ChildRecordCache") -> list:
+    """
+    (stub, decrypted record) for every child matching query, in query order.
+    Stubs carry _id, parentId and ver; only cache misses are fetched in full
+    (one extra $in round trip) and decrypted.
+    """
+    stubs = await collection.find(query, STUB_PROJECTION).to_list(None)
+    records = {}
+    misses = []
+    for stub in stubs:
+        child_id = str(stub["_id"])
+        record = cache.get(child_id, stub.get("ver", 0))
+        if record is None:
+            misses.append(stub["_id"])
+        else:
+            records[child_id] = record
+
+    if misses:
+        documents = await collection.find({"_id": {"$in": misses}}).to_list(None)
+        for doc, record in zip(documents, open_children(documents)):
+            child_id = str(doc["_id"])
+            cache.put(child_id, doc.get("ver", 0), record)
+            records[child_id] = record
+
+    # A child deleted between the two queries is simply left out
+    return [(stub, records[str(stub["_id"])]) for stub in stubs if str(stub["_id"]) in records]
+
+
+async def load_child(collection, child_id, cache: "ChildRecordCache"):
+    found = await load_children(collection, {"_id": child_id}, cache)
+    return found[0] if found else (None, None)
+
+
+child_cache = ChildRecordCache()
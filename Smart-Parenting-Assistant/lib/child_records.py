@@ -0,0 +1,232 @@
+"""
+Versioned storage format for child documents.
+
+Legacy (v1) documents hold each sensitive field as its own base64 AES-CBC
+string. v2 documents serialize all sensitive fields together and seal them with
+one AES-GCM operation into a binary envelope:
+
+    {"_id": ..., "parentId": "...", "enc": {"v": 2, "n": <12-byte nonce>, "c": <ciphertext + tag>}, "bidx": {...}}
+
+parentId stays in clear for indexing; it and the document _id are bound to the
+envelope as associated data, so an envelope cannot be moved to another child or
+parent. bidx holds blind indexes for search (see lib.blind_index).
+
+Readers accept both versions. Legacy documents are rewritten when they are
+next updated, or in batches by the migrator:
+
+    python -m lib.child_records migrate [--batch-size 500] [--dry-run]
+"""
+import os
+import sys
+import json
+import hmac
+import asyncio
+import hashlib
+import argparse
+import logging
+from bson import Binary
+from pymongo import ReplaceOne
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from lib.encryption_utils import key, decrypt_records
+from lib.blind_index import blind_indexes
+from lib.database import create_client, database_name
+
+logger = logging.getLogger("child_records")
+
+RECORD_VERSION = 2
+NONCE_BYTES = 12
+
+# Everything except parentId is sensitive
+CHILD_FIELDS = ("name", "date_of_birth", "gender", "allergies", "weight", "height")
+
+# Separate key for the envelope so CBC and GCM never share one. The AESGCM
+# object keeps its key schedule, so sealing and opening are one OpenSSL call each
+record_key = hmac.new(key, b"child-record-v2", hashlib.sha256).digest()
+_aead = AESGCM(record_key)
+
+MIGRATION_BATCH_SIZE = int(os.getenv("CHILD_MIGRATION_BATCH_SIZE", "500"))
+MIGRATION_PAUSE_SECONDS = float(os.getenv("CHILD_MIGRATION_PAUSE_SECONDS", "0.5"))
+# Re-reads of a child whose document changed between read and write before giving up
+WRITE_ATTEMPTS = int(os.getenv("CHILD_WRITE_ATTEMPTS", "3"))
+
+
+class StaleChildRecord(Exception):
+    """The child document changed after it was read, so it was not overwritten."""
+
+
+def _associated_data(child_id, parent_id) -> bytes:
+    return f"{child_id}:{parent_id}".encode()
+
+
+def is_legacy(doc) -> bool:
+    return "enc" not in doc
+
+
+def seal_value(value, associated_data: bytes) -> dict:
+    """Envelope ({"v", "n", "c"}) of any JSON-serializable value, bound to associated_data."""
+    payload = json.dumps(value, separators=(",", ":")).encode()
+    nonce = os.urandom(NONCE_BYTES)
+    return {"v": RECORD_VERSION, "n": Binary(nonce), "c": Binary(_aead.encrypt(nonce, payload, associated_data))}
+
+
+def open_value(envelope: dict, associated_data: bytes):
+    if envelope.get("v") != RECORD_VERSION:
+        raise ValueError(f"unsupported envelope version {envelope.get('v')}")
+    try:
+        payload = _aead.decrypt(bytes(envelope["n"]), bytes(envelope["c"]), associated_data)
+    except InvalidTag:
+        raise ValueError("failed authentication")
+    return json.loads(payload)
+
+
+def seal_child(child_id, parent_id: str, fields: dict) -> dict:
+    """Envelope fields of a child document; store them with $set or as the whole document."""
+    return {
+        "parentId": parent_id,
+        "enc": seal_value({name: fields[name] for name in CHILD_FIELDS}, _associated_data(child_id, parent_id)),
+        # Searchable HMACs of selected fields, kept in step with the envelope
+        "bidx": blind_indexes(fields),
+    }
+
+
+def version_filter(doc) -> dict:
+    """Matches the document only at the version ("ver") it was read at."""
+    return {"_id": doc["_id"], "ver": doc["ver"] if "ver" in doc else {"$exists": False}}
+
+
+def reseal_update(doc, parent_id: str, fields: dict) -> dict:
+    """Update that replaces the whole sealed record (migrating a legacy document) and bumps its version."""
+    return {
+        "$set": seal_child(doc["_id"], parent_id, fields),
+        "$unset": {field: "" for field in CHILD_FIELDS},
+        "$inc": {"ver": 1},
+    }
+
+
+async def reseal_child(collection, doc, parent_id: str, fields: dict, session=None):
+    """Reseal a child read as doc, unless another write changed it since; raises StaleChildRecord then."""
+    result = await collection.update_one(version_filter(doc), reseal_update(doc, parent_id, fields), session=session)
+    if not result.matched_count:
+        raise StaleChildRecord(f"Child {doc['_id']} changed since it was read")
+    return result
+
+
+def _open_envelope(doc) -> dict:
+    try:
+        return open_value(doc["enc"], _associated_data(doc["_id"], doc.get("parentId")))
+    except ValueError as e:
+        raise ValueError(f"Child record {doc['_id']}: {e}")
+
+
+def open_children(docs) -> list:
+    """Plain sensitive fields of each document, whichever format it is stored in."""
+    docs = list(docs)
+    results = [None] * len(docs)
+    legacy = [i for i, doc in enumerate(docs) if is_legacy(doc)]
+    # Legacy fields of all documents go through one bulk CBC decrypt
+    for i, fields in zip(legacy, decrypt_records([docs[i] for i in legacy], CHILD_FIELDS)):
+        results[i] = {name: fields[name] for name in CHILD_FIELDS if name in fields}
+    for i, doc in enumerate(docs):
+        if results[i] is None:
+            results[i] = _open_envelope(doc)
+    return results
+
+
+def open_child(doc) -> dict:
+    return open_children([doc])[0]
+
+
+async def migrate_batch(collection, batch_size: int = MIGRATION_BATCH_SIZE, after=None) -> tuple:
+    """
+    Rewrite the next batch_size legacy documents (by _id, after the given one) as v2.
+    Returns (documents scanned, documents migrated, last _id scanned).
+    """
+    query = {"enc": {"$exists": False}}
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    docs = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(None)
+    if not docs:
+        return 0, 0, after
+
+    operations = []
+    for doc, fields in zip(docs, open_children(docs)):
+        try:
+            fields["weight"] = float(fields["weight"])
+            fields["height"] = float(fields["height"])
+            sealed = seal_child(doc["_id"], doc.get("parentId"), fields)
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"Child {doc['_id']} has missing or invalid fields; left in legacy format")
+            continue
+        replacement = {k: v for k, v in doc.items() if k not in CHILD_FIELDS}
+        replacement.update(sealed)
+        replacement["ver"] = doc.get("ver", 0) + 1
+        # Only replace the exact version that was read, so a concurrent update is never lost
+        expected = {"_id": doc["_id"], **{name: doc[name] for name in CHILD_FIELDS}}
+        operations.append(ReplaceOne(expected, replacement))
+
+    migrated = 0
+    if operations:
+        migrated = (await collection.bulk_write(operations, ordered=False)).modified_count
+        logger.info(f"Migrated {migrated} child records to v{RECORD_VERSION}")
+    return len(docs), migrated, docs[-1]["_id"]
+
+
+async def migrate(collection, batch_size: int = MIGRATION_BATCH_SIZE, pause: float = 0.0) -> int:
+    total, after = 0, None
+    while True:
+        scanned, migrated, after = await migrate_batch(collection, batch_size, after)
+        total += migrated
+        if scanned < batch_size:
+            return total
+        if pause:
+            await asyncio.sleep(pause)
+
+
+async def run_background_migration(collection, batch_size: int = MIGRATION_BATCH_SIZE,
+                                   pause: float = MIGRATION_PAUSE_SECONDS):
+    """Migrate legacy children a batch at a time alongside requests, pausing between batches."""
+    total, after = 0, None
+    try:
+        while True:
+            scanned, migrated, after = await migrate_batch(collection, batch_size, after)
+            total += migrated
+            if scanned < batch_size:
+                break
+            await asyncio.sleep(pause)
+        logger.info(f"Background child record migration finished ({total} migrated)")
+    except asyncio.CancelledError:
+        logger.info(f"Background child record migration stopped ({total} migrated)")
+        raise
+    except Exception:
+        logger.exception("Background child record migration failed")
+
+
+async def run_migration(mongo_uri: str = None, batch_size: int = MIGRATION_BATCH_SIZE,
+                        pause: float = 0.0, dry_run: bool = False) -> str:
+    client = create_client(mongo_uri)
+    try:
+        collection = client[database_name()].children
+        if dry_run:
+            return f"{await collection.count_documents({'enc': {'$exists': False}})} legacy child records found"
+        return f"{await migrate(collection, batch_size, pause)} legacy child records migrated"
+    finally:
+        client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Child record format maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = sub.add_parser("migrate", help=f"Rewrite legacy child documents as v{RECORD_VERSION}")
+    migrate_parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    migrate_parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="Only count legacy documents")
+    migrate_parser.add_argument("--mongo-uri", default=None, help="Defaults to MONGO_URI")
+    args = parser.parse_args(argv)
+
+    print(asyncio.run(run_migration(args.mongo_uri, args.batch_size, args.pause, args.dry_run)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Shared asynchronous MongoDB client.
+
+One Motor client, and so one connection pool, is created per worker in the app
+lifespan (lib/DL/server.py) and handed to the routers through the get_database
+dependency. Pool sizes and timeouts come from the environment:
+
+    MONGO_URI                          mongodb://localhost:27017/
+    MONGO_DB_NAME                      smart_parenting
+    MONGO_MAX_POOL_SIZE                100
+    MONGO_MIN_POOL_SIZE                0
+    MONGO_MAX_IDLE_TIME_MS             60000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS  5000
+    MONGO_CONNECT_TIMEOUT_MS           5000
+    MONGO_SOCKET_TIMEOUT_MS            30000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS        5000   (how long a request waits for a pooled connection)
+
+Optional write tuning:
+
+    MONGO_WRITE_CONCERN_W              server default (e.g. 1 or majority)
+    MONGO_WRITE_CONCERN_J              server default (true waits for the journal)
+    MONGO_WRITE_CONCERN_TIMEOUT_MS     none
+    MONGO_TRANSACTIONS                 off; 1 makes apply_writes atomic (needs a replica set)
+"""
+import os
+from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorClient
+
+DEFAULT_URI = "mongodb://localhost:27017/"
+DEFAULT_DB_NAME = "smart_parenting"
+
+
+def client_options() -> dict:
+    # Read at call time so values loaded from .env after import still apply
+    return {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+        **write_concern_options(),
+    }
+
+
+def write_concern_options() -> dict:
+    options = {}
+    w = os.getenv("MONGO_WRITE_CONCERN_W")
+    if w:
+        options["w"] = int(w) if w.isdigit() else w
+    journal = os.getenv("MONGO_WRITE_CONCERN_J")
+    if journal:
+        options["journal"] = journal.lower() in ("1", "true", "yes")
+    timeout = os.getenv("MONGO_WRITE_CONCERN_TIMEOUT_MS")
+    if timeout:
+        options["wTimeoutMS"] = int(timeout)
+    return options
+
+
+def transactions_enabled() -> bool:
+    return os.getenv("MONGO_TRANSACTIONS", "").lower() in ("1", "true", "yes")
+
+
+def create_client(uri: str = None, **overrides) -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(uri or os.getenv("MONGO_URI", DEFAULT_URI), **{**client_options(), **overrides})
+
+
+def database_name() -> str:
+    return os.getenv("MONGO_DB_NAME", DEFAULT_DB_NAME)
+
+
+def get_database(request: Request):
+    """FastAPI dependency: the database of the client opened in the app lifespan."""
+    return request.app.state.db
+
+
+async def apply_writes(db, *writes) -> list:
+    """
+    Apply the writes of one mutation; each is a function taking a session (or
+    None) and returning an awaitable. Returns their results in order.
+
+    Pass the parent document's write first and its dependents after it. With
+    transactions enabled they commit or roll back together (retried on
+    transient errors). Otherwise they run one after another and the first
+    failure stops the rest, so dependents are never written for a parent
+    write that failed (a dependent failing still leaves the earlier writes).
+    """
+    async def run(session):
+        return [await write(session) for write in writes]
+
+    if transactions_enabled():
+        async with await db.client.start_session() as session:
+            return await session.with_transaction(run)
+    return await run(None)
@@ -1,11 +1,17 @@
 import smtplib
+import time
 from email.mime.text import MIMEText
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-def send_otp_email(receiver_email, otp):
+# An idle session is likely to have been dropped by the server; reopen instead of finding out mid-send
+EMAIL_IDLE_SECONDS = float(os.getenv("EMAIL_IDLE_SECONDS", "60"))
+EMAIL_TIMEOUT_SECONDS = float(os.getenv("EMAIL_TIMEOUT_SECONDS", "10"))
+
+
+def otp_message(receiver_email, otp):
     subject = "Your OTP Verification Code"
     body = f"Your OTP code is: {otp}. It will expire in 5 minutes."
 
@@ -13,14 +19,67 @@ def send_otp_email(receiver_email, otp):
     msg["Subject"] = subject
     msg["From"] = os.getenv("EMAIL_ADDRESS")
     msg["To"] = receiver_email
+    return msg
+
 
-    try:
-        server = smtplib.SMTP(os.getenv("EMAIL_HOST"), int(os.getenv("EMAIL_PORT")))
-        server.starttls()
-        server.login(os.getenv("EMAIL_ADDRESS"), os.getenv("EMAIL_PASSWORD"))
-        server.sendmail(os.getenv("EMAIL_ADDRESS"), receiver_email, msg.as_string())
-        server.quit()
+def is_permanent(error: Exception) -> bool:
+    """Whether sending again cannot succeed (5xx reply or every recipient refused)."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
         return True
-    except Exception as e:
-        print("Error sending email:", e)
-        return False
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+class SMTPConnection:
+    """
+    One SMTP session (STARTTLS and login done once) reused for every message.
+    Not thread-safe: the mail queue drives it from a single thread.
+
+    EMAIL_STARTTLS=0 and an empty EMAIL_PASSWORD allow a plain local stand-in
+    server during development and tests.
+    """
+
+    def __init__(self):
+        self._server = None
+        self._last_used = 0.0
+
+    def _open(self):
+        server = smtplib.SMTP(os.getenv("EMAIL_HOST"), int(os.getenv("EMAIL_PORT")), timeout=EMAIL_TIMEOUT_SECONDS)
+        try:
+            if os.getenv("EMAIL_STARTTLS", "1").lower() not in ("0", "false", "no"):
+                server.starttls()
+            if os.getenv("EMAIL_PASSWORD"):
+                server.login(os.getenv("EMAIL_ADDRESS"), os.getenv("EMAIL_PASSWORD"))
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+
+    def send(self, msg):
+        if self._server is not None and time.monotonic() - self._last_used > EMAIL_IDLE_SECONDS:
+            self.close()
+        if self._server is None:
+            self._open()
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Dropped by the server since the last message; one fresh session
+            self.close()
+            self._open()
+            self._server.send_message(msg)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+            # The server answered (and smtplib reset the transaction), so the session is still usable
+            self._last_used = time.monotonic()
+            raise
+        except Exception:
+            # Session state unknown; start over for the next message
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+            self._server = None
@@ -1,32 +1,91 @@
 import base64, os
+import logging
+import threading
 from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
+from Crypto.Util.Padding import unpad
 from dotenv import load_dotenv
 
 load_dotenv()
 key = base64.b64decode(os.getenv("AES_KEY"))
 
-def encrypt_field(plain_text: str) -> str:
-    iv = os.urandom(16)
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    ct = cipher.encrypt(pad(plain_text.encode(), AES.block_size))
-    return base64.b64encode(iv + ct).decode()
+logger = logging.getLogger("encryption")
 
-def decrypt_field(enc_text: str) -> str:
+BLOCK = AES.block_size
+
+# Legacy (v1) child fields: base64(iv || AES-CBC ciphertext) per field. They are
+# only read now; child records are written sealed (lib.child_records).
+
+_stats = {"decrypted": 0, "plaintext_fallbacks": 0}
+_stats_lock = threading.Lock()
+
+
+def _raw(enc_text):
+    """iv || ciphertext of one value, or None if it cannot be a v1 ciphertext."""
     try:
         missing_padding = len(enc_text) % 4
         if missing_padding:
             enc_text += '=' * (4 - missing_padding)
-
         raw = base64.b64decode(enc_text)
-        if len(raw) < 16:
-            raise ValueError("Encoded text too short to contain valid IV and ciphertext")
+    except Exception:
+        return None
+    if len(raw) < 2 * BLOCK or len(raw) % BLOCK:
+        return None
+    return raw
+
+
+def decrypt_values(values) -> list:
+    """Decrypt many legacy field values; undecryptable values are returned unchanged."""
+    results = list(values)
+    raws = [(i, raw) for i, raw in ((i, _raw(value)) for i, value in enumerate(results)) if raw is not None]
+
+    # All values laid end to end go through one CBC cipher: each value's first
+    # ciphertext block follows its own IV, so it chains exactly as it would on
+    # its own. The plaintext of the IV blocks is meaningless and skipped.
+    buffer = bytearray(sum(len(raw) for _, raw in raws))
+    offset = 0
+    for _, raw in raws:
+        buffer[offset:offset + len(raw)] = raw
+        offset += len(raw)
+    plain = bytearray(len(buffer))
+    if buffer:
+        AES.new(key, AES.MODE_CBC, bytes(BLOCK)).decrypt(buffer, output=plain)
+
+    decrypted = 0
+    offset = 0
+    for i, raw in raws:
+        try:
+            results[i] = unpad(plain[offset + BLOCK:offset + len(raw)], BLOCK).decode()
+            decrypted += 1
+        except ValueError:
+            pass
+        offset += len(raw)
+
+    fallbacks = len(results) - decrypted
+    with _stats_lock:
+        _stats["decrypted"] += decrypted
+        _stats["plaintext_fallbacks"] += fallbacks
+    if fallbacks:
+        logger.warning(f"{fallbacks} legacy value(s) could not be decrypted and were treated as plaintext")
+    return results
+
+
+def decrypt_record(record: dict, fields) -> dict:
+    return decrypt_records([record], fields)[0]
+
+
+def decrypt_records(records, fields) -> list:
+    """Decrypt the given fields of every record in one pass; missing fields are left out."""
+    records = [dict(record) for record in records]
+    slots = [(record, field) for record in records for field in fields if field in record]
+    for (record, field), value in zip(slots, decrypt_values([record[field] for record, field in slots])):
+        record[field] = value
+    return records
+
+
+def decrypt_field(enc_text: str) -> str:
+    return decrypt_values([enc_text])[0]
 
-        iv = raw[:16]
-        ct = raw[16:]
-        cipher = AES.new(key, AES.MODE_CBC, iv)
-        return unpad(cipher.decrypt(ct), AES.block_size).decode()
 
-    except Exception as e:
-        print(f"[decrypt_field] Warning: treating as plaintext. Error: {e}")
-        return enc_text  # fallback
+def decrypt_metrics() -> dict:
+    with _stats_lock:
+        return dict(_stats)
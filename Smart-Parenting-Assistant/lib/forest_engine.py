@@ -0,0 +1,136 @@
+"""
+Array-backed evaluator for a trained sklearn RandomForestClassifier.
+
+All trees are flattened into one set of contiguous node arrays so inference is
+a handful of NumPy gathers per tree level, with no pandas construction and no
+sklearn input validation on the request path. Predictions follow sklearn's
+arithmetic exactly: inputs are compared as float32 against float64 thresholds,
+per-tree leaf distributions are normalised the same way and summed tree by tree.
+
+The arrays can be saved as raw .npy files and loaded with mmap_mode="r", so
+every worker process on a host maps the same page-cache pages instead of
+holding a private copy of the forest.
+"""
+import os
+import json
+import numpy as np
+
+# sklearn marks leaves with feature == TREE_UNDEFINED (-2)
+LEAF = -2
+
+ARRAY_NAMES = ("feature", "threshold", "children", "value", "roots", "classes")
+
+
+class FlatForest:
+    def __init__(self, feature, threshold, children, value, roots, classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        # children[2 * node] is the right child, children[2 * node + 1] the left one
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = int(max_depth)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests are supported")
+
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.feature == LEAF
+            # Leaves test feature 0 against +inf and always "go left" to themselves,
+            # so every row can take exactly max_depth steps without masking
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float64))
+            own = np.arange(tree.node_count, dtype=np.int32) + offset
+            left = np.where(is_leaf, own, tree.children_left + offset)
+            right = np.where(is_leaf, own, tree.children_right + offset)
+            children.append(np.column_stack([right, left]).ravel().astype(np.int32))
+
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            children=np.concatenate(children),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            classes=np.asarray(model.classes_),
+            max_depth=max(estimator.tree_.max_depth for estimator in model.estimators_),
+        )
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            # Plain .npy (no pickle, no compression) so np.load can memory-map it
+            np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(directory, "forest.json"), "w") as f:
+            json.dump({"max_depth": self.max_depth, "n_trees": self.n_trees}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode="r"):
+        with open(os.path.join(directory, "forest.json")) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+            for name in ARRAY_NAMES
+        }
+        return cls(max_depth=meta["max_depth"], **arrays)
+
+    def apply(self, X) -> np.ndarray:
+        """Global leaf index reached by every row in every tree, shape (n_rows, n_trees)."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        n_rows, n_features = X.shape
+        flat_x = X.ravel()
+        # Pairs are laid out tree-major so each step gathers from one small tree at a time
+        nodes = np.repeat(self.roots, n_rows)
+        # Offset of each (tree, row) pair's row in flat_x
+        row_offsets = np.tile(np.arange(n_rows, dtype=np.int32) * n_features, self.n_trees)
+
+        # Unbuffered np.take into reused arrays is markedly cheaper than fancy indexing;
+        # all indices are in range by construction, so mode="clip" never clips
+        feature = np.empty_like(nodes)
+        threshold = np.empty(nodes.shape, dtype=np.float64)
+        x = np.empty(nodes.shape, dtype=np.float32)
+        go_left = np.empty(nodes.shape, dtype=bool)
+        for _ in range(self.max_depth):
+            np.take(self.feature, nodes, out=feature, mode="clip")
+            np.take(self.threshold, nodes, out=threshold, mode="clip")
+            feature += row_offsets
+            np.take(flat_x, feature, out=x, mode="clip")
+            np.less_equal(x, threshold, out=go_left)
+            nodes <<= 1
+            nodes += go_left
+            nodes = np.take(self.children, nodes, mode="clip")
+        return nodes.reshape(self.n_trees, n_rows).T
+
+    def predict_proba(self, X) -> np.ndarray:
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]), dtype=np.float64)
+        # Accumulate tree by tree, as sklearn does, so ties resolve identically
+        for t in range(self.n_trees):
+            proba += np.take(self.value, leaves[:, t], axis=0)
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def predict_one(self, row):
+        return self.predict(np.asarray(row)[np.newaxis, :])[0]
@@ -0,0 +1,229 @@
+"""
+Precomputed nutrition-status table for the growth model.
+
+The model only ever sees integer ages of 0-120 months, heights of 30-150 cm and
+two genders, so the whole input space can be evaluated once after training and
+served as an array lookup. Heights are snapped to the nearest grid point.
+
+Accuracy tradeoff: the table is exact on its grid, but a height between grid
+points is served the class of the nearest one, while the forest may switch
+class inside that half-bin. A smaller --resolution lowers that disagreement
+rate (the table grows as 1 / resolution). build and verify measure it on
+random off-grid inputs and fail above GROWTH_LOOKUP_MAX_DISAGREEMENT; a bundle
+whose manifest records a higher rate is served by the forest instead.
+
+Usage (from the project root, after training):
+    python -m lib.growth_lookup build --resolution 0.1
+    python -m lib.growth_lookup verify [--samples 20000] [--max-disagreement 0.005]
+"""
+import os
+import sys
+import json
+import pickle
+import argparse
+import logging
+import numpy as np
+
+logger = logging.getLogger("child_growth")
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LOOKUP_PATH = os.path.join(root_dir, "lib", "Model", "nutrition_lookup.npz")
+
+AGE_MIN, AGE_MAX = 0, 120
+HEIGHT_MIN, HEIGHT_MAX = 30.0, 150.0
+GENDERS = ("female", "male")
+DEFAULT_RESOLUTION = float(os.getenv("GROWTH_LOOKUP_RESOLUTION", "0.1"))
+OFF_GRID_SAMPLES = 20000
+# Share of off-grid inputs allowed to get a different class than live predict
+MAX_DISAGREEMENT = float(os.getenv("GROWTH_LOOKUP_MAX_DISAGREEMENT", "0.005"))
+
+
+def grid_heights(resolution: float) -> np.ndarray:
+    n_bins = int(round((HEIGHT_MAX - HEIGHT_MIN) / resolution)) + 1
+    return HEIGHT_MIN + np.arange(n_bins, dtype=np.float64) * resolution
+
+
+def model_features(gender_idx, ages, heights, feature_order):
+    # Offline only; keeps pandas out of the serving workers
+    import pandas as pd
+
+    columns = {
+        "Age (months)": np.asarray(ages, dtype=np.float64),
+        "Height (cm)": np.asarray(heights, dtype=np.float64),
+        "Gender_female": (gender_idx == GENDERS.index("female")).astype(np.float64),
+        "Gender_male": (gender_idx == GENDERS.index("male")).astype(np.float64),
+    }
+    return pd.DataFrame({name: columns[name] for name in feature_order})
+
+
+def grid_features(resolution: float, feature_order):
+    """Every (gender, age, height) grid point, in table order (gender, age, height bin)."""
+    heights = grid_heights(resolution)
+    ages = np.arange(AGE_MIN, AGE_MAX + 1, dtype=np.float64)
+    gender_idx, age_grid, height_grid = np.meshgrid(
+        np.arange(len(GENDERS)), ages, heights, indexing="ij"
+    )
+    return model_features(gender_idx.ravel(), age_grid.ravel(), height_grid.ravel(), feature_order)
+
+
+class NutritionLookup:
+    def __init__(self, table: np.ndarray, resolution: float, model_hash: str):
+        self.table = table
+        self.resolution = float(resolution)
+        self.model_hash = model_hash
+
+    @classmethod
+    def build(cls, model, model_hash: str, feature_order, resolution: float = DEFAULT_RESOLUTION):
+        features = grid_features(resolution, feature_order)
+        predictions = model.predict(features)
+        shape = (len(GENDERS), AGE_MAX - AGE_MIN + 1, len(grid_heights(resolution)))
+        table = np.asarray(predictions, dtype=np.uint8).reshape(shape)
+        return cls(table, resolution, model_hash)
+
+    def save(self, path: str = LOOKUP_PATH):
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                table=self.table,
+                resolution=np.float64(self.resolution),
+                model_hash=np.array(self.model_hash),
+            )
+
+    @classmethod
+    def load(cls, path: str = LOOKUP_PATH):
+        with np.load(path) as data:
+            return cls(data["table"], float(data["resolution"]), str(data["model_hash"]))
+
+    def lookup(self, gender: str, age: int, height: float):
+        """Encoded class for the nearest grid point, or None when outside the grid."""
+        if not AGE_MIN <= age <= AGE_MAX or not HEIGHT_MIN <= height <= HEIGHT_MAX:
+            return None
+        if gender not in GENDERS:
+            return None
+        height_bin = min(int(round((height - HEIGHT_MIN) / self.resolution)), self.table.shape[2] - 1)
+        return int(self.table[GENDERS.index(gender), age - AGE_MIN, height_bin])
+
+    def verify(self, model, feature_order) -> list:
+        """Grid points where the stored class disagrees with live model.predict."""
+        features = grid_features(self.resolution, feature_order)
+        live = np.asarray(model.predict(features)).reshape(self.table.shape)
+        mismatches = []
+        heights = grid_heights(self.resolution)
+        for g, a, h in zip(*np.nonzero(live != self.table)):
+            mismatches.append({
+                "gender": GENDERS[g],
+                "age": int(a) + AGE_MIN,
+                "height": float(heights[h]),
+                "table": int(self.table[g, a, h]),
+                "live": int(live[g, a, h]),
+            })
+        return mismatches
+
+    def off_grid_disagreement(self, model, feature_order, samples: int = OFF_GRID_SAMPLES, seed: int = 0) -> tuple:
+        """
+        (share of random in-range inputs whose lookup() class differs from live
+        model.predict, up to 20 of them); heights are drawn off the grid.
+        """
+        rng = np.random.default_rng(seed)
+        gender_idx = rng.integers(0, len(GENDERS), samples)
+        ages = rng.integers(AGE_MIN, AGE_MAX + 1, samples)
+        heights = rng.uniform(HEIGHT_MIN, HEIGHT_MAX, samples)
+        live = np.asarray(model.predict(model_features(gender_idx, ages, heights, feature_order)))
+        # Same snapping as lookup() (round half to even in both)
+        bins = np.minimum(np.rint((heights - HEIGHT_MIN) / self.resolution).astype(np.int64), self.table.shape[2] - 1)
+        served = self.table[gender_idx, ages - AGE_MIN, bins]
+        differ = np.nonzero(served != live)[0]
+        examples = [{
+            "gender": GENDERS[gender_idx[i]],
+            "age": int(ages[i]),
+            "height": round(float(heights[i]), 3),
+            "table": int(served[i]),
+            "live": int(live[i]),
+        } for i in differ[:20]]
+        return len(differ) / samples if samples else 0.0, examples
+
+
+def load_lookup_for(model_hash: str, path: str = LOOKUP_PATH, manifest: dict = None):
+    """
+    Load the table only when it was built from the given model version and,
+    if the bundle manifest recorded its off-grid disagreement, that is within
+    MAX_DISAGREEMENT.
+    """
+    if not os.path.exists(path):
+        return None
+    rate = (manifest or {}).get("lookup_off_grid_disagreement")
+    if rate is not None and rate > MAX_DISAGREEMENT:
+        logger.warning(
+            f"Ignoring nutrition lookup table: {rate:.2%} of off-grid inputs differ from the model "
+            f"(limit {MAX_DISAGREEMENT:.2%}); predicting with the forest"
+        )
+        return None
+    lookup = NutritionLookup.load(path)
+    if lookup.model_hash != model_hash:
+        logger.warning(
+            f"Ignoring nutrition lookup table built for model {lookup.model_hash}; loaded model is {model_hash}"
+        )
+        return None
+    return lookup
+
+
+def main(argv=None):
+    from lib.model_registry import FEATURE_COLUMNS, file_sha256, resolve_artifacts
+
+    artifacts = resolve_artifacts()
+    parser = argparse.ArgumentParser(description="Build or verify the nutrition-status lookup table")
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("--resolution", type=float, default=DEFAULT_RESOLUTION,
+                        help="Height bin size in cm. Heights between bins get the nearest bin's class, which can "
+                             "differ from the live forest; smaller bins lower that rate for a larger table")
+    parser.add_argument("--samples", type=int, default=OFF_GRID_SAMPLES, help="Random off-grid inputs checked")
+    parser.add_argument("--max-disagreement", type=float, default=MAX_DISAGREEMENT,
+                        help="Largest off-grid disagreement rate build and verify accept")
+    parser.add_argument("--model", default=artifacts.model_path)
+    parser.add_argument("--output", default=artifacts.lookup_path)
+    args = parser.parse_args(argv)
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+    model_hash = file_sha256(args.model)
+    feature_order = [str(c) for c in getattr(model, "feature_names_in_", FEATURE_COLUMNS)]
+
+    if args.command == "build":
+        lookup = NutritionLookup.build(model, model_hash, feature_order, args.resolution)
+        rate, _ = lookup.off_grid_disagreement(model, feature_order, args.samples)
+        if rate > args.max_disagreement:
+            print(f"{rate:.2%} of off-grid inputs disagree with live predict at {lookup.resolution} cm bins "
+                  f"(limit {args.max_disagreement:.2%}); table not written, use a smaller --resolution")
+            return 1
+        lookup.save(args.output)
+        if artifacts.manifest_path and os.path.abspath(args.output) == os.path.abspath(artifacts.lookup_path):
+            # Keep the active bundle's manifest consistent with the rebuilt table
+            with open(artifacts.manifest_path) as f:
+                manifest = json.load(f)
+            manifest["files"][os.path.basename(args.output)] = file_sha256(args.output)
+            manifest["lookup_resolution"] = lookup.resolution
+            manifest["lookup_off_grid_disagreement"] = rate
+            with open(artifacts.manifest_path, "w") as f:
+                json.dump(manifest, f, indent=2)
+        print(f"Lookup table {lookup.table.shape} at {lookup.resolution} cm saved to {args.output} "
+              f"({rate:.2%} off-grid disagreement)")
+        return 0
+
+    lookup = NutritionLookup.load(args.output)
+    if lookup.model_hash != model_hash:
+        print(f"Lookup table was built for model {lookup.model_hash}, current model is {model_hash}")
+        return 1
+    mismatches = lookup.verify(model, feature_order)
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"{len(mismatches)} of {lookup.table.size} grid points disagree with live predict")
+    rate, examples = lookup.off_grid_disagreement(model, feature_order, args.samples)
+    for example in examples:
+        print(example)
+    print(f"{rate:.2%} of {args.samples} off-grid inputs disagree with live predict "
+          f"(limit {args.max_disagreement:.2%} at {lookup.resolution} cm bins)")
+    return 1 if mismatches or rate > args.max_disagreement else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
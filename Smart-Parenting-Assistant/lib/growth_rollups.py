@@ -0,0 +1,174 @@
+"""
+Monthly rollups of growth_data, one document per (child_id, month).
+
+Each rollup holds the number of measurements in the month, the min/max weight
+and height, and the last measurement of the month. Writers keep it current
+with one pipeline upsert per new measurement (one bulk_write for a batch); an
+edited measurement refreshes its month with one scoped aggregation. A full rebuild recomputes everything
+server-side:
+
+    python -m lib.growth_rollups rebuild [--child-id <id>]
+"""
+import sys
+import asyncio
+import argparse
+from datetime import datetime, timezone
+from pymongo import IndexModel, UpdateOne
+from lib.database import create_client, database_name
+
+ROLLUP_COLLECTION = "growth_rollups"
+ROLLUP_FIELDS = (
+    "child_id", "month", "count", "weight_min", "weight_max", "height_min", "height_max",
+    "last_date", "last_weight", "last_height",
+)
+
+
+def month_start(date: datetime) -> datetime:
+    # MongoDB stores dates in UTC; months are bucketed the same way $year/$month do
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc)
+    return datetime(date.year, date.month, 1)
+
+
+# Unique key the upserts and $merge match on; also serves per-child month ranges
+ROLLUP_INDEXES = [IndexModel([("child_id", 1), ("month", 1)], name="child_month", unique=True)]
+
+
+async def ensure_rollup_indexes(rollups):
+    await rollups.create_indexes(ROLLUP_INDEXES)
+
+
+def measurement_update(child_id: str, date: datetime, weight, height) -> tuple:
+    """(filter, pipeline) of the upsert folding one new measurement into its month."""
+    # All expressions in one $set stage see the document as it was before the update
+    is_last = {"$gte": [date, {"$ifNull": ["$last_date", date]}]}
+    return (
+        {"child_id": child_id, "month": month_start(date)},
+        [{"$set": {
+            "count": {"$add": [{"$ifNull": ["$count", 0]}, 1]},
+            # $min/$max skip missing fields, so a new month starts from this measurement
+            "weight_min": {"$min": ["$weight_min", weight]},
+            "weight_max": {"$max": ["$weight_max", weight]},
+            "height_min": {"$min": ["$height_min", height]},
+            "height_max": {"$max": ["$height_max", height]},
+            "last_date": {"$cond": [is_last, date, "$last_date"]},
+            "last_weight": {"$cond": [is_last, weight, "$last_weight"]},
+            "last_height": {"$cond": [is_last, height, "$last_height"]},
+        }}],
+    )
+
+
+async def record_measurement(rollups, child_id: str, date: datetime, weight, height, session=None):
+    """Fold one new measurement into its month with a single pipeline upsert."""
+    await rollups.update_one(*measurement_update(child_id, date, weight, height), upsert=True, session=session)
+
+
+async def record_measurements(rollups, measurements, session=None):
+    """Fold many (child_id, date, weight, height) measurements in one round trip; order does not matter."""
+    operations = [UpdateOne(*measurement_update(*measurement), upsert=True) for measurement in measurements]
+    if operations:
+        await rollups.bulk_write(operations, ordered=False, session=session)
+
+
+def rollup_pipeline(match: dict) -> list:
+    return [
+        {"$match": match},
+        {"$sort": {"child_id": 1, "date": 1, "_id": 1}},
+        {"$group": {
+            "_id": {
+                "child_id": "$child_id",
+                "month": {"$dateFromParts": {"year": {"$year": "$date"}, "month": {"$month": "$date"}}},
+            },
+            "count": {"$sum": 1},
+            "weight_min": {"$min": "$weight"},
+            "weight_max": {"$max": "$weight"},
+            "height_min": {"$min": "$height"},
+            "height_max": {"$max": "$height"},
+            "last_date": {"$last": "$date"},
+            "last_weight": {"$last": "$weight"},
+            "last_height": {"$last": "$height"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "child_id": "$_id.child_id",
+            "month": "$_id.month",
+            **{field: 1 for field in ROLLUP_FIELDS[2:]},
+        }},
+    ]
+
+
+def merge_stage(rollups) -> dict:
+    return {"$merge": {"into": rollups.name, "on": ["child_id", "month"], "whenMatched": "replace", "whenNotMatched": "insert"}}
+
+
+def next_month(start: datetime) -> datetime:
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def measurement_rollup(child_id: str, date: datetime, weight, height) -> dict:
+    """The rollup of a month holding just this measurement, for bulk inserts of new children."""
+    return {
+        "child_id": child_id, "month": month_start(date), "count": 1,
+        "weight_min": weight, "weight_max": weight, "height_min": height, "height_max": height,
+        "last_date": date, "last_weight": weight, "last_height": height,
+    }
+
+
+async def refresh_months(growth, rollups, months):
+    """Recompute the given (child_id, month start) rollups with one scoped aggregation."""
+    months = list(months)
+    if not months:
+        return
+    match = {"$or": [
+        {"child_id": child_id, "date": {"$gte": start, "$lt": next_month(start)}}
+        for child_id, start in months
+    ]}
+    # The cursor must be consumed for the $merge to run
+    await growth.aggregate(rollup_pipeline(match) + [merge_stage(rollups)]).to_list(None)
+
+
+async def refresh_month(growth, rollups, child_id: str, date: datetime):
+    """Recompute one month after a measurement in it was edited (min/max cannot be un-folded)."""
+    await refresh_months(growth, rollups, [(child_id, month_start(date))])
+
+
+async def delete_rollups(rollups, child_id: str, session=None):
+    await rollups.delete_many({"child_id": child_id}, session=session)
+
+
+async def rebuild(growth, rollups, child_id: str = None):
+    """Recompute rollups in bulk from growth_data inside the database."""
+    await ensure_rollup_indexes(rollups)
+    if child_id is None:
+        # $out swaps the collection in atomically and keeps its indexes
+        await growth.aggregate(rollup_pipeline({}) + [{"$out": rollups.name}]).to_list(None)
+    else:
+        await delete_rollups(rollups, child_id)
+        await growth.aggregate(rollup_pipeline({"child_id": child_id}) + [merge_stage(rollups)]).to_list(None)
+    return await rollups.count_documents({"child_id": child_id} if child_id else {})
+
+
+async def run_rebuild(mongo_uri: str = None, child_id: str = None) -> int:
+    client = create_client(mongo_uri)
+    try:
+        db = client[database_name()]
+        return await rebuild(db.growth_data, db[ROLLUP_COLLECTION], child_id)
+    finally:
+        client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the monthly growth rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = sub.add_parser("rebuild", help="Recompute rollups from growth_data")
+    rebuild_parser.add_argument("--child-id", default=None, help="Only rebuild this child's months")
+    rebuild_parser.add_argument("--mongo-uri", default=None, help="Defaults to MONGO_URI")
+    args = parser.parse_args(argv)
+
+    count = asyncio.run(run_rebuild(args.mongo_uri, args.child_id))
+    print(f"Rebuilt {count} monthly rollups" + (f" for child {args.child_id}" if args.child_id else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
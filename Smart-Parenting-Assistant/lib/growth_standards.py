@@ -0,0 +1,132 @@
+"""
+WHO growth-standard z-scores, percentiles and growth velocity.
+
+The LMS parameters in lib/Model/who_growth_lms.csv (WHO Child Growth Standards
+for 0-60 months, WHO Growth Reference 2007 for 61-120 months) are loaded once
+into a (indicator, sex, month, L/M/S) array. Every function works on whole
+NumPy arrays, so a child's full history, or the concatenated histories of many
+children, is scored in a single pass with no per-measurement Python loop.
+"""
+import os
+import csv
+import numpy as np
+from lib.growth_lookup import GENDERS
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LMS_PATH = os.path.join(root_dir, "lib", "Model", "who_growth_lms.csv")
+
+INDICATORS = ("weight", "height", "bmi")
+AGE_MAX_MONTHS = 120
+DAYS_PER_MONTH = 365.25 / 12
+
+# WHO caps the tails of skewed indicators: beyond +/-3 SD the z-score is
+# measured in units of the 2-3 SD distance instead of following the LMS curve
+RESTRICTED_INDICATORS = ("weight", "bmi")
+
+
+def load_lms_table(path: str = LMS_PATH) -> np.ndarray:
+    table = np.full((len(INDICATORS), len(GENDERS), AGE_MAX_MONTHS + 1, 3), np.nan)
+    with open(path, newline="") as f:
+        rows = csv.DictReader(line for line in f if not line.startswith("#"))
+        for row in rows:
+            month = int(row["age_months"])
+            if month > AGE_MAX_MONTHS:
+                continue
+            table[INDICATORS.index(row["indicator"]), GENDERS.index(row["sex"]), month] = (
+                float(row["L"]), float(row["M"]), float(row["S"])
+            )
+    if np.isnan(table).any():
+        raise ValueError(f"Incomplete LMS table in {path}")
+    return table
+
+
+LMS_TABLE = load_lms_table()
+
+
+def lms_at(indicator: str, sex, age_months) -> tuple:
+    """L, M and S linearly interpolated between whole months; NaN outside 0-120 months."""
+    sex = np.asarray(sex, dtype=np.intp)
+    age = np.asarray(age_months, dtype=np.float64)
+    in_range = (age >= 0) & (age <= AGE_MAX_MONTHS)
+    clipped = np.where(in_range, age, 0.0)
+    lower = np.minimum(np.floor(clipped).astype(np.intp), AGE_MAX_MONTHS - 1)
+    weight = (clipped - lower)[..., np.newaxis]
+
+    table = LMS_TABLE[INDICATORS.index(indicator)]
+    lms = table[sex, lower] * (1.0 - weight) + table[sex, lower + 1] * weight
+    lms[~in_range] = np.nan
+    return lms[..., 0], lms[..., 1], lms[..., 2]
+
+
+def zscores(indicator: str, sex, age_months, values) -> np.ndarray:
+    L, M, S = lms_at(indicator, sex, age_months)
+    x = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = np.where(x > 0, x, np.nan)
+        # Every WHO table has L != 0 at every month; the log form is kept for completeness
+        z = np.where(L != 0, ((x / M) ** L - 1.0) / (L * S), np.log(x / M) / S)
+
+        if indicator in RESTRICTED_INDICATORS:
+            def sd(n):
+                return M * (1.0 + L * S * n) ** (1.0 / L)
+
+            sd3pos, sd3neg = sd(3.0), sd(-3.0)
+            z = np.where(z > 3, 3.0 + (x - sd3pos) / (sd3pos - sd(2.0)), z)
+            z = np.where(z < -3, -3.0 + (x - sd3neg) / (sd(-2.0) - sd3neg), z)
+    return z
+
+
+def percentiles(z) -> np.ndarray:
+    """Standard normal CDF in percent (Abramowitz & Stegun 7.1.26, error < 1.5e-7)."""
+    z = np.asarray(z, dtype=np.float64)
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 50.0 * (1.0 + np.sign(z) * erf)
+
+
+def velocity(groups, age_days, values) -> np.ndarray:
+    """
+    Change per month since the previous measurement of the same group.
+
+    Rows must be ordered by group, then by date. The first measurement of each
+    group, and repeated measurements taken on the same day, get NaN.
+    """
+    groups = np.asarray(groups)
+    age_days = np.asarray(age_days, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    if len(values) < 2:
+        return result
+
+    elapsed = np.diff(age_days)
+    same_group = groups[1:] == groups[:-1]
+    valid = same_group & (elapsed > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result[1:] = np.where(valid, np.diff(values) / elapsed * DAYS_PER_MONTH, np.nan)
+    return result
+
+
+def analyze(groups, sex, age_days, weight_kg, height_cm) -> dict:
+    """
+    Z-scores, percentiles and velocities for a block of measurements.
+
+    All arguments are equal-length arrays; sex holds indices into GENDERS.
+    Missing measurements are NaN and yield NaN in everything derived from them.
+    """
+    age_days = np.asarray(age_days, dtype=np.float64)
+    weight = np.asarray(weight_kg, dtype=np.float64)
+    height = np.asarray(height_cm, dtype=np.float64)
+    age_months = age_days / DAYS_PER_MONTH
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bmi = weight / (height / 100.0) ** 2
+
+    result = {"age_months": age_months, "bmi": bmi}
+    for indicator, values in (("weight", weight), ("height", height), ("bmi", bmi)):
+        z = zscores(indicator, sex, age_months, values)
+        result[f"{indicator}_for_age_z"] = z
+        result[f"{indicator}_for_age_percentile"] = percentiles(z)
+    result["weight_velocity_kg_per_month"] = velocity(groups, age_days, weight)
+    result["height_velocity_cm_per_month"] = velocity(groups, age_days, height)
+    return result
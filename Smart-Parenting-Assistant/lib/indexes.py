@@ -0,0 +1,141 @@
+"""
+Index manifest for every collection the API queries.
+
+Applied idempotently in the app lifespan: creating an index that already exists
+with the same keys and options is a no-op, so restarts cost one round trip per
+index. An index whose options conflict with an existing one (or a unique index
+over duplicate data) is logged and skipped so the others are still created.
+
+The hot queries of the routers are listed in HOT_QUERIES. The check runs
+explain() on each and fails if one is answered by a collection scan or sorted
+in memory:
+
+    python -m lib.indexes apply
+    python -m lib.indexes check
+"""
+import sys
+import asyncio
+import argparse
+import logging
+from datetime import datetime
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+from lib.database import create_client, database_name
+from lib.blind_index import BLIND_INDEXES
+from lib.growth_rollups import ROLLUP_COLLECTION, ROLLUP_INDEXES
+from lib.rate_limiter import RATE_LIMIT_COLLECTION
+from lib.auth import REVOKED_COLLECTION
+
+logger = logging.getLogger("database")
+
+INDEX_MANIFEST = {
+    # parentId listings and blind-index searches
+    "children": BLIND_INDEXES,
+    # child_id filter, date range and (date, _id) keyset sort; also the latest-measurement lookup
+    "growth_data": [IndexModel([("child_id", 1), ("date", 1), ("_id", 1)], name="child_date")],
+    ROLLUP_COLLECTION: ROLLUP_INDEXES,
+    "users": [IndexModel([("email", 1)], name="email", unique=True)],
+    # Pending codes are keyed by email (_id); verification itself checks expires_at
+    "otp_verifications": [
+        # MongoDB's TTL monitor removes codes once expires_at has passed (checked about once a minute)
+        IndexModel([("expires_at", 1)], name="otp_expiry", expireAfterSeconds=0),
+    ],
+    "reminders": [IndexModel([("title", 1)], name="title")],
+    # Per-child nutrition follow-up history, dropped after NUTRITION_HISTORY_TTL_HOURS without use
+    "nutrition_conversations": [IndexModel([("expires_at", 1)], name="conversation_expiry", expireAfterSeconds=0)],
+    # Shared rate-limit counters of idle users
+    RATE_LIMIT_COLLECTION: [IndexModel([("expires_at", 1)], name="idle_expiry", expireAfterSeconds=0)],
+    # Logged-out tokens are only remembered until they would have expired; revoked_at serves the worker sync
+    REVOKED_COLLECTION: [
+        IndexModel([("expires_at", 1)], name="token_expiry", expireAfterSeconds=0),
+        IndexModel([("revoked_at", 1)], name="revoked_at"),
+    ],
+}
+
+# (description, collection, filter, sort) for the queries the routers run on every request
+HOT_QUERIES = [
+    ("children by parent", "children", {"parentId": "p"}, None),
+    ("children search", "children", {"parentId": "p", "bidx.name": "0" * 32}, None),
+    ("growth history", "growth_data", {"child_id": "c"}, [("date", 1), ("_id", 1)]),
+    ("growth history range", "growth_data",
+     {"child_id": "c", "date": {"$gte": datetime(2020, 1, 1), "$lte": datetime(2030, 1, 1)}}, [("date", 1), ("_id", 1)]),
+    ("latest growth measurement", "growth_data", {"child_id": "c"}, [("date", -1)]),
+    ("growth analytics batch", "growth_data", {"child_id": {"$in": ["a", "b"]}},
+     [("child_id", 1), ("date", 1), ("_id", 1)]),
+    ("latest reading per child", "growth_data", {"child_id": {"$in": ["a", "b"]}},
+     [("child_id", -1), ("date", -1), ("_id", -1)]),
+    ("monthly rollups", ROLLUP_COLLECTION, {"child_id": "c"}, [("month", 1)]),
+    ("user by email", "users", {"email": "e"}, None),
+    ("otp by email", "otp_verifications", {"_id": "e", "otp": "123456", "expires_at": {"$gt": datetime(2020, 1, 1)}}, None),
+    ("reminder by title", "reminders", {"title": "t"}, None),
+]
+
+
+async def ensure_indexes(db) -> int:
+    """Create every index in the manifest; returns how many could not be created."""
+    failed = 0
+    for collection, indexes in INDEX_MANIFEST.items():
+        for index in indexes:
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                failed += 1
+                logger.error(f"Could not create index {collection}.{index.document['name']}: {e}")
+    return failed
+
+
+def plan_stages(plan) -> list:
+    """Every stage name in an explain() plan tree."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+async def check_query_plans(db) -> list:
+    """(description, stages) for each hot query whose winning plan scans the collection or sorts in memory."""
+    problems = []
+    for description, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        if "COLLSCAN" in stages or "SORT" in stages:
+            problems.append((description, stages))
+    return problems
+
+
+async def run(command: str, mongo_uri: str = None) -> int:
+    client = create_client(mongo_uri)
+    try:
+        db = client[database_name()]
+        if command == "apply":
+            failed = await ensure_indexes(db)
+            print(f"Indexes applied ({failed} failed)")
+            return 1 if failed else 0
+        problems = await check_query_plans(db)
+        for description, stages in problems:
+            print(f"FAIL {description}: {' <- '.join(stages)}")
+        print(f"{len(HOT_QUERIES) - len(problems)}/{len(HOT_QUERIES)} hot queries use an index")
+        return 1 if problems else 0
+    finally:
+        client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index provisioning and query plan checks")
+    parser.add_argument("command", choices=["apply", "check"])
+    parser.add_argument("--mongo-uri", default=None, help="Defaults to MONGO_URI")
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args.command, args.mongo_uri))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("child_growth")
+
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "64"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "2"))
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class BatcherStopped(Exception):
+    """The batcher was stopped before the item was predicted."""
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent requests and runs them through
+    predict_fn as one batch in a worker thread.
+
+    A batch is flushed as soon as it holds max_batch_size items or max_wait_ms
+    after its first item arrived, whichever comes first. predict_fn receives a
+    list of items and must return one result per item, in order.
+
+    stop() fails every item still queued or in the batch being collected or
+    predicted with BatcherStopped, so no caller is left waiting.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._worker = None
+        self._batch = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._stats = {
+            "batches": 0,
+            "items": 0,
+            "failed_batches": 0,
+            "last_batch_size": 0,
+            "max_batch_size_seen": 0,
+            "queue_wait_seconds": 0.0,
+            "predict_seconds": 0.0,
+        }
+        self._histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        pending = self._batch
+        self._batch = []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future, _ in pending:
+            if not future.done():
+                future.set_exception(BatcherStopped("Inference batcher stopped"))
+
+    async def submit(self, item):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        # Kept on self so stop() can fail the items if it cancels the worker mid-batch
+        self._batch = batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self.predict_fn, items)
+            except Exception as e:
+                logger.exception(f"Inference batch of {len(batch)} failed")
+                self._stats["failed_batches"] += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self._record(batch, started)
+
+            for (_, future, _), result in zip(batch, results):
+                # The caller may have gone away (client disconnect / timeout)
+                if not future.done():
+                    future.set_result(result)
+            self._batch = []
+
+    def _record(self, batch, started):
+        size = len(batch)
+        stats = self._stats
+        stats["batches"] += 1
+        stats["items"] += size
+        stats["last_batch_size"] = size
+        stats["max_batch_size_seen"] = max(stats["max_batch_size_seen"], size)
+        stats["queue_wait_seconds"] += sum(started - enqueued for _, _, enqueued in batch)
+        stats["predict_seconds"] += time.perf_counter() - started
+        for bucket in BATCH_SIZE_BUCKETS:
+            if size <= bucket:
+                self._histogram[bucket] += 1
+                break
+        else:
+            self._histogram[BATCH_SIZE_BUCKETS[-1]] += 1
+
+    def metrics(self) -> dict:
+        stats = self._stats
+        batches = stats["batches"] or 1
+        items = stats["items"] or 1
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": stats["batches"],
+            "items": stats["items"],
+            "failed_batches": stats["failed_batches"],
+            "last_batch_size": stats["last_batch_size"],
+            "max_batch_size_seen": stats["max_batch_size_seen"],
+            "mean_batch_size": round(stats["items"] / batches, 2),
+            "mean_queue_wait_ms": round(stats["queue_wait_seconds"] * 1000 / items, 3),
+            "mean_predict_ms": round(stats["predict_seconds"] * 1000 / batches, 3),
+            "batch_size_histogram": {f"<={bucket}": count for bucket, count in self._histogram.items()},
+        }
@@ -0,0 +1,160 @@
+"""
+Outbound mail queue so request handlers never wait on SMTP.
+
+Handlers enqueue a message and return. One worker task takes messages off the
+queue up to MAIL_BATCH_SIZE at a time and sends each batch over a single
+persistent SMTP session in a worker thread, so the connect, STARTTLS and login
+round trips are paid once rather than per message.
+
+A failed message is retried after MAIL_RETRY_BASE_SECONDS, doubling each time,
+up to MAIL_MAX_ATTEMPTS attempts; permanent failures (5xx, refused recipient)
+are not retried. Each message may carry an async on_status(status, attempts,
+error) callback, called with "sent", "retrying" or "failed".
+
+At most MAIL_QUEUE_SIZE messages wait; enqueue raises MailQueueFull beyond that.
+Retries still waiting for their backoff when the worker stops are dropped.
+"""
+import os
+import random
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from lib.email_utils import SMTPConnection, is_permanent
+
+logger = logging.getLogger("authentication")
+
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", "1000"))
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "20"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+MAIL_RETRY_BASE_SECONDS = float(os.getenv("MAIL_RETRY_BASE_SECONDS", "2"))
+
+
+class MailQueueFull(Exception):
+    """Too many messages are already waiting to be sent."""
+
+
+class MailQueue:
+    def __init__(self, connection_factory=SMTPConnection, max_size=MAIL_QUEUE_SIZE, batch_size=MAIL_BATCH_SIZE,
+                 max_attempts=MAIL_MAX_ATTEMPTS, retry_base=MAIL_RETRY_BASE_SECONDS):
+        self.connection_factory = connection_factory
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self._queue = None
+        self._worker = None
+        self._connection = None
+        self._retries = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp")
+        self._stats = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0, "rejected_full": 0, "batches": 0}
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, drain_seconds: float = 5.0):
+        """Give queued messages drain_seconds to go out, then close the session."""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(f"Mail queue stopped with {self._queue.qsize()} messages unsent")
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._connection is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._connection.close)
+            self._connection = None
+
+    def enqueue(self, message, on_status=None):
+        self.start()
+        try:
+            self._queue.put_nowait((message, on_status, 1))
+        except asyncio.QueueFull:
+            self._stats["rejected_full"] += 1
+            raise MailQueueFull()
+        self._stats["enqueued"] += 1
+
+    def _send_batch(self, messages) -> list:
+        # Runs in the smtp thread; one error (or None) per message
+        if self._connection is None:
+            self._connection = self.connection_factory()
+        errors = []
+        for message in messages:
+            try:
+                self._connection.send(message)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                errors = await loop.run_in_executor(self._executor, self._send_batch, [item[0] for item in batch])
+            except Exception as e:
+                errors = [e] * len(batch)
+            self._stats["batches"] += 1
+            for item, error in zip(batch, errors):
+                try:
+                    await self._settle(item, error)
+                except Exception as e:
+                    logger.error(f"Mail status callback failed: {e}")
+                finally:
+                    self._queue.task_done()
+
+    async def _settle(self, item, error):
+        message, on_status, attempt = item
+        if error is None:
+            self._stats["sent"] += 1
+            status = "sent"
+        elif is_permanent(error) or attempt >= self.max_attempts:
+            self._stats["failed"] += 1
+            status = "failed"
+            logger.error(f"Giving up on email to {message['To']} after {attempt} attempts: {error}")
+        else:
+            self._stats["retried"] += 1
+            status = "retrying"
+            # Jitter spreads out retries after a shared outage
+            delay = self.retry_base * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+            logger.warning(f"Email to {message['To']} failed (attempt {attempt}), retrying in {delay:.1f}s: {error}")
+            self._schedule_retry((message, on_status, attempt + 1), delay)
+        if on_status is not None:
+            await on_status(status, attempt, None if error is None else str(error))
+
+    def _schedule_retry(self, item, delay: float):
+        def requeue():
+            self._retries.discard(handle)
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                message, on_status, attempt = item
+                self._stats["failed"] += 1
+                logger.error(f"Mail queue full; dropped retry of email to {message['To']}")
+                if on_status is not None:
+                    asyncio.ensure_future(on_status("failed", attempt - 1, "Mail queue full"))
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
+
+    def metrics(self) -> dict:
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "waiting_retry": len(self._retries),
+        }
+
+
+mail_queue = MailQueue()
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import asyncio
+import pickle
+import hashlib
+import logging
+import threading
+import numpy as np
+from datetime import datetime
+from dotenv import load_dotenv, dotenv_values
+from lib.growth_lookup import load_lookup_for
+from lib.forest_engine import FlatForest
+
+load_dotenv()
+
+# Shares the growth monitor log file; handlers are attached in growthMonitor.py
+logger = logging.getLogger("child_growth")
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODEL_DIR = os.path.join(root_dir, "lib", "Model")
+
+# Versioned bundles written by growthEvaluatorModel.py; CURRENT names the active one
+BUNDLES_DIR = os.path.join(MODEL_DIR, "bundles")
+CURRENT_BUNDLE_PATH = os.path.join(MODEL_DIR, "CURRENT")
+
+# Column order used by growthEvaluatorModel.py when the model carries no feature names
+FEATURE_COLUMNS = ["Age (months)", "Height (cm)", "Gender_female", "Gender_male"]
+
+# Seconds between mtime checks of the model artifact
+RELOAD_CHECK_INTERVAL = float(os.getenv("MODEL_RELOAD_CHECK_INTERVAL", "5"))
+
+
+class ModelIntegrityError(Exception):
+    pass
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def expected_model_hashes() -> set:
+    """
+    Accepted model hashes: EXPECTED_MODEL_HASH from the process environment and
+    from a fresh read of .env, so a new bundle can be approved without a restart.
+    Either may hold a comma-separated list.
+    """
+    raw = [os.getenv("EXPECTED_MODEL_HASH") or "", dotenv_values().get("EXPECTED_MODEL_HASH") or ""]
+    return {h.strip() for value in raw for h in value.split(",") if h.strip()}
+
+
+class ModelArtifacts:
+    """File locations of one model version, either a bundle or the legacy pickles."""
+
+    def __init__(self, model_path, label_encoder_path, scaler_path, lookup_path, manifest_path=None,
+                 forest_dir=None, bundle=None):
+        self.model_path = model_path
+        self.label_encoder_path = label_encoder_path
+        self.scaler_path = scaler_path
+        self.lookup_path = lookup_path
+        self.manifest_path = manifest_path
+        self.forest_dir = forest_dir
+        self.bundle = bundle
+
+
+def resolve_artifacts(model_dir: str = MODEL_DIR) -> ModelArtifacts:
+    """The active bundle if CURRENT exists, otherwise the legacy single-file pickles."""
+    current_path = os.path.join(model_dir, "CURRENT")
+    if os.path.exists(current_path):
+        with open(current_path) as f:
+            bundle = f.read().strip()
+        bundle_dir = os.path.join(model_dir, "bundles", bundle)
+        return ModelArtifacts(
+            model_path=os.path.join(bundle_dir, "model.pkl"),
+            label_encoder_path=os.path.join(bundle_dir, "label_encoder.pkl"),
+            scaler_path=os.path.join(bundle_dir, "scaler.pkl"),
+            lookup_path=os.path.join(bundle_dir, "nutrition_lookup.npz"),
+            manifest_path=os.path.join(bundle_dir, "manifest.json"),
+            forest_dir=os.path.join(bundle_dir, "forest"),
+            bundle=bundle,
+        )
+    return ModelArtifacts(
+        model_path=os.path.join(model_dir, "random_forest_model.pkl"),
+        label_encoder_path=os.path.join(model_dir, "label_encoder.pkl"),
+        scaler_path=os.path.join(model_dir, "scaler.pkl"),
+        lookup_path=os.path.join(model_dir, "nutrition_lookup.npz"),
+    )
+
+
+def verify_manifest(artifacts: ModelArtifacts, model_hash: str) -> dict:
+    with open(artifacts.manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("model_sha256") != model_hash:
+        raise ModelIntegrityError(f"Bundle {artifacts.bundle} manifest does not match its model file")
+    bundle_dir = os.path.dirname(artifacts.manifest_path)
+    for name, expected in manifest.get("files", {}).items():
+        if name == "model.pkl":
+            continue
+        if file_sha256(os.path.join(bundle_dir, *name.split("/"))) != expected:
+            raise ModelIntegrityError(f"Bundle {artifacts.bundle} file {name} failed its integrity check")
+    return manifest
+
+
+class LoadedModel:
+    """
+    Snapshot of everything needed to serve one model version.
+
+    Serving a bundle only touches the memory-mapped engine, the class names from
+    the manifest and the lookup table; the sklearn objects are unpickled lazily
+    so workers neither import sklearn nor hold private copies of the forest.
+    """
+
+    def __init__(self, artifacts, manifest, engine, classes, lookup, version, mtime, loaded_at,
+                 load_seconds, model=None, label_encoder=None):
+        self.artifacts = artifacts
+        self.manifest = manifest
+        self.engine = engine
+        self.classes = classes
+        self.lookup = lookup
+        self.version = version
+        self.mtime = mtime
+        self.loaded_at = loaded_at
+        self.load_seconds = load_seconds
+        self._model = model
+        self._label_encoder = label_encoder
+        self._scaler = None
+        if manifest is not None:
+            self.feature_order = list(manifest["feature_order"])
+        else:
+            self.feature_order = [str(c) for c in getattr(model, "feature_names_in_", FEATURE_COLUMNS)]
+
+    def _unpickle(self, path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self._unpickle(self.artifacts.model_path)
+        return self._model
+
+    @property
+    def label_encoder(self):
+        if self._label_encoder is None:
+            self._label_encoder = self._unpickle(self.artifacts.label_encoder_path)
+        return self._label_encoder
+
+    @property
+    def scaler(self):
+        if self._scaler is None and os.path.exists(self.artifacts.scaler_path):
+            self._scaler = self._unpickle(self.artifacts.scaler_path)
+        return self._scaler
+
+    def describe(self) -> dict:
+        info = {
+            "version": self.version,
+            "bundle": self.artifacts.bundle,
+            "model_path": self.artifacts.model_path,
+            "model_mtime": datetime.utcfromtimestamp(self.mtime).isoformat(),
+            "loaded_at": self.loaded_at.isoformat(),
+            "load_seconds": round(self.load_seconds, 4),
+            "classes": [str(c) for c in self.classes],
+            "feature_order": self.feature_order,
+            "scaler_available": os.path.exists(self.artifacts.scaler_path),
+            "engine_memory_mapped": isinstance(self.engine.feature, np.memmap),
+            "lookup_resolution": self.lookup.resolution if self.lookup is not None else None,
+        }
+        if self.manifest is not None:
+            info["trained_at"] = self.manifest.get("created_at")
+            info["metrics"] = {
+                key: self.manifest["metrics"][key] for key in ("accuracy", "f1_macro") if key in self.manifest["metrics"]
+            }
+        return info
+
+
+class ModelRegistry:
+    """
+    Process-wide holder of the growth model.
+
+    The artifact is hashed and unpickled once; requests only read the current
+    version. The watch() task checks the artifact's mtime every
+    RELOAD_CHECK_INTERVAL seconds in a worker thread, so a changed artifact (or
+    a newly activated bundle) is re-verified against EXPECTED_MODEL_HASH and
+    loaded off the event loop, then swapped in as a whole; readers always see a
+    consistent model version.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, check_interval=RELOAD_CHECK_INTERVAL):
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+        self._current = None
+        self._lock = threading.Lock()
+
+    def _load(self, artifacts: ModelArtifacts) -> LoadedModel:
+        started = time.perf_counter()
+        mtime = os.stat(artifacts.model_path).st_mtime
+        version = file_sha256(artifacts.model_path)
+        expected = expected_model_hashes()
+        if version not in expected:
+            logger.error(f"Model integrity check failed. Actual: {version}, Expected: {', '.join(expected)}")
+            raise ModelIntegrityError("Model integrity check failed")
+        manifest = verify_manifest(artifacts, version) if artifacts.manifest_path else None
+
+        model = label_encoder = None
+        if artifacts.forest_dir is not None and os.path.exists(os.path.join(artifacts.forest_dir, "forest.json")):
+            # Shared read-only pages: every worker maps the same files
+            engine = FlatForest.load(artifacts.forest_dir, mmap_mode="r")
+        else:
+            with open(artifacts.model_path, "rb") as f:
+                model = pickle.load(f)
+            engine = FlatForest.from_sklearn(model)
+        if manifest is not None:
+            classes = np.asarray(manifest["classes"])
+        else:
+            with open(artifacts.label_encoder_path, "rb") as f:
+                label_encoder = pickle.load(f)
+            classes = np.asarray([str(c) for c in label_encoder.classes_])
+        lookup = load_lookup_for(version, artifacts.lookup_path, manifest)
+
+        return LoadedModel(
+            artifacts=artifacts,
+            manifest=manifest,
+            engine=engine,
+            classes=classes,
+            lookup=lookup,
+            version=version,
+            mtime=mtime,
+            loaded_at=datetime.utcnow(),
+            load_seconds=time.perf_counter() - started,
+            model=model,
+            label_encoder=label_encoder,
+        )
+
+    def load(self) -> LoadedModel:
+        """Verify and load the active artifact unconditionally, replacing the current version."""
+        with self._lock:
+            loaded = self._load(resolve_artifacts(self.model_dir))
+            self._current = loaded
+        logger.info(f"Loaded growth model version {loaded.version} in {loaded.load_seconds:.3f}s")
+        return loaded
+
+    def _maybe_reload(self):
+        # A load() is already running; the next check picks up anything it missed
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            current = self._current
+            try:
+                artifacts = resolve_artifacts(self.model_dir)
+                mtime = os.stat(artifacts.model_path).st_mtime
+            except OSError as e:
+                logger.error(f"Model artifact not readable, keeping current version: {e}")
+                return
+            same_path = current is not None and current.artifacts.model_path == artifacts.model_path
+            if same_path and mtime == current.mtime:
+                return
+            if same_path and file_sha256(artifacts.model_path) == current.version:
+                # Touched but unchanged: remember the new mtime without reloading
+                current.mtime = mtime
+                return
+            try:
+                loaded = self._load(artifacts)
+            except Exception as e:
+                logger.critical(f"Model reload failed, keeping current version: {e}")
+                return
+            self._current = loaded
+        finally:
+            self._lock.release()
+        logger.info(f"Hot-swapped growth model to version {loaded.version}")
+
+    async def watch(self):
+        """Background task: hot-reload a changed artifact without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await loop.run_in_executor(None, self._maybe_reload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Model reload check failed: {e}")
+
+    def get(self) -> LoadedModel:
+        current = self._current
+        if current is None:
+            raise ModelIntegrityError("Model not loaded")
+        return current
+
+    def describe(self) -> dict:
+        current = self._current
+        if current is None:
+            return {"loaded": False, "model_dir": self.model_dir}
+        return {"loaded": True, **current.describe()}
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,90 @@
+"""
+Password hashing off the event loop.
+
+bcrypt spends hundreds of milliseconds of CPU per call by design. Calls run in
+a dedicated thread pool (bcrypt releases the GIL while hashing, so threads run
+in parallel) of PASSWORD_HASH_WORKERS threads. At most PASSWORD_HASH_MAX_PENDING
+calls may be running or queued; beyond that HasherBusy is raised straight away
+so the caller can answer 503 instead of letting the queue grow.
+
+The cost factor is BCRYPT_ROUNDS. Hashes made with another cost still verify;
+needs_rehash() tells the login handler to store a new one. Counters are served
+at GET /auth/metrics.
+"""
+import os
+import time
+import asyncio
+import threading
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+
+class HasherBusy(Exception):
+    """Too many hashing calls are already pending."""
+
+
+def hash_rounds(hashed: str) -> int:
+    # "$2b$12$<salt and hash>"
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = HASH_WORKERS, max_pending: int = MAX_PENDING):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stats = {"hashed": 0, "verified": 0, "rejected_busy": 0, "queue_seconds": 0.0, "hash_seconds": 0.0}
+
+    async def _run(self, counter: str, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected_busy"] += 1
+                raise HasherBusy()
+            self._pending += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._stats[counter] += 1
+                    self._stats["queue_seconds"] += started - submitted
+                    self._stats["hash_seconds"] += time.perf_counter() - started
+
+        def finished(_):
+            # Counted down when the job is done, not when the caller stops waiting: a
+            # cancelled request's bcrypt call keeps its slot until it has really finished
+            with self._lock:
+                self._pending -= 1
+
+        future = self._executor.submit(timed)
+        future.add_done_callback(finished)
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run("hashed", lambda: bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.rounds)))
+        return hashed.decode()
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run("verified", bcrypt.checkpw, password.encode(), hashed.encode())
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return hash_rounds(hashed) != self.rounds
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self._stats, "pending": self._pending, "max_pending": self.max_pending, "rounds": self.rounds}
+
+
+hasher = PasswordHasher()
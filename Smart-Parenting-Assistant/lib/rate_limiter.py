@@ -1,36 +1,200 @@
-from fastapi import Request, HTTPException, Depends
-from lib.jwt_utils import verify_token
+"""
+Per-user, per-route rate limiting with a sliding-window counter.
+
+Each (route, user) key keeps just three numbers: the current fixed window, its
+request count and the previous window's count. A request is allowed while
+
+    previous * (share of the previous window still inside the sliding window) + current < limit
+
+so memory per key is constant and the limit is smoothed across window edges.
+Denied requests are not counted. Keys idle for two windows are evicted.
+
+Backends (RATE_LIMIT_BACKEND):
+    memory  per-process dict (default); limits apply per worker
+    mongo   one atomic update per request in the rate_limits collection, shared
+            by all workers; idle keys expire through a TTL index
+
+Limits default to RATE_LIMIT_MAX_REQUESTS per RATE_LIMIT_WINDOW_SECONDS and can
+be set per route, e.g. RATE_LIMITS="nutrition=5/60,growth-analytics=30/60".
+
+Backends also enforce a minimum gap between two actions on one key (claim),
+for actions such as resending an email that should not repeat within seconds.
+"""
+import os
+import math
+import time
+import threading
+from functools import lru_cache
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from fastapi import Request, HTTPException, Depends
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from lib.auth import current_user
+
+MAX_REQUESTS = int(os.getenv("RATE_LIMIT_MAX_REQUESTS", "10"))
+WINDOW_SECONDS = float(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))  # Time window
+MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # Memory backend bound
+RATE_LIMIT_COLLECTION = "rate_limits"
+
+
+def retry_after(previous: int, current: int, limit: int, window: float, now: float) -> float:
+    """Seconds until a request at this key would be allowed again (if nothing else arrives)."""
+    elapsed = (now % window) / window
+    if current >= limit or previous == 0:
+        return window * (1 - elapsed)
+    # previous * (1 - t) + current < limit once t passes this share of the window
+    return max(0.0, (1 - (limit - current) / previous - elapsed) * window)
+
+
+class MemoryBackend:
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # key -> [window index, current, previous, expires_at], least recent first
+        self._claims = OrderedDict()  # key -> time the gap ends, oldest first
+        self._lock = threading.Lock()
+
+    async def hit(self, key: str, limit: int, window: float) -> tuple:
+        """(allowed, seconds to wait if not)."""
+        now = time.time()
+        index = int(now // window)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [index, 0, 0, 0.0]
+            else:
+                self._entries.move_to_end(key)
+            last_index, current, previous, _ = entry
+            if last_index != index:
+                previous = current if last_index == index - 1 else 0
+                current = 0
+            allowed = previous * (1 - (now % window) / window) + current < limit
+            if allowed:
+                current += 1
+            entry[:] = [index, current, previous, now + 2 * window]
+            self._evict(now)
+        return allowed, 0.0 if allowed else retry_after(previous, current, limit, window, now)
+
+    async def claim(self, key: str, gap: float) -> float:
+        """0 if no claim on key was made in the last gap seconds (and records this one), else seconds to wait."""
+        now = time.time()
+        with self._lock:
+            while self._claims:
+                oldest, ends = next(iter(self._claims.items()))
+                if ends > now and len(self._claims) <= self.max_keys:
+                    break
+                del self._claims[oldest]
+            ends = self._claims.get(key)
+            if ends is not None:
+                return ends - now
+            self._claims[key] = now + gap
+            return 0.0
+
+    def _evict(self, now: float):
+        # Touched keys move to the end, so idle ones collect at the front
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[3] > now and len(self._entries) <= self.max_keys:
+                break
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MongoBackend:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def hit(self, key: str, limit: int, window: float) -> tuple:
+        now = time.time()
+        index = int(now // window)
+        weight = 1 - (now % window) / window
+        update = [
+            # Roll the counters forward to the current window (stage-local: all see the stored values)
+            {"$set": {
+                "p": {"$switch": {"branches": [
+                    {"case": {"$eq": ["$w", index]}, "then": "$p"},
+                    {"case": {"$eq": ["$w", index - 1]}, "then": "$c"},
+                ], "default": 0}},
+                "c": {"$cond": [{"$eq": ["$w", index]}, "$c", 0]},
+                "w": index,
+            }},
+            {"$set": {"ok": {"$lt": [{"$add": [{"$multiply": ["$p", weight]}, "$c"]}, limit]}}},
+            {"$set": {
+                "c": {"$cond": ["$ok", {"$add": ["$c", 1]}, "$c"]},
+                "expires_at": datetime.utcnow() + timedelta(seconds=2 * window),
+            }},
+        ]
+        for attempt in range(2):
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER,
+                )
+                break
+            except DuplicateKeyError:
+                # Two workers inserted the same new key at once; the retry updates the winner's document
+                if attempt:
+                    raise
+        allowed = doc["ok"]
+        return allowed, 0.0 if allowed else retry_after(doc["p"], doc["c"], limit, window, now)
+
+    async def claim(self, key: str, gap: float) -> float:
+        now = datetime.utcnow()
+        try:
+            # Matches only a claim whose gap is over; a live one makes the upsert collide on _id
+            await self.collection.update_one(
+                {"_id": f"claim:{key}", "expires_at": {"$lte": now}},
+                {"$set": {"expires_at": now + timedelta(seconds=gap)}},
+                upsert=True,
+            )
+            return 0.0
+        except DuplicateKeyError:
+            doc = await self.collection.find_one({"_id": f"claim:{key}"})
+            return max(0.0, (doc["expires_at"] - now).total_seconds()) if doc else 0.0
+
+
+backend = MemoryBackend()
+
 
-# In-memory store for request timestamps (replace with Redis for scale)
-rate_limit_cache = {}
+def configure_backend(db):
+    """Called from the app lifespan; switches to the shared backend if configured."""
+    global backend
+    if os.getenv("RATE_LIMIT_BACKEND", "memory").lower() == "mongo":
+        backend = MongoBackend(db[RATE_LIMIT_COLLECTION])
+    return backend
 
-MAX_REQUESTS = 10
-WINDOW_SECONDS = 60  # Time window
 
-def rate_limiter(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid token")
+@lru_cache(maxsize=None)
+def route_limit(route: str, max_requests: int, window_seconds: float) -> tuple:
+    # Resolved on first use, after .env has been loaded
+    for item in os.getenv("RATE_LIMITS", "").split(","):
+        name, _, spec = item.strip().partition("=")
+        if name == route and spec:
+            count, _, seconds = spec.partition("/")
+            return int(count), float(seconds or window_seconds)
+    return max_requests, window_seconds
 
-    token = auth_header.split(" ")[1]
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid token")
 
-    user_email = payload["email"]
-    now = datetime.utcnow()
+def rate_limit(route: str, max_requests: int = None, window_seconds: float = None):
+    """Dependency limiting each user's requests to one route (or group of routes sharing the name)."""
+    async def dependency(request: Request, claims: dict = Depends(current_user)):
+        user_email = claims["email"]
+        limit, window = route_limit(route, max_requests or MAX_REQUESTS, window_seconds or WINDOW_SECONDS)
+        allowed, wait = await backend.hit(f"{route}:{user_email}", limit, window)
+        if not allowed:
+            raise HTTPException(status_code=429, detail="Too many requests. Try again later.",
+                                headers={"Retry-After": str(max(1, math.ceil(wait)))})
+    return dependency
 
-    if user_email not in rate_limit_cache:
-        rate_limit_cache[user_email] = []
 
-    # Remove expired timestamps
-    rate_limit_cache[user_email] = [
-        ts for ts in rate_limit_cache[user_email] if now - ts < timedelta(seconds=WINDOW_SECONDS)
-    ]
+async def enforce_gap(route: str, key: str, gap_seconds: float):
+    """429 unless gap_seconds have passed since the last accepted call for key on route."""
+    wait = await backend.claim(f"{route}:{key}", gap_seconds)
+    if wait > 0:
+        raise HTTPException(status_code=429, detail="Too many requests. Try again later.",
+                            headers={"Retry-After": str(max(1, math.ceil(wait)))})
 
-    if len(rate_limit_cache[user_email]) >= MAX_REQUESTS:
-        raise HTTPException(status_code=429, detail="Too many requests. Try again later.")
 
-    # Log this request
-    rate_limit_cache[user_email].append(now)
+# Routes without their own limit share this one
+rate_limiter = rate_limit("default")
@@ -0,0 +1,207 @@
+"""
+Mail queue against a local stand-in SMTP server (no TLS, no authentication).
+
+Run from the project root:
+    python -m unittest tests.test_mail_queue
+"""
+import os
+import time
+import asyncio
+import unittest
+from unittest import mock
+from lib.email_utils import otp_message
+from lib.mail_queue import MailQueue
+import lib.DL.registration as registration
+
+
+class LocalSMTPServer:
+    """
+    Minimal SMTP server on 127.0.0.1. Answers the first fail_first messages
+    with 451 (temporary) and refuses recipients containing a reject string with
+    550 (permanent).
+    """
+
+    def __init__(self, fail_first=0, reject=()):
+        self.fail_first = fail_first
+        self.reject = tuple(r.lower() for r in reject)
+        self.sessions = 0
+        self.messages = []
+        self.replies = []  # (time, code) per DATA reply
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._session, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _session(self, reader, writer):
+        self.sessions += 1
+        writer.write(b"220 localhost ESMTP stand-in\r\n")
+        in_data, lines = False, []
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if in_data:
+                if line != b".\r\n":
+                    lines.append(line)
+                    continue
+                in_data = False
+                if self.fail_first:
+                    self.fail_first -= 1
+                    self.replies.append((time.monotonic(), 451))
+                    writer.write(b"451 Try again later\r\n")
+                else:
+                    self.messages.append(b"".join(lines))
+                    self.replies.append((time.monotonic(), 250))
+                    writer.write(b"250 Queued\r\n")
+                lines = []
+            else:
+                command = line.decode().strip().lower()
+                if command.startswith(("ehlo", "helo")):
+                    writer.write(b"250 localhost\r\n")
+                elif command.startswith("rcpt") and any(r in command for r in self.reject):
+                    writer.write(b"550 No such user\r\n")
+                elif command == "data":
+                    in_data = True
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                elif command == "quit":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+
+async def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the mail queue")
+        await asyncio.sleep(0.01)
+
+
+class FakeOTPCollection:
+    """Applies registration's $set updates to one in-memory OTP record."""
+
+    def __init__(self, record):
+        self.record = record
+        self.statuses = [record["delivery"]["status"]]
+
+    async def update_one(self, query, update):
+        if all(self.record.get(k) == v for k, v in query.items()):
+            self.record.update(update["$set"])
+            self.statuses.append(self.record["delivery"]["status"])
+
+    async def delete_one(self, query):
+        pass
+
+
+class MailQueueTest(unittest.IsolatedAsyncioTestCase):
+    server_options = {}
+
+    async def asyncSetUp(self):
+        self.server = LocalSMTPServer(**self.server_options)
+        port = await self.server.start()
+        env = {"EMAIL_HOST": "127.0.0.1", "EMAIL_PORT": str(port), "EMAIL_STARTTLS": "0",
+               "EMAIL_PASSWORD": "", "EMAIL_ADDRESS": "noreply@example.com"}
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = MailQueue(retry_base=0.05, max_attempts=3)
+        self.statuses = {}
+
+    async def asyncTearDown(self):
+        await self.queue.stop()
+        await self.server.stop()
+
+    def enqueue(self, to):
+        self.statuses[to] = []
+
+        async def on_status(status, attempts, error):
+            self.statuses[to].append((status, attempts))
+
+        self.queue.enqueue(otp_message(to, "123456"), on_status=on_status)
+
+    def settled(self, *recipients):
+        return lambda: all(s and s[-1][0] in ("sent", "failed") for s in (self.statuses[r] for r in recipients))
+
+
+class SessionReuseTest(MailQueueTest):
+    async def test_one_session_for_several_messages(self):
+        recipients = [f"parent{i}@example.com" for i in range(5)]
+        for to in recipients:
+            self.enqueue(to)
+        await wait_until(self.settled(*recipients))
+
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.sessions, 1)
+        self.assertEqual({tuple(s) for s in self.statuses.values()}, {(("sent", 1),)})
+
+    async def test_session_kept_across_batches(self):
+        self.enqueue("first@example.com")
+        await wait_until(self.settled("first@example.com"))
+        self.enqueue("second@example.com")
+        await wait_until(self.settled("second@example.com"))
+
+        self.assertEqual(self.server.sessions, 1)
+
+
+class TemporaryFailureTest(MailQueueTest):
+    server_options = {"fail_first": 2}
+
+    async def test_retried_with_backoff_until_sent(self):
+        self.enqueue("parent@example.com")
+        await wait_until(self.settled("parent@example.com"))
+
+        self.assertEqual(self.statuses["parent@example.com"], [("retrying", 1), ("retrying", 2), ("sent", 3)])
+        self.assertEqual([code for _, code in self.server.replies], [451, 451, 250])
+        # Delays double from retry_base (with up to 20% jitter)
+        (t1, _), (t2, _), (t3, _) = self.server.replies
+        self.assertGreaterEqual(t2 - t1, 0.05 * 0.8)
+        self.assertGreaterEqual(t3 - t2, 0.1 * 0.8)
+        self.assertEqual(self.queue.metrics()["retried"], 2)
+
+    async def test_otp_record_goes_from_queued_to_sent(self):
+        record = {"_id": "parent@example.com", "otp": "123456", **registration.otp_fields("123456")}
+        db = mock.Mock(otp_verifications=FakeOTPCollection(record))
+        with mock.patch.object(registration, "mail_queue", self.queue):
+            await registration.send_otp(db, "parent@example.com", "123456")
+        await wait_until(lambda: record["delivery"]["status"] == "sent")
+
+        self.assertEqual(db.otp_verifications.statuses, ["queued", "retrying", "retrying", "sent"])
+        self.assertEqual(record["delivery"]["attempts"], 3)
+
+
+class ExhaustedRetriesTest(MailQueueTest):
+    server_options = {"fail_first": 10}
+
+    async def test_failed_after_max_attempts(self):
+        self.enqueue("parent@example.com")
+        await wait_until(self.settled("parent@example.com"))
+
+        self.assertEqual(self.statuses["parent@example.com"], [("retrying", 1), ("retrying", 2), ("failed", 3)])
+        self.assertEqual(self.server.messages, [])
+
+
+class PermanentFailureTest(MailQueueTest):
+    server_options = {"reject": ("unknown@",)}
+
+    async def test_refused_recipient_not_retried(self):
+        self.enqueue("unknown@example.com")
+        self.enqueue("parent@example.com")
+        await wait_until(self.settled("unknown@example.com", "parent@example.com"))
+
+        self.assertEqual(self.statuses["unknown@example.com"], [("failed", 1)])
+        self.assertEqual(self.statuses["parent@example.com"], [("sent", 1)])
+        # The refusal does not cost the session
+        self.assertEqual(self.server.sessions, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()